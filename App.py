@@ -1,38 +1,72 @@
+import time
+rerun_start = time.perf_counter()
+
 import streamlit as st
 from streamlit_option_menu import option_menu
-from models import GroqChat, ImageChat, PdfChat, Text2Image, Text2Audio, AudioSpectrogram, qr_generator, res
+from models.res.page_registry import ADMIN_PAGES, PAGES, load_page
+from models.res.instrumentation import profile, report_rerun, set_current_page, span
+from models.res.storage import start_maintenance
+from models.res.chat_search import search_sidebar
 from PIL import Image
+from io import BytesIO
 import os
 import auth  # Import the auth.py module for handling login/logout
 
+
+# Static assets are read and encoded once per process instead of on every rerun
+@st.cache_resource(show_spinner=False)
+def load_static_assets():
+    # Favicon: downscale the logo once and keep it as PNG bytes
+    logo = Image.open(os.path.join("models/res", "logo.png"))
+    logo.thumbnail((64, 64))
+    icon = BytesIO()
+    logo.save(icon, format="PNG")
+
+    with open("style.css") as css:
+        style = f'<style>{css.read()}</style>'
+    with open(os.path.join("models/res", "yom.png"), "rb") as banner:
+        sidebar_image = banner.read()
+
+    return {"page_icon": icon.getvalue(), "style": style, "sidebar_image": sidebar_image}
+
+
 # Initialize session state if not already set
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
 if "username" not in st.session_state:
     st.session_state.username = None
 
+# Returning users with a valid session cookie skip the login page
+auth.restore_session()
+
 # App Header
-path = os.path.join("models/res", "logo.png")
-logo = Image.open(path)
+assets = load_static_assets()
+
+# Storage retention and quotas are enforced by a background thread, started once per process
+start_maintenance(auth.storage_settings)
 
 # Sidebar Menu Example
 EXAMPLE_NO = 1
-st.set_page_config(page_title="VyomAI", page_icon=logo, layout="wide")
-with open("style.css") as css:
-    st.markdown(f'<style>{css.read()}</style>', unsafe_allow_html=True)
+st.set_page_config(page_title="VyomAI", page_icon=assets["page_icon"], layout="wide")
+st.markdown(assets["style"], unsafe_allow_html=True)
 with st.sidebar:
-    st.image("models/res/yom.png")
+    st.image(assets["sidebar_image"])
 
 # Menu function for navigation
-def streamlit_menu(example=1):
+def streamlit_menu(example=1, admin=False):
     if example == 1:
+        options = list(PAGES.keys()) + (list(ADMIN_PAGES.keys()) if admin else [])
+        # Opening a chat search result switches pages
+        jump_to = st.session_state.pop("menu_jump", None)
         with st.sidebar:
             selected = option_menu(
                 menu_title="Chat Menu",  # required
-                options=["Home", "Image", "Pdf", "Text 👉 Image", "Text 👉 Audio", "Audio Spectrogram", "QR Generator"],  # required
-                icons=["house", "camera", "envelope", "sunset", "play", "graph-up", "box"],  # optional
+                options=options,  # required
+                icons=["house", "camera", "envelope", "sunset", "play", "graph-up", "box"] + (["speedometer2"] if admin else []),  # optional
                 menu_icon="cast",  # optional
                 default_index=0,  # optional
+                manual_select=options.index(jump_to) if jump_to in options else None,
+                key="main_menu",  # lets headless sessions (benchmarks/load_test.py) pick a page
             )
         return selected
 
@@ -74,24 +108,25 @@ def streamlit_menu(example=1):
     return None
 
 # If user is logged in, show models, else show login or sign-up options
+auth.sync_session_cookie()
 if st.session_state.logged_in:
     # User is logged in, show models and options
-    selected = streamlit_menu(example=EXAMPLE_NO)
+    admin = auth.is_admin(st.session_state.username)
+    selected = streamlit_menu(example=EXAMPLE_NO, admin=admin)
+    search_sidebar(st.session_state.username)
     st.markdown(f"## Welcome, {st.session_state['full_name']}!\n <h5>What can I help with?", unsafe_allow_html=True)
-    if selected == "Home":
-        GroqChat.chat_groq()
-    if selected == "Image":
-        ImageChat.gemini_image_chat()
-    if selected == "Pdf":
-        PdfChat.gemini_pdf_chat()
-    if selected == "Text 👉 Image":
-        Text2Image.gemini_text2image()
-    if selected == "Text 👉 Audio":
-        Text2Audio.text2audio()
-    if selected == "Audio Spectrogram":
-        AudioSpectrogram.audio_spectrogram()
-    if selected == "QR Generator":
-        qr_generator.QR()
+
+    # Time the selected page separately from the shell around it; admins can ask for a cProfile of one rerun
+    set_current_page(selected)
+    page_start = time.perf_counter()
+    if selected in PAGES or (admin and selected in ADMIN_PAGES):
+        with profile(st.session_state.pop("profile_next_rerun", False)) as report:
+            with span("import"):
+                page = load_page(selected)
+            page()
+        if report:
+            st.session_state.last_profile = {"page": selected, "report": report[0]}
+    page_time = time.perf_counter() - page_start
 
     if st.sidebar.button("Refresh 🔃"):
         st.rerun()
@@ -99,8 +134,11 @@ if st.session_state.logged_in:
     if st.sidebar.button("Logout"):
         auth.logout()
 
+    report_rerun({"page": selected, "shell": time.perf_counter() - rerun_start - page_time, "page_time": page_time})
+
 else:
     # User is not logged in, show login or sign-up options
+    set_current_page(None)
     auth_choice = option_menu(
         menu_title="Choose Action",
         options=["Login", "Sign Up"],
@@ -108,6 +146,7 @@ else:
         menu_icon="cast",
         default_index=0,
         orientation="horizontal",
+        key="auth_menu",
     )
 
     if auth_choice == "Login":
@@ -115,3 +154,5 @@ else:
 
     elif auth_choice == "Sign Up":
         auth.signup()
+
+    report_rerun({"page": None, "shell": time.perf_counter() - rerun_start})
@@ -0,0 +1,471 @@
+"""Headless HTTP API for VyomAI, for batch jobs that shouldn't drive the Streamlit UI.
+
+It calls the same provider code as the pages (models/res/services.py), reads API keys the same way
+(environment/.env, then .streamlit/secrets.toml) and authenticates the users in config.yaml. Tokens are
+signed with SESSION_SECRET_KEY from the same places, at least 32 random bytes, e.g.
+    python -c 'import secrets; print(secrets.token_urlsafe(32))'
+
+Run from the repository root:
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+Get a token, then send it as a bearer token:
+    curl -X POST localhost:8000/v1/token -H 'Content-Type: application/json' -d '{"username": "...", "password": "..."}'
+    curl -N localhost:8000/v1/chat -H 'Authorization: Bearer <token>' -H 'Content-Type: application/json' \\
+         -d '{"messages": [{"role": "user", "content": "Hello"}]}'
+API tokens expire after security.api_token_hours (24 by default); POST /v1/token/revoke invalidates all of the
+user's tokens at once. The web app's session cookie is not accepted as one.
+
+Streaming endpoints answer with server-sent events: one `data: {"text": ...}` event per chunk, then
+`event: done` carrying the full text, or `event: error` if the provider fails mid-stream. PDF questions
+send an `event: sources` with the retrieved chunks before the text.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, Field
+
+import auth
+from models.res import pdf_index, services
+from models.res.audio_utils import (
+    MODEL_SAMPLE_RATE, MODEL_WINDOW_SECONDS, audio_metadata, content_hash, encode_wav, load_samples, split_windows,
+)
+from models.res.config import mods_dict
+from models.res.groq_router import hedged_stream
+from models.res.instrumentation import flush, set_default_page, span, timed_stream
+from models.res.providers import MissingSecret, configure_gemini
+from models.res.qr_batch import render_job
+
+logger = logging.getLogger(__name__)
+
+# Spans recorded by the API show up under this page on the Metrics page
+set_default_page("API")
+SPAN_FLUSH_SECONDS = 5
+
+
+async def _flush_spans():
+    while True:
+        await asyncio.sleep(SPAN_FLUSH_SECONDS)
+        await asyncio.to_thread(flush)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    load_dotenv()
+    flusher = asyncio.create_task(_flush_spans())
+    yield
+    flusher.cancel()
+    flush()
+
+
+app = FastAPI(title="VyomAI API", lifespan=lifespan)
+bearer = HTTPBearer(auto_error=False)
+
+
+# Authentication
+
+class Credentials(BaseModel):
+    username: str
+    password: str
+
+
+@app.post("/v1/token")
+def issue_token(credentials: Credentials, request: Request):
+    # Same checks as the login page: rate limit first, then bcrypt in its pool
+    keys = [f"user:{credentials.username}"]
+    ip = auth.resolve_client_ip(request.client.host if request.client else None,
+                                request.headers.get("X-Forwarded-For"))
+    if ip:
+        keys.append(f"ip:{ip}")
+    locked_for = auth.take_login_token(keys)
+    if locked_for:
+        raise HTTPException(429, "Too many login attempts.", headers={"Retry-After": str(int(locked_for) + 1)})
+
+    user = auth.get_user(credentials.username)
+    try:
+        verified = user is not None and auth.verify_password(user["password"], credentials.password)
+    except FutureTimeoutError:
+        raise HTTPException(503, "The server is busy, please try again in a moment.")
+    if not verified:
+        raise HTTPException(401, "Invalid username or password.")
+
+    auth.reset_login_tokens(credentials.username, ip)
+    auth.rehash_if_needed(credentials.username, user["password"], credentials.password)
+    lifetime = int(auth.security_settings()["api_token_hours"] * 3600)
+    token = auth.issue_session_token(credentials.username, auth.API_AUDIENCE, lifetime)
+    if token is None:
+        raise HTTPException(503, f"{auth.SESSION_KEY_NAME} is not configured.")
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "expires_in": lifetime,
+    }
+
+
+def current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)):
+    # Only tokens issued for the API: a session cookie from the web app is refused. Changing the password or
+    # /v1/token/revoke invalidates them.
+    username = auth.verify_session_token(credentials.credentials, auth.API_AUDIENCE) if credentials else None
+    if not username:
+        raise HTTPException(401, "Invalid or expired token.", headers={"WWW-Authenticate": "Bearer"})
+    return username
+
+
+@app.post("/v1/token/revoke", status_code=204)
+def revoke_token(username: str = Depends(current_user)):
+    # Every token issued to the user so far stops working, including web app sessions
+    auth.revoke_tokens(username)
+
+
+# Helpers
+
+def provider_call(fn, *args, **kwargs):
+    # Missing API keys are the server's configuration problem, anything else is the provider failing
+    try:
+        return fn(*args, **kwargs)
+    except MissingSecret as e:
+        raise HTTPException(503, e.args[0])
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Provider call %s failed", getattr(fn, "__name__", fn))
+        raise HTTPException(502, f"{type(e).__name__}: {e}")
+
+
+def _event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _sse(first, chunks, done, before):
+    for event, data in before:
+        yield _event(data, event)
+    text = [first] if first else []
+    if first:
+        yield _event({"text": first})
+    try:
+        for chunk in chunks:
+            text.append(chunk)
+            yield _event({"text": chunk})
+    except Exception as e:
+        logger.exception("Stream failed")
+        yield _event({"detail": f"{type(e).__name__}: {e}"}, "error")
+        return
+    yield _event({"text": "".join(text), **done}, "done")
+
+
+def stream_response(chunks, done=None, before=()):
+    # The first chunk is awaited here, so failing to start (bad key, unknown model) is a plain HTTP error.
+    # `done` holds extra fields for the final event; it may still be filled in while streaming.
+    # `before` are (event, data) pairs sent ahead of the text.
+    chunks = iter(chunks)
+    first = provider_call(next, chunks, "")
+    return StreamingResponse(
+        _sse(first, chunks, done if done is not None else {}, before), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def read_upload(upload):
+    data = upload.file.read()
+    if not data:
+        raise HTTPException(422, f"{upload.filename or 'The upload'} is empty.")
+    return data
+
+
+def resolve_language(language):
+    # A language name from languages.json or its ISO code
+    languages = services.speech_languages()
+    if language in languages:
+        return languages[language]
+    if language in languages.values():
+        return language
+    raise HTTPException(422, f"Unknown language {language!r}.")
+
+
+# Groq chat
+
+class Message(BaseModel):
+    role: Literal["system", "user", "assistant"]
+    content: str
+
+
+class ChatRequest(BaseModel):
+    messages: List[Message] = Field(min_length=1)
+    model: str = services.DEFAULT_GROQ_MODEL
+    max_tokens: Optional[int] = Field(None, ge=1)
+    stream: bool = True
+    fallback: bool = True  # Hedge with a faster model when this one is slow or failing
+
+
+@app.get("/v1/models")
+def list_models(username: str = Depends(current_user)):
+    return services.GROQ_MODELS
+
+
+@app.post("/v1/chat")
+def chat(body: ChatRequest, username: str = Depends(current_user)):
+    if body.model not in services.GROQ_MODELS:
+        raise HTTPException(422, f"Unknown model {body.model!r}.")
+    max_tokens = min(body.max_tokens or services.GROQ_MODELS[body.model]["tokens"], services.GROQ_MODELS[body.model]["tokens"])
+    client = provider_call(services.groq_client)
+    route = {}
+    messages = [m.model_dump() for m in body.messages]
+    chunks = timed_stream(
+        hedged_stream(client, body.model, messages, max_tokens, services.GROQ_MODELS, route, body.fallback), "groq.stream"
+    )
+    # The answering model and the path that won ("primary", "hedge" or "fallback") come with the text
+    if body.stream:
+        return stream_response(chunks, route)
+    return {"text": provider_call(lambda: "".join(chunks)), **route}
+
+
+# PDF chat: documents are stored like the page stores them, with their own index
+
+def document_index_dir(username, document_name):
+    if not document_name or document_name != os.path.basename(document_name) or document_name.startswith("."):
+        raise HTTPException(422, f"Invalid document name {document_name!r}.")
+    return services.pdf_index_dir(username, document_name)
+
+
+class Question(BaseModel):
+    question: str = Field(min_length=1)
+    stream: bool = False  # Server-sent events: the retrieved sources first, then the answer as it is generated
+
+
+@app.get("/v1/pdf/documents")
+def pdf_documents(username: str = Depends(current_user)):
+    # Processed documents, whether through the API or the PDF page
+    return {"documents": list(services.pdf_document_indices(username))}
+
+
+@app.post("/v1/pdf/documents")
+def ingest_pdfs(files: List[UploadFile] = File(...),
+                embedding: Literal[tuple(services.PDF_EMBEDDING_BACKENDS)] = Form(services.DEFAULT_PDF_EMBEDDING),
+                username: str = Depends(current_user)):
+    # Named after the first file, as on the PDF page; re-uploading a document replaces its index
+    document_name = os.path.basename(files[0].filename or "").split('.')[0]
+    index_dir = document_index_dir(username, document_name)
+    uploads = [(os.path.basename(f.filename), read_upload(f)) for f in files]
+
+    try:
+        chunks, metadatas = services.pdf_chunks([(name, io.BytesIO(data)) for name, data in uploads], embedding)
+    except Exception as e:
+        raise HTTPException(422, f"Could not read the PDF files: {e}")
+    if not chunks:
+        raise HTTPException(422, "No text found in the PDF files.")
+
+    services.save_pdf_uploads(username, document_name, uploads)
+    provider_call(services.build_pdf_index, chunks, index_dir, metadatas, embedding,
+                  auth.pdf_settings()["local_embedding_processes"])
+    return {"document": document_name, "files": [name for name, _ in uploads], "chunks": len(chunks),
+            "embedding": embedding}
+
+
+@app.get("/v1/pdf/documents/{document_name}/history")
+def pdf_history(document_name: str, username: str = Depends(current_user)):
+    document_index_dir(username, document_name)
+    return services.load_pdf_history(username, document_name)
+
+
+def answer_pdf(username, chat_name, shards, body, fields):
+    provider_call(configure_gemini)
+    docs = provider_call(services.search_pdf_index, body.question, shards)
+    sources = services.pdf_sources(docs)
+
+    # Kept in the chat's history once the answer is complete, so the conversation also shows on the PDF page
+    # and in search
+    def answer_and_save():
+        answer = []
+        for chunk in services.stream_pdf_answer(body.question, docs):
+            answer.append(chunk)
+            yield chunk
+        chat_history = services.load_pdf_history(username, chat_name)
+        chat_history += [
+            {"sender": "user", "content": body.question},
+            {"sender": "assistant", "content": "".join(answer), "sources": sources},
+        ]
+        services.save_pdf_history(username, chat_name, chat_history)
+
+    if body.stream:
+        return stream_response(answer_and_save(), fields, [("sources", sources)])
+    answer = provider_call(lambda: "".join(answer_and_save()))
+    return {**fields, "answer": answer, "sources": sources}
+
+
+@app.post("/v1/pdf/documents/{document_name}/questions")
+def ask_pdf(document_name: str, body: Question, username: str = Depends(current_user)):
+    index_dir = document_index_dir(username, document_name)
+    if not pdf_index.exists(index_dir):
+        raise HTTPException(404, f"Document {document_name!r} has not been processed.")
+    return answer_pdf(username, document_name, {document_name: index_dir}, body, {"document": document_name})
+
+
+@app.post("/v1/pdf/questions")
+def ask_all_pdfs(body: Question, username: str = Depends(current_user)):
+    # Searches every processed document; sources name the document each chunk came from
+    shards = services.pdf_document_indices(username)
+    if not shards:
+        raise HTTPException(404, "No documents have been processed yet.")
+    return answer_pdf(username, services.PDF_ALL_DOCUMENTS, shards, body, {"documents": len(shards)})
+
+
+# Image chat
+
+@app.post("/v1/image/questions")
+def ask_image(image: UploadFile = File(...), prompt: str = Form(""), stream: bool = Form(False),
+              username: str = Depends(current_user)):
+    from PIL import Image, UnidentifiedImageError
+    try:
+        picture = Image.open(io.BytesIO(read_upload(image)))
+        if picture.format == 'WEBP':
+            picture = picture.convert("RGB")
+    except UnidentifiedImageError:
+        raise HTTPException(422, "Unsupported image file.")
+
+    provider_call(configure_gemini)
+    if stream:
+        return stream_response(services.describe_image_stream(prompt, picture))
+    return {"text": provider_call(services.describe_image, prompt, picture)}
+
+
+# Text to image
+
+class ImageRequest(BaseModel):
+    prompt: str = Field(min_length=1)
+    variant: Optional[Literal[services.IMAGE_VARIANTS]] = None  # Let Gemini write a descriptive prompt in this style
+
+
+@app.post("/v1/text2image")
+def text2image(body: ImageRequest, username: str = Depends(current_user)):
+    from PIL import Image, UnidentifiedImageError
+    prompt = body.prompt
+    if body.variant:
+        provider_call(configure_gemini)
+        prompt = provider_call(services.generate_image_prompt, body.prompt, body.variant)
+
+    image_bytes, status_code = provider_call(services.generate_image, prompt)
+    try:
+        image_format = Image.open(io.BytesIO(image_bytes)).format
+    except (UnidentifiedImageError, IOError):
+        raise HTTPException(502, f"Image generation failed with status {status_code}.")
+    return Response(image_bytes, media_type=Image.MIME.get(image_format, "application/octet-stream"),
+                    headers={"X-Image-Prompt": quote(prompt)})
+
+
+# Text to audio, translation and speech
+
+class AudioRequest(BaseModel):
+    prompt: str = Field(min_length=1)
+
+
+class TranslationRequest(BaseModel):
+    text: str = Field(min_length=1)
+    language: str  # Name from languages.json or ISO code
+
+
+class SpeechRequest(TranslationRequest):
+    translate: bool = False
+
+
+@app.post("/v1/text2audio/prompts")
+def audio_prompt(body: AudioRequest, stream: bool = False, username: str = Depends(current_user)):
+    # Descriptive audio prompt for keywords, as on the Text to audio page
+    client = provider_call(services.groq_client)
+    messages = [{"role": "user", "content": services.audio_prompt_request(body.prompt)}]
+    chunks = timed_stream(services.groq_stream(client, services.AUDIO_PROMPT_MODEL, messages, 100), "groq.stream")
+    if stream:
+        return stream_response(chunks)
+    return {"text": provider_call(lambda: "".join(chunks))}
+
+
+@app.post("/v1/text2audio")
+def text2audio(body: AudioRequest, username: str = Depends(current_user)):
+    audio_bytes, status_code, error_text = provider_call(services.generate_audio, body.prompt)
+    if audio_bytes is None:
+        raise HTTPException(502, f"Audio generation failed with status {status_code}: {error_text[:200]}")
+    return Response(audio_bytes, media_type=audio_metadata(audio_bytes)["mime"])
+
+
+@app.post("/v1/translate")
+def translate(body: TranslationRequest, username: str = Depends(current_user)):
+    iso = resolve_language(body.language)
+    return {"language": iso, "translation": provider_call(services.translate_text, body.text, iso)}
+
+
+@app.post("/v1/speech")
+def speech(body: SpeechRequest, username: str = Depends(current_user)):
+    iso = resolve_language(body.language)
+    text = provider_call(services.translate_text, body.text, iso) if body.translate else body.text
+    audio = provider_call(services.synthesize_speech, text, iso)
+    if audio is None:
+        raise HTTPException(422, f"Text-to-Speech is not supported for {body.language!r}.")
+    return Response(audio, media_type="audio/mpeg")
+
+
+# Audio classification
+
+@app.post("/v1/audio/classify")
+def classify_audio(audio: UploadFile = File(...), preprocess: bool = Form(True), trim: bool = Form(True),
+                   segmented: bool = Form(False), overlap: float = Form(0.5, ge=0.0, le=0.75),
+                   username: str = Depends(current_user)):
+    # Same choices as the Audio Spectrogram page: raw upload, one 16 kHz window, or a timeline of windows
+    audio_bytes = read_upload(audio)
+    samples = None
+    if preprocess:
+        with span("preprocess"):
+            samples = load_samples(audio_bytes, trim=trim)
+
+    window = int(MODEL_SAMPLE_RATE * MODEL_WINDOW_SECONDS)
+    if samples is not None and segmented and len(samples) > window:
+        windows = []
+        for start, chunk in split_windows(samples, overlap=overlap):
+            payload = encode_wav(chunk)
+            windows.append((start, len(chunk) / MODEL_SAMPLE_RATE, content_hash(payload), payload))
+        with span("ast.classify_segments", "external"):
+            results, errors = provider_call(services.classify_windows,
+                                            {key: payload for _, _, key, payload in windows})
+        timeline, predictions = services.label_timeline([window[:3] for window in windows], results)
+        if timeline is None:
+            raise HTTPException(502, f"Audio classification failed: {errors[0] if errors else 'no results'}")
+        return {
+            "predictions": predictions,
+            "windows": len(windows),
+            "failed_windows": len(errors),
+            "timeline": json.loads(timeline.reset_index().to_json(orient="records")),
+        }
+
+    payload = encode_wav(samples[:window]) if samples is not None else audio_bytes
+    with span("ast.classify", "external"):
+        result = provider_call(services.post_audio, payload)
+    if not isinstance(result, list):
+        raise HTTPException(502, f"Unexpected response from the audio model: {str(result)[:200]}")
+    return {"predictions": [{"label": entry.get("label"), "score": entry.get("score")} for entry in result]}
+
+
+# QR codes
+
+class QRRequest(BaseModel):
+    text: str = Field(min_length=1)
+    color: str = Field("#000000", pattern=r"^#[0-9a-fA-F]{6}$")
+    style: str = "Square"
+    format: Literal["png", "svg"] = "png"
+    size: int = Field(512, ge=64, le=4096)  # PNG only
+
+
+@app.post("/v1/qr")
+def qr(body: QRRequest, username: str = Depends(current_user)):
+    if body.style not in mods_dict[body.format]:
+        raise HTTPException(422, f"Unknown style {body.style!r}; choose from {', '.join(mods_dict[body.format])}.")
+    with span("qr_render"):
+        _, data = render_job(("qrcode", body.text, body.color, body.style, body.format, (body.size, body.size)))
+    return Response(data, media_type="image/png" if body.format == "png" else "image/svg+xml")
@@ -1,28 +1,388 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import bcrypt
 import yaml
 from yaml.loader import SafeLoader
 import os
 import time
+import copy
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 
-# Function to load config
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = "config.yaml"
+CONFIG_LOCK_PATH = "config.yaml.lock"
+
+# Session tokens are signed with SESSION_SECRET_KEY (environment or .streamlit/secrets.toml), never with a key
+# from config.yaml, which is committed. Example keys and short keys are refused.
+SESSION_KEY_NAME = "SESSION_SECRET_KEY"
+MIN_SESSION_KEY_BYTES = 32
+PLACEHOLDER_SESSION_KEYS = {"my_secret_key", "benchmark_key", "change-me"}
+_session_key_warned = []
+
+# What a token is for: browser session cookies and API bearer tokens are signed for different audiences, so
+# neither is accepted as the other. API tokens also carry a prefix that makes a leaked one recognisable.
+SESSION_AUDIENCE = "session"
+API_AUDIENCE = "api"
+TOKEN_PREFIXES = {SESSION_AUDIENCE: "", API_AUDIENCE: "vyomai_api_"}
+
+# Defaults for the optional `security` section of config.yaml
+SECURITY_DEFAULTS = {
+    "bcrypt_rounds": 12,
+    "login_attempts": 5,  # Token bucket capacity per username and per client IP
+    "login_window_seconds": 300,  # Time for an empty bucket to refill completely
+    "lockout_seconds": 900,
+    "trusted_proxies": [],  # Addresses of reverse proxies whose X-Forwarded-For entries are believed
+    "api_token_hours": 24,  # Lifetime of the bearer tokens api.py issues
+    "admin_users": [],  # Usernames that can open the Metrics page
+}
+
+# Defaults for the optional `storage` section of config.yaml (see models/res/storage.py); 0 disables a limit
+STORAGE_DEFAULTS = {
+    "user_quota_mb": 1024,  # Per user, across features; least recently used media is evicted first
+    "feature_quota_mb": {},  # Per user and feature, e.g. {"PdfChat": 200}
+    "media_retention_days": 180,  # Media not opened for this long is removed
+    "maintenance_interval_seconds": 3600,
+}
+
+# Defaults for the optional `pdf` section of config.yaml
+PDF_DEFAULTS = {
+    # Processes encoding one large document with a local embedding model (see models/res/local_embeddings.py);
+    # capped at services.MAX_LOCAL_EMBEDDING_PROCESSES and the machine's cores
+    "local_embedding_processes": 1,
+}
+
+# bcrypt runs here, never in the script thread; the bound keeps a login burst from taking every core
+BCRYPT_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+BCRYPT_TIMEOUT_SECONDS = 10
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+# Login token buckets keyed by "user:<name>" / "ip:<addr>": [tokens, last refill, locked until]
+MAX_TRACKED_CLIENTS = 10000
+_login_buckets = OrderedDict()
+_login_buckets_lock = threading.Lock()
+
+# Parsed config shared by every session, plus an email -> username index; refreshed when the file changes
+_config_cache = {"stamp": None, "config": None, "emails": {}}
+_config_thread_lock = threading.Lock()
+
+# Function to load config (parsed once per change of config.yaml, treat the result as read-only)
 def load_config():
-    with open("config.yaml") as file:
-        return yaml.load(file, Loader=SafeLoader)
+    stat = os.stat(CONFIG_PATH)
+    stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    if _config_cache["stamp"] != stamp:
+        with open(CONFIG_PATH) as file:
+            config = yaml.load(file, Loader=SafeLoader)
+        users = config["credentials"]["usernames"] or {}
+        config["credentials"]["usernames"] = users
+        _config_cache.update(
+            stamp=stamp,
+            config=config,
+            emails={user["email"].lower(): name for name, user in users.items() if user.get("email")},
+        )
+    return _config_cache["config"]
 
-# Function to save config
+# Function to save config atomically: write a temp file next to it, then swap it in
 def save_config(config_data):
-    with open("config.yaml", "w") as file:
-        yaml.dump(config_data, file)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(CONFIG_PATH)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            yaml.dump(config_data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp creates the file 0600; keep the permissions config.yaml already had
+        if os.path.exists(CONFIG_PATH):
+            os.chmod(tmp_path, os.stat(CONFIG_PATH).st_mode & 0o7777)
+        os.replace(tmp_path, CONFIG_PATH)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Serialise writers across threads (Streamlit sessions) and processes
+@contextmanager
+def config_lock():
+    with _config_thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(CONFIG_LOCK_PATH, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Look up a user by username, O(1) against the cached config
+def get_user(username):
+    return load_config()["credentials"]["usernames"].get(username)
+
+# Look up a username by email, O(1) against the cached index
+def get_username_by_email(email):
+    load_config()
+    return _config_cache["emails"].get(email.lower())
+
+# Add a user under the lock, re-reading the latest config so concurrent signups are never lost
+def add_user(username, name, email, hashed_password):
+    with config_lock():
+        if get_user(username) is not None:
+            raise ValueError("Username already exists.")
+        if get_username_by_email(email) is not None:
+            raise ValueError("Email is already registered.")
+
+        config = copy.deepcopy(load_config())
+        config["credentials"]["usernames"][username] = {
+            "name": name,
+            "email": email,
+            "password": hashed_password
+        }
+        save_config(config)
+
+# Replace a user's password hash under the lock
+def update_password(username, hashed_password):
+    with config_lock():
+        config = copy.deepcopy(load_config())
+        if username not in config["credentials"]["usernames"]:
+            return
+        config["credentials"]["usernames"][username]["password"] = hashed_password
+        save_config(config)
+
+# Invalidate the tokens issued to a user so far without changing the password: those of one audience (e.g. every
+# browser session on logout), or cookies and API tokens alike
+def revoke_tokens(username, audience=None):
+    counter = f"{audience}_generation" if audience else "token_generation"
+    with config_lock():
+        config = copy.deepcopy(load_config())
+        user = config["credentials"]["usernames"].get(username)
+        if user is None:
+            return
+        user[counter] = user.get(counter, 0) + 1
+        save_config(config)
+
+# Security settings from config.yaml, falling back to the defaults
+def security_settings():
+    return {**SECURITY_DEFAULTS, **(load_config().get("security") or {})}
+
+# Storage quotas and retention from config.yaml, falling back to the defaults
+def storage_settings():
+    return {**STORAGE_DEFAULTS, **(load_config().get("storage") or {})}
+
+# PDF ingest settings from config.yaml, falling back to the defaults
+def pdf_settings():
+    return {**PDF_DEFAULTS, **(load_config().get("pdf") or {})}
+
+# Whether a user may see admin-only pages
+def is_admin(username):
+    return bool(username) and username in security_settings()["admin_users"]
 
-# Hash the password using bcrypt
+# Run a bcrypt call in the bcrypt pool. A call still queued when the caller gives up is cancelled, so abandoned
+# checks don't keep the queue full during a login storm.
+def _run_bcrypt(fn, *args):
+    future = _bcrypt_pool.submit(fn, *args)
+    try:
+        return future.result(timeout=BCRYPT_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        future.cancel()
+        raise
+
+# Hash the password using bcrypt at the configured cost, in the bcrypt pool
 def hash_password(password):
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    rounds = security_settings()["bcrypt_rounds"]
+    hashed_password = _run_bcrypt(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
     return hashed_password
 
-# Verify the password using bcrypt
+# Verify the password using bcrypt, in the bcrypt pool
 def verify_password(stored_password, entered_password):
-    return bcrypt.checkpw(entered_password.encode('utf-8'), stored_password.encode('utf-8'))
+    return _run_bcrypt(bcrypt.checkpw, entered_password.encode('utf-8'), stored_password.encode('utf-8'))
+
+# Cost factor of a stored "$2b$<cost>$..." hash
+def hash_rounds(stored_password):
+    try:
+        return int(stored_password.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+# Re-hash with the configured cost after a successful login, when the cost factor has changed
+def rehash_if_needed(username, stored_password, entered_password):
+    if hash_rounds(stored_password) != security_settings()["bcrypt_rounds"]:
+        try:
+            update_password(username, hash_password(entered_password))
+        except FutureTimeoutError:
+            pass  # Best effort, the next login tries again
+
+# The client's address as seen by the connection's peer. X-Forwarded-For is only read when the peer is a trusted
+# proxy, and then from the right: each trusted proxy appends the address it saw, everything further left is
+# whatever the client sent.
+def resolve_client_ip(peer, forwarded):
+    trusted = set(security_settings()["trusted_proxies"])
+    if not forwarded or peer not in trusted:
+        return peer
+    for hop in reversed(forwarded.split(",")):
+        hop = hop.strip()
+        if hop and hop not in trusted:
+            return hop
+    return peer
+
+# Best effort client address for rate limiting; None for direct connections from this machine
+def client_ip():
+    try:
+        peer = st.context.ip_address
+        forwarded = st.context.headers.get("X-Forwarded-For")
+    except AttributeError:
+        return None
+    if peer is None:
+        # Streamlit reports loopback peers as None, which is also where a proxy on the same host connects from
+        ip = resolve_client_ip("127.0.0.1", forwarded)
+        return None if ip == "127.0.0.1" else ip
+    return resolve_client_ip(peer, forwarded)
+
+# Take one token from each bucket; returns the seconds left on a lockout, or 0 when the attempt may proceed
+def take_login_token(keys):
+    settings = security_settings()
+    capacity = settings["login_attempts"]
+    refill_rate = capacity / settings["login_window_seconds"]
+    now = time.monotonic()
+
+    with _login_buckets_lock:
+        buckets = []
+        for key in keys:
+            bucket = _login_buckets.pop(key, None) or [capacity, now, 0.0]
+            _login_buckets[key] = bucket  # Most recently used last, so the oldest are evicted first
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+            bucket[1] = now
+            buckets.append(bucket)
+        while len(_login_buckets) > MAX_TRACKED_CLIENTS:
+            _login_buckets.popitem(last=False)
+
+        locked_for = max(bucket[2] - now for bucket in buckets)
+        if locked_for > 0:
+            return locked_for
+
+        for bucket in buckets:
+            if bucket[0] < 1:
+                bucket[2] = now + settings["lockout_seconds"]
+                return settings["lockout_seconds"]
+        for bucket in buckets:
+            bucket[0] -= 1
+        return 0
+
+# After a successful login: forget the username's failed attempts and give back the token the attempt took from
+# the client address, so only failures count against an address that many users share (NAT, offices)
+def reset_login_tokens(username, ip=None):
+    capacity = security_settings()["login_attempts"]
+    with _login_buckets_lock:
+        _login_buckets.pop(f"user:{username}", None)
+        bucket = _login_buckets.get(f"ip:{ip}") if ip else None
+        if bucket:
+            bucket[0] = min(capacity, bucket[0] + 1)
+
+# Settings of the `cookie` section of config.yaml
+def cookie_settings():
+    cookie = load_config().get("cookie") or {}
+    return cookie.get("name", "VyomAI_session"), float(cookie.get("expiry_days", 30))
+
+# The key that signs session tokens, or None when it is missing, a placeholder or too short to resist guessing;
+# without it no token is issued or accepted and everyone logs in with their password
+def session_key():
+    from models.res.providers import MissingSecret, secret
+    try:
+        key = secret(SESSION_KEY_NAME)
+    except MissingSecret:
+        key = None
+    if key and key not in PLACEHOLDER_SESSION_KEYS and len(key.encode('utf-8')) >= MIN_SESSION_KEY_BYTES:
+        return key
+    if not _session_key_warned:
+        _session_key_warned.append(True)
+        logger.warning("%s is missing or weak (needs %d+ random bytes); session tokens are disabled",
+                       SESSION_KEY_NAME, MIN_SESSION_KEY_BYTES)
+    return None
+
+# HMAC over the audience, username, expiry, the user's token generations and the whole password hash. Only the
+# key holder can compute it, and a password change or revoke_tokens() invalidates old tokens.
+def _token_signature(key, audience, payload, user):
+    generations = f"{user.get('token_generation', 0)}.{user.get(f'{audience}_generation', 0)}"
+    message = f"{audience}.{generations}.{payload}.{user['password']}".encode('utf-8')
+    return base64.urlsafe_b64encode(hmac.new(key.encode('utf-8'), message, hashlib.sha256).digest()).decode().rstrip("=")
+
+# Signed token: prefix + base64url(username).expiry.signature, or None when no usable key is configured.
+# Session tokens live as long as the cookie unless another lifetime is given.
+def issue_session_token(username, audience=SESSION_AUDIENCE, lifetime_seconds=None):
+    key = session_key()
+    if key is None:
+        return None
+    if lifetime_seconds is None:
+        lifetime_seconds = cookie_settings()[1] * 86400
+    expires = int(time.time() + lifetime_seconds)
+    payload = f"{base64.urlsafe_b64encode(username.encode('utf-8')).decode().rstrip('=')}.{expires}"
+    return f"{TOKEN_PREFIXES[audience]}{payload}.{_token_signature(key, audience, payload, get_user(username))}"
+
+# Username for a valid, unexpired token of the audience, otherwise None; a dict lookup and one HMAC, no bcrypt
+def verify_session_token(token, audience=SESSION_AUDIENCE):
+    key = session_key()
+    prefix = TOKEN_PREFIXES[audience]
+    if not token.startswith(prefix):
+        return None
+    try:
+        encoded_username, expires, signature = token[len(prefix):].split(".")
+        username = base64.urlsafe_b64decode(encoded_username + "=" * (-len(encoded_username) % 4)).decode('utf-8')
+        if int(expires) < time.time():
+            return None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+    user = get_user(username)
+    if not key or user is None:
+        return None
+    expected = _token_signature(key, audience, f"{encoded_username}.{expires}", user)
+    return username if hmac.compare_digest(expected, signature) else None
+
+# Log in from the session cookie sent with the page request, if it holds a valid token
+def restore_session():
+    if st.session_state.get("logged_in") or st.session_state.get("clear_session_cookie"):
+        return
+    name, _ = cookie_settings()
+    token = st.context.cookies.get(name)
+    username = verify_session_token(token) if token else None
+    if username:
+        st.session_state.username = username
+        st.session_state.logged_in = True
+        st.session_state.full_name = get_user(username)["name"]
+
+# Streamlit can't set cookies itself, so write them from a zero-height component in the page. A cookie set from
+# JavaScript can't be HttpOnly: scripts on the page can read it, which is why logout revokes the token server-side
+# instead of only deleting the cookie.
+def _write_cookie(value, max_age):
+    name, _ = cookie_settings()
+    components.html(
+        f"""<script>
+        const secure = parent.location.protocol === "https:" ? "; Secure" : "";
+        parent.document.cookie = {json.dumps(name)} + "=" + {json.dumps(value)} + "; max-age={max_age}; path=/; SameSite=Strict" + secure;
+        </script>""",
+        height=0,
+    )
+
+# Set or clear the session cookie queued by login/logout; call once per rerun
+def sync_session_cookie():
+    token = st.session_state.pop("pending_session_token", None)
+    if token:
+        _, expiry_days = cookie_settings()
+        _write_cookie(token, int(expiry_days * 86400))
+    elif st.session_state.get("clear_session_cookie") and not st.session_state.get("logged_in"):
+        _write_cookie("", 0)
 
 # Signup function
 def signup():
@@ -36,21 +396,28 @@ def signup():
 
     if st.button("Register"):
         if new_name and new_email and new_username and new_password:
+            # Check availability before paying for the hash
+            if get_user(new_username) is not None:
+                st.error("Username already exists.")
+                return
+            if get_username_by_email(new_email) is not None:
+                st.error("Email is already registered.")
+                return
+
             # Hash the password
-            hashed_password = hash_password(new_password)
-            
-            # Load current config
-            config = load_config()
+            try:
+                hashed_password = hash_password(new_password)
+            except FutureTimeoutError:
+                st.error("The server is busy, please try again in a moment.")
+                return
 
             # Add new user details to the config
-            config["credentials"]["usernames"][new_username] = {
-                "name": new_name,
-                "email": new_email,
-                "password": hashed_password
-            }
-
-            # Save updated config
-            save_config(config)
+            try:
+                add_user(new_username, new_name, new_email, hashed_password)
+            except ValueError as e:
+                st.error(str(e))
+                return
+
             st.success("User registered successfully. Please log in.")
             time.sleep(2)
             st.rerun()  # Reload the app to apply new config
@@ -61,7 +428,6 @@ def signup():
 # Login function
 def login():
     st.title("Login")
-    config = load_config()
 
     # Login form inputs
     username = st.text_input("Username", key="login_username", help="Enter your username")
@@ -69,13 +435,33 @@ def login():
 
     if st.button("Login"):
         if username and password:
-            if username in config["credentials"]["usernames"]:
-                stored_password = config["credentials"]["usernames"][username]["password"]
-                if verify_password(stored_password, password):
+            # Rate limit per username and per client address before doing any bcrypt work
+            keys = [f"user:{username}"]
+            ip = client_ip()
+            if ip:
+                keys.append(f"ip:{ip}")
+            locked_for = take_login_token(keys)
+            if locked_for:
+                st.error(f"Too many login attempts. Try again in {int(locked_for // 60) + 1} minute(s).")
+                return
+
+            user = get_user(username)
+            if user is not None:
+                stored_password = user["password"]
+                try:
+                    verified = verify_password(stored_password, password)
+                except FutureTimeoutError:
+                    st.error("The server is busy, please try again in a moment.")
+                    return
+                if verified:
+                    reset_login_tokens(username, ip)
+                    rehash_if_needed(username, stored_password, password)
                     st.session_state.username = username
                     st.session_state.logged_in = True
+                    st.session_state.pending_session_token = issue_session_token(username)
+                    st.session_state.clear_session_cookie = False
                     # Get the full name of the logged-in user
-                    full_name = config["credentials"]["usernames"][username]["name"]
+                    full_name = user["name"]
                     st.session_state.full_name = full_name  # Store the full name in session state
                     st.success(f"Welcome, {full_name}")
                     st.rerun()  # Reload to redirect to the main app
@@ -86,10 +472,14 @@ def login():
         else:
             st.error("Please enter both username and password.")
 
-# Logout function
+# Logout function: signs out every browser session of the user, so a copied cookie stops working too. API tokens
+# are left alone (see revoke_tokens).
 def logout():
+    if st.session_state.get("username"):
+        revoke_tokens(st.session_state.username, SESSION_AUDIENCE)
     st.session_state.logged_in = False
     st.session_state.username = None
     st.session_state.full_name = None  # Clear full name on logout
+    st.session_state.clear_session_cookie = True  # Don't restore from the cookie, and expire it on the next run
     st.success("You have been logged out.")
     st.rerun()
@@ -0,0 +1,100 @@
+"""Embedding throughput of the PDF index backends, in chunks per second.
+
+Synthetic chunks (benchmarks/fixtures.py), as long as each backend's chunks are when PDFs are processed, go
+through the same services.pdf_embeddings() the app uses. Model loading is timed separately from encoding.
+
+The Gemini backend needs GOOGLE_API_KEY and counts against its quota and rate limits. With --fake-latency
+it talks to the load test's local stand-in instead (benchmarks/load_test.py), which measures the client's
+batching plus the simulated round trip, not Gemini itself.
+
+Run from the repository root:
+    python -m benchmarks.embedding_throughput                          # every backend, 256 chunks each
+    python -m benchmarks.embedding_throughput -b local -b local-int8 --chunks 4000 --processes 4
+    python -m benchmarks.embedding_throughput -b gemini --fake-latency 150
+
+Local encoding uses a process per --processes once there are at least
+models.res.local_embeddings.MULTI_PROCESS_MIN_TEXTS chunks.
+"""
+import argparse
+import os
+import time
+from benchmarks import fixtures
+
+# Chunks embedded untimed first, so the first batch's warm-up doesn't count
+WARMUP_CHUNKS = 8
+
+
+def make_chunks(count, chunk_size):
+    # Words average about 6.5 characters with their space
+    words = max(1, chunk_size // 7)
+    return [fixtures.make_words(words, seed=i) for i in range(count)]
+
+
+def run_backend(backend, args):
+    from models.res.services import PDF_EMBEDDING_BACKENDS, pdf_embeddings
+    config = PDF_EMBEDDING_BACKENDS[backend]
+    chunks = make_chunks(args.chunks, config["chunk_size"])
+
+    start = time.perf_counter()
+    embeddings = pdf_embeddings(backend)
+    if not config["remote"]:
+        from models.res.local_embeddings import load_model
+        embeddings.processes = args.processes
+        embeddings.model_name = args.local_model or embeddings.model_name
+        load_model(embeddings.model_name, embeddings.quantize)
+    embeddings.embed_documents(chunks[:WARMUP_CHUNKS])
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(chunks)
+    seconds = time.perf_counter() - start
+    return {
+        "backend": backend, "chunks": len(vectors), "chunk_chars": config["chunk_size"], "dim": len(vectors[0]),
+        "load_s": load_seconds, "seconds": seconds, "chunks_per_s": len(vectors) / seconds,
+    }
+
+
+def main(argv=None):
+    from models.res.services import PDF_EMBEDDING_BACKENDS
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-b", "--backend", dest="backends", action="append", choices=list(PDF_EMBEDDING_BACKENDS),
+                        help="backend to measure, repeatable (default: all)")
+    parser.add_argument("--chunks", type=int, default=256, help="chunks embedded per backend")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="encoding processes for local backends")
+    parser.add_argument("--local-model", help="sentence-transformers model name or path instead of the configured one")
+    parser.add_argument("--fake-latency", type=float, help="serve Gemini from a local stand-in with this round trip (ms)")
+    args = parser.parse_args(argv)
+
+    fakes = None
+    if args.fake_latency is not None:
+        from benchmarks.load_test import start_fakes
+        fakes, base_url = start_fakes(args.fake_latency / 1000, 0, 1)
+        os.environ.update({"GOOGLE_API_KEY": "benchmark", "GOOGLE_API_ENDPOINT": base_url})
+
+    print(f"{'backend':<12} {'chunks':>7} {'chars':>6} {'dim':>5} {'load s':>7} {'encode s':>9} {'chunks/s':>9}")
+    results = []
+    try:
+        for backend in args.backends or list(PDF_EMBEDDING_BACKENDS):
+            try:
+                result = run_backend(backend, args)
+            except ImportError as e:
+                print(f"{backend:<12} skipped ({e.name or e} not installed)")
+                continue
+            results.append(result)
+            print(f"{backend:<12} {result['chunks']:>7} {result['chunk_chars']:>6} {result['dim']:>5} "
+                  f"{result['load_s']:>7.2f} {result['seconds']:>9.2f} {result['chunks_per_s']:>9.1f}")
+    finally:
+        if fakes:
+            fakes.terminate()
+
+    # Local chunks are a tenth of the size, so the same PDF makes ten times as many of them
+    remote = next((r for r in results if PDF_EMBEDDING_BACKENDS[r["backend"]]["remote"]), None)
+    if remote:
+        for result in results:
+            if result is not remote:
+                speedup = (result["chunks_per_s"] * result["chunk_chars"]) / (remote["chunks_per_s"] * remote["chunk_chars"])
+                print(f"{result['backend']}: {speedup:.1f}x the text per second of {remote['backend']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Synthetic, deterministic inputs for the offline benchmarks: PDFs, chat histories, embeddings, configs."""
+import random
+
+WORDS = (
+    "vyom model prompt answer context document vector index query token stream image audio "
+    "spectrogram chat history session user language translate generate response embedding "
+    "chunk page search score label window sample latency cache store record"
+).split()
+
+
+def make_words(count, seed=0):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def make_pdf(pages=20, lines_per_page=50, words_per_line=12, seed=0):
+    # Minimal valid PDF with Helvetica text pages, enough for PdfReader.extract_text
+    rng = random.Random(seed)
+    bodies = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        page_num, content_num = len(bodies) + 1, len(bodies) + 2
+        kids.append(f"{page_num} 0 R")
+        lines = [" ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(lines_per_page)]
+        text = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+        stream = text.encode("latin-1")
+        bodies.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_num} 0 R >>".encode()
+        )
+        bodies.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    bodies[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(bodies, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(bodies) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(bodies) + 1, xref)
+    return bytes(out)
+
+
+def make_chat_history(messages=2000, words_per_message=80, seed=0):
+    # Same shape as GroqChat's st.session_state.messages
+    rng = random.Random(seed)
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": make_words(rng.randint(words_per_message // 2, words_per_message * 2), seed + i)}
+        for i in range(messages)
+    ]
+
+
+def make_embeddings(rows=5000, dim=768, seed=0):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((rows, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_config(users=1000, password_hash="$2b$12$jpyxlmYQweHrEIFZU5SMA.HhCqciXFtzx1qVTGSP2cemVLyncqPky"):
+    # config.yaml structure with many users sharing one hash
+    return {
+        "cookie": {"expiry_days": 30, "name": "VyomAI_session"},
+        "credentials": {"usernames": {
+            f"user{i}": {"email": f"user{i}@example.com", "name": f"User {i}", "password": password_hash}
+            for i in range(users)
+        }},
+    }
@@ -0,0 +1,327 @@
+"""Offline micro-benchmarks for the CPU/IO-bound code VyomAI runs locally.
+
+Every input is synthetic (benchmarks/fixtures.py) and nothing talks to the network. Each benchmark
+reports median latency, throughput and peak memory, and its latency is compared with the stored baseline.
+Peak memory is the Python heap (tracemalloc, "py") for pure-Python code, and the growth of the process's
+resident set ("rss") for benchmarks whose memory lives in C/C++ libraries such as FAISS and NumPy, which
+tracemalloc can't see.
+
+Run from the repository root:
+    python -m benchmarks.hot_paths                     # run and compare against benchmarks/baseline.json
+    python -m benchmarks.hot_paths --update-baseline   # record the current numbers as the baseline
+    python -m benchmarks.hot_paths -k qr               # only benchmarks whose name contains "qr"
+
+Exits with status 1 when a benchmark is slower than its baseline by more than --tolerance.
+Benchmarks whose dependencies aren't installed are reported as skipped.
+"""
+import argparse
+import io
+import json
+import os
+import pickle
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from benchmarks import fixtures
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Scratch files for history/config benchmarks, removed when the run ends
+WORKDIR = tempfile.TemporaryDirectory(prefix="vyomai_bench_")
+
+# name -> (setup, repeats, memory); setup() returns (fn, items, unit) where fn() is the timed call, and memory
+# is "py" or "rss" (see the module docstring)
+BENCHMARKS = {}
+
+
+def benchmark(name, repeats=5, memory="py"):
+    def register(setup):
+        BENCHMARKS[name] = (setup, repeats, memory)
+        return setup
+    return register
+
+
+@benchmark("pdf.get_pdf_text")
+def bench_pdf_text():
+    from models.res.services import get_pdf_text
+    pdf = fixtures.make_pdf(pages=40)
+    return lambda: get_pdf_text([io.BytesIO(pdf)]), 40, "pages"
+
+
+@benchmark("pdf.get_text_chunks")
+def bench_text_chunks():
+    from models.res.services import get_text_chunks
+    text = fixtures.make_words(300_000)
+    return lambda: get_text_chunks(text), len(text) / 1e6, "MB"
+
+
+def _vector_store(vectors, prefix="chunk"):
+    # The langchain FAISS store services.build_pdf_index() creates, from precomputed vectors; the embedding
+    # object is only kept for queries, which pdf_index.search() embeds itself
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import FakeEmbeddings
+    texts = [f"{prefix} {i} " + fixtures.make_words(150, seed=i) for i in range(len(vectors))]
+    return FAISS.from_embeddings(list(zip(texts, vectors.tolist())), FakeEmbeddings(size=vectors.shape[1]))
+
+
+@benchmark("pdf_index.build_and_save", memory="rss")
+def bench_pdf_index_save():
+    # What build_pdf_index() does once the chunks are embedded: build the store, save a shard build, prune
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import FakeEmbeddings
+    from models.res import pdf_index
+    vectors = fixtures.make_embeddings(rows=20_000)
+    pairs = list(zip((f"chunk {i}" for i in range(len(vectors))), vectors.tolist()))
+    index_dir = os.path.join(WORKDIR.name, "pdf_build", "faiss_index")
+
+    def build():
+        store = FAISS.from_embeddings(pairs, FakeEmbeddings(size=vectors.shape[1]))
+        pdf_index.save(store, index_dir)
+        pdf_index.prune(index_dir)
+    return build, len(vectors), "vectors"
+
+
+@benchmark("pdf_index.search", memory="rss")
+def bench_pdf_index_search():
+    # A question over all of a user's documents: 20 shards of 1,000 chunks, searched in parallel through the
+    # app's entry point, with the hits' chunks read from each shard's docstore
+    from models.res import pdf_index
+    shards = {}
+    for d in range(20):
+        shards[f"doc{d}"] = os.path.join(WORKDIR.name, "pdf_search", f"doc{d}", "faiss_index")
+        pdf_index.save(_vector_store(fixtures.make_embeddings(rows=1000, seed=d), f"doc{d}"), shards[f"doc{d}"])
+    queries = fixtures.make_embeddings(rows=50, seed=100)
+    return lambda: [pdf_index.search(shards, query, 4) for query in queries], len(queries), "queries"
+
+
+def _history_paths():
+    return os.path.join(tempfile.mkdtemp(dir=WORKDIR.name), "messages.pkl")
+
+
+@benchmark("history.joblib_dump")
+def bench_joblib_dump():
+    import joblib
+    history, path = fixtures.make_chat_history(), _history_paths()
+    return lambda: joblib.dump(history, path), len(history), "messages"
+
+
+@benchmark("history.joblib_load")
+def bench_joblib_load():
+    import joblib
+    history, path = fixtures.make_chat_history(), _history_paths()
+    joblib.dump(history, path)
+    return lambda: joblib.load(path), len(history), "messages"
+
+
+@benchmark("history.pickle_dump")
+def bench_pickle_dump():
+    history, path = fixtures.make_chat_history(), _history_paths()
+
+    def dump():
+        with open(path, "wb") as f:
+            pickle.dump(history, f)
+    return dump, len(history), "messages"
+
+
+@benchmark("history.pickle_load")
+def bench_pickle_load():
+    history, path = fixtures.make_chat_history(), _history_paths()
+    with open(path, "wb") as f:
+        pickle.dump(history, f)
+
+    def load():
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return load, len(history), "messages"
+
+
+def _uncached_qr(render):
+    # Clear the per-process QR caches so every run does the full render
+    from models.res.utils import module_matrix, module_stamp, render_mono
+
+    def run():
+        for cached in (module_matrix, module_stamp, render_mono):
+            cached.cache_clear()
+        return render()
+    return run
+
+
+@benchmark("qr.render_png_square")
+def bench_qr_square():
+    from models.res.utils import render_png
+    text = "https://example.com/assets/" + "a1b2c3d4" * 10
+    return _uncached_qr(lambda: render_png(text, "#1f77b4", "Square", (1024, 1024))), 1, "codes"
+
+
+@benchmark("qr.render_png_rounded")
+def bench_qr_rounded():
+    from models.res.utils import render_png
+    text = "https://example.com/assets/" + "a1b2c3d4" * 10
+    return _uncached_qr(lambda: render_png(text, "#1f77b4", "Rounded", (1024, 1024))), 1, "codes"
+
+
+@benchmark("qr.render_svg")
+def bench_qr_svg():
+    from models.res.config import mods_dict
+    from models.res.utils import build_qr, svg_factory, svg_to_bytes
+    text = "https://example.com/assets/" + "a1b2c3d4" * 10
+
+    def render():
+        img = build_qr(text).make_image(image_factory=svg_factory("#1f77b4"), module_drawer=mods_dict["svg"]["Circle"])
+        return svg_to_bytes(img)
+    return render, 1, "codes"
+
+
+def _bench_config():
+    import yaml
+    import auth
+    auth.CONFIG_PATH = os.path.join(tempfile.mkdtemp(dir=WORKDIR.name), "config.yaml")
+    with open(auth.CONFIG_PATH, "w") as f:
+        yaml.dump(fixtures.make_config(users=1000), f)
+    return auth
+
+
+@benchmark("auth.load_config_cold")
+def bench_load_config_cold():
+    auth = _bench_config()
+
+    def load():
+        auth._config_cache["stamp"] = None  # Force a parse, as every rerun did before the cache
+        return auth.load_config()
+    return load, 1000, "users"
+
+
+@benchmark("auth.load_config_cached")
+def bench_load_config_cached():
+    auth = _bench_config()
+    auth.load_config()
+    return lambda: auth.get_user("user999"), 1, "lookups"
+
+
+@benchmark("auth.verify_password", repeats=3)
+def bench_verify_password():
+    auth = _bench_config()
+    stored = auth.hash_password("benchmark-password")
+    return lambda: auth.verify_password(stored, "benchmark-password"), 1, "checks"
+
+
+def _rss_bytes():
+    # Resident set size of this process (Linux), or None where /proc isn't available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_python(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _peak_rss_growth(fn):
+    # Highest resident set seen while fn runs, sampled every millisecond, over what it was before
+    before = _rss_bytes()
+    if before is None:
+        fn()
+        return None
+    peak = [before]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], _rss_bytes())
+            time.sleep(0.001)
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        fn()
+    finally:
+        done.set()
+        sampler.join()
+    return max(peak[0], _rss_bytes()) - before
+
+
+def run_benchmark(name):
+    setup, repeats, memory = BENCHMARKS[name]
+    fn, items, unit = setup()
+    fn()  # Warm up imports and caches outside the measurement
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    peak = _peak_rss_growth(fn) if memory == "rss" else _peak_python(fn)
+
+    median = statistics.median(samples)
+    return {
+        "median_ms": median * 1000,
+        "min_ms": min(samples) * 1000,
+        "throughput": items / median,
+        "unit": f"{unit}/s",
+        "peak_mb": peak / 1e6 if peak is not None else None,
+        "memory": memory,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="pattern", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    results, regressions = {}, []
+    print(f"{'benchmark':<28} {'median ms':>10} {'throughput':>22} {'peak MB':>11} {'vs baseline':>12}")
+    for name in BENCHMARKS:
+        if args.pattern not in name:
+            continue
+        try:
+            result = run_benchmark(name)
+        except ImportError as e:
+            print(f"{name:<28} skipped ({e.name or e} not installed)")
+            continue
+
+        results[name] = result
+        verdict = ""
+        if name in baseline:
+            ratio = result["median_ms"] / baseline[name]["median_ms"]
+            verdict = f"{ratio:>6.2f}x"
+            if ratio > 1 + args.tolerance:
+                verdict += " SLOW"
+                regressions.append(name)
+        throughput = f"{result['throughput']:,.1f} {result['unit']}"
+        peak = f"{result['peak_mb']:.1f} {result['memory']}" if result["peak_mb"] is not None else "-"
+        print(f"{name:<28} {result['median_ms']:>10.2f} {throughput:>22} {peak:>11} {verdict:>12}")
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline updated: {BASELINE_PATH}")
+        return 0
+
+    if not baseline:
+        print("\nNo baseline stored yet; run with --update-baseline on the reference machine.")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
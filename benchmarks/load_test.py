@@ -0,0 +1,388 @@
+"""Concurrent-session load test: many headless App.py sessions against local fake model APIs.
+
+Each session is a Streamlit AppTest driven through login -> GroqChat (new chat + streamed answer) ->
+PdfChat (upload, index, question) -> QR Generator (preview + render). Groq, Gemini and the Hugging Face
+endpoints are replaced by a local HTTP server (in its own process) that streams tokens with configurable
+latency, so the numbers reflect the app and not the providers.
+
+Run from the repository root:
+    python -m benchmarks.load_test                          # concurrency 1, 2, 4, 8
+    python -m benchmarks.load_test -c 1 4 16 --latency-ms 300 --token-ms 20
+
+Reports sessions/sec, rerun latency percentiles and process RSS per concurrency level. The app runs
+in a scratch copy with its own config.yaml and DataHistory, so nothing in the repository is touched.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import secrets
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks import fixtures
+from models.res.instrumentation import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILES = ["App.py", "auth.py", "style.css", "models", ".streamlit"]
+PASSWORD = "load-test-password"
+SESSION_TIMEOUT = 120
+EMBEDDING_DIM = 768
+
+
+def _fake_embedding(text):
+    rng = random.Random(text)
+    return [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)]
+
+
+def _fake_wav(seconds=1, sample_rate=16000):
+    data = b"\x00\x00" * int(seconds * sample_rate)
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + len(data), b"WAVE", b"fmt ", 16, 1, 1,
+        sample_rate, sample_rate * 2, 2, 16, b"data", len(data),
+    )
+    return header + data
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    # Groq (OpenAI-style SSE), Gemini REST and Hugging Face inference, just enough for the app's calls
+    protocol_version = "HTTP/1.1"
+    latency = 0.2
+    token_interval = 0.01
+    tokens = 50
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, pieces, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.token_interval)
+            data = piece.encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _words(self):
+        return [word + " " for word in fixtures.make_words(self.tokens, seed=random.randrange(1000)).split()]
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        path, _, query = self.path.partition("?")
+        time.sleep(self.latency)
+
+        if path.endswith("/chat/completions"):
+            self._groq(body)
+        elif ":batchEmbedContents" in path:
+            self._send({"embeddings": [
+                {"values": _fake_embedding(json.dumps(request["content"]))} for request in body["requests"]
+            ]})
+        elif ":embedContent" in path:
+            self._send({"embedding": {"values": _fake_embedding(json.dumps(body["content"]))}})
+        elif ":generateContent" in path:
+            self._send(self._gemini_chunk("".join(self._words())))
+        elif ":streamGenerateContent" in path:
+            chunks = [json.dumps(self._gemini_chunk(word)) for word in self._words()]
+            if "alt=sse" in query:
+                self._stream([f"data: {chunk}\r\n\r\n" for chunk in chunks], "text/event-stream")
+            else:
+                self._stream(["[" + chunks[0]] + ["," + chunk for chunk in chunks[1:]] + ["]"], "application/json")
+        elif path.startswith("/hf/audio"):
+            self._send(_fake_wav(), "audio/wav")
+        elif path.startswith("/hf/classify"):
+            self._send([{"label": f"Label {i}", "score": round(0.9 / (i + 1), 4)} for i in range(5)])
+        elif path.startswith("/hf/image"):
+            from models.res.utils import image_to_bytes, render_png
+            self._send(image_to_bytes(render_png(path, "#1f77b4", "Square", (256, 256))), "image/png")
+        else:
+            self.send_error(404)
+
+    def _gemini_chunk(self, text):
+        return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}]}
+
+    def _groq(self, body):
+        completion_id, created = f"chatcmpl-{random.getrandbits(32):x}", int(time.time())
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        words = self._words()
+        if not body.get("stream"):
+            self._send({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": len(words), "total_tokens": 10 + len(words)},
+            })
+            return
+        events = [chunk({"role": "assistant", "content": ""})] + [chunk({"content": word}) for word in words]
+        events.append(chunk({}, "stop"))
+        self._stream([f"data: {json.dumps(event)}\n\n" for event in events] + ["data: [DONE]\n\n"], "text/event-stream")
+
+
+def serve_fakes(port_queue, latency, token_interval, tokens):
+    # Runs in a child process so the fake providers don't compete with the sessions for the GIL
+    FakeProviderHandler.latency, FakeProviderHandler.token_interval, FakeProviderHandler.tokens = latency, token_interval, tokens
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeProviderHandler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_fakes(latency, token_interval, tokens):
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    process = context.Process(target=serve_fakes, args=(port_queue, latency, token_interval, tokens), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+
+def prepare_workdir(workdir, users, bcrypt_rounds):
+    # Scratch copy of the app with load-test users. Reused accounts aren't locked out by login throttling, which
+    # only counts failed logins
+    import bcrypt
+    import yaml
+    for name in APP_FILES:
+        source = os.path.join(REPO_ROOT, name)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(workdir, name), ignore=shutil.ignore_patterns("__pycache__"))
+        elif os.path.exists(source):
+            shutil.copy(source, workdir)
+
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(bcrypt_rounds)).decode()
+    config = fixtures.make_config(users=users, password_hash=password_hash)
+    config["security"] = {"bcrypt_rounds": bcrypt_rounds}
+    with open(os.path.join(workdir, "config.yaml"), "w") as f:
+        yaml.dump(config, f)
+    return os.path.join(workdir, "App.py")
+
+
+def share_test_runtime():
+    # AppTest installs a mock Runtime singleton for each run and clears it when the run ends, and swaps
+    # st.secrets and the global.appTest option the same way, so overlapping runs trip over each other.
+    # A real server keeps one Runtime for every session: keep the latest mock installed instead. It also
+    # compiles App.py once for all sessions, where AppTest would parse it concurrently on every run.
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    class KeepInstance(type):
+        def __setattr__(cls, name, value):
+            if name != "_instance":
+                super().__setattr__(name, value)
+            elif value is not None:
+                Runtime._instance = value
+
+    app_test.Runtime = KeepInstance("Runtime", (Runtime,), {})
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    config.set_option("global.appTest", True)
+
+
+def write_secrets(workdir, base_url):
+    # Read from .streamlit/secrets.toml in the working directory, the same way for every session
+    values = {
+        "GROQ_API_KEY": "load-test", "GOOGLE_API_KEY": "load-test", "api_key": "load-test",
+        "META_API_KEY": f"{base_url}/hf/audio", "AST_API_KEY": f"{base_url}/hf/classify",
+        "STABLE_DIFFUSION_API_URL": f"{base_url}/hf/image", "SESSION_SECRET_KEY": secrets.token_urlsafe(32),
+    }
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w") as f:
+        f.writelines(f'{key} = "{value}"\n' for key, value in values.items())
+
+
+class SessionError(Exception):
+    pass
+
+
+class Session:
+    # One headless browser tab: an AppTest plus the rerun latencies it observed
+    def __init__(self, app_path, username):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(app_path, default_timeout=SESSION_TIMEOUT)
+        self.username = username
+        self.reruns = []
+
+    def step(self, name, action=None):
+        start = time.perf_counter()
+        (action or self.at.run)()
+        self.reruns.append((name, time.perf_counter() - start))
+        problems = [e.value for e in self.at.exception] + [e.value for e in self.at.error]
+        if problems:
+            raise SessionError(f"{name}: {str(problems[0]).splitlines()[0][:120]}")
+
+    def button(self, label):
+        return next(b for b in self.at.button if b.label == label)
+
+    def goto(self, page):
+        self.at.session_state["main_menu"] = page
+        self.step(f"{page}.open")
+
+    def run(self, pdf):
+        at = self.at
+        self.step("login.open")
+        at.text_input(key="login_username").input(self.username)
+        at.text_input(key="login_password").input(PASSWORD)
+        self.step("login.submit", self.button("Login").click().run)
+        if not at.session_state["logged_in"]:
+            raise SessionError("login.submit: not logged in")
+
+        # Home is GroqChat
+        self.step("groq.new_chat", self.button("New Chat").click().run)
+        self.step("groq.prompt", at.chat_input[0].set_value("Summarise the latest release notes").run)
+
+        self.goto("Pdf")
+        at.sidebar.file_uploader[0].upload("load_test.pdf", pdf, "application/pdf")
+        self.step("pdf.upload")
+        self.step("pdf.process", self.button("Submit & Process").click().run)
+        self.step("pdf.question", at.chat_input[0].set_value("What is this document about?").run)
+
+        self.goto("QR Generator")
+        at.text_input(key="content").input(f"https://example.com/{self.username}")
+        self.step("qr.preview")
+        self.step("qr.render", self.button("I'm ready!").click().run)
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak rather than current RSS where /proc isn't available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_level(concurrency, sessions, app_path, users, pdf):
+    results, errors, peak = [], Counter(), [rss_mb()]
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.wait(0.2):
+            peak.append(rss_mb())
+
+    def one_session(n):
+        session = Session(app_path, f"user{n % users}")
+        try:
+            session.run(pdf)
+            return session.reruns, None
+        except SessionError as e:
+            return session.reruns, str(e)
+        except (StopIteration, IndexError, KeyError) as e:
+            # A widget the flow expected wasn't rendered
+            last_step = session.reruns[-1][0] if session.reruns else "start"
+            return session.reruns, f"after {last_step}: missing widget ({type(e).__name__} {e})"
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for reruns, error in pool.map(one_session, range(sessions)):
+            results.extend(reruns)
+            if error:
+                errors[error] += 1
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "failed": sum(errors.values()),
+        "sessions_per_s": (sessions - sum(errors.values())) / elapsed,
+        "reruns": results,
+        "errors": errors,
+        "rss_end_mb": rss_mb(),
+        "rss_peak_mb": max(peak),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="concurrent sessions per level")
+    parser.add_argument("--sessions", type=int, default=2, help="sessions per concurrent slot at each level")
+    parser.add_argument("--latency-ms", type=float, default=200, help="fake provider delay before the first byte")
+    parser.add_argument("--token-ms", type=float, default=10, help="delay between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per fake answer")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="cost of the load-test users' password hashes")
+    parser.add_argument("--pdf-pages", type=int, default=5, help="pages in the uploaded PDF")
+    args = parser.parse_args(argv)
+
+    fakes, base_url = start_fakes(args.latency_ms / 1000, args.token_ms / 1000, args.tokens)
+    # The app reads these through load_dotenv/os.getenv, which never override what's already set
+    os.environ.update({
+        "GROQ_API_KEY": "load-test", "GROQ_BASE_URL": base_url,
+        "GOOGLE_API_KEY": "load-test", "GOOGLE_API_ENDPOINT": base_url,
+    })
+
+    users = max(args.concurrency)
+    pdf = fixtures.make_pdf(pages=args.pdf_pages)
+    workdir = tempfile.TemporaryDirectory(prefix="vyomai_load_")
+    try:
+        app_path = prepare_workdir(workdir.name, users, args.bcrypt_rounds)
+        write_secrets(workdir.name, base_url)
+        os.chdir(workdir.name)
+        share_test_runtime()
+        print(f"Fake providers at {base_url}; app copy in {workdir.name}; baseline RSS {rss_mb():.0f} MB\n")
+
+        levels = []
+        print(f"{'sessions':>9} {'conc':>5} {'failed':>7} {'sessions/s':>11} {'rerun p50':>10} {'p95':>8} {'p99':>8} {'RSS MB':>8} {'peak':>7}")
+        for concurrency in args.concurrency:
+            level = run_level(concurrency, concurrency * args.sessions, app_path, users, pdf)
+            levels.append(level)
+            durations = sorted(d for _, d in level["reruns"]) or [0.0]
+            print(
+                f"{level['sessions']:>9} {concurrency:>5} {level['failed']:>7} {level['sessions_per_s']:>11.2f} "
+                f"{percentile(durations, 50) * 1000:>8.0f}ms {percentile(durations, 95) * 1000:>6.0f}ms "
+                f"{percentile(durations, 99) * 1000:>6.0f}ms {level['rss_end_mb']:>8.0f} {level['rss_peak_mb']:>7.0f}",
+                flush=True,
+            )
+
+        steps = list(dict.fromkeys(name for level in levels for name, _ in level["reruns"]))
+        print("\nRerun p95 per step (ms):")
+        print(f"{'step':<24}" + "".join(f"{'c=' + str(level['concurrency']):>9}" for level in levels))
+        for step in steps:
+            row = f"{step:<24}"
+            for level in levels:
+                durations = sorted(d for name, d in level["reruns"] if name == step)
+                row += f"{percentile(durations, 95) * 1000:>9.0f}" if durations else f"{'-':>9}"
+            print(row)
+
+        errors = sum((level["errors"] for level in levels), Counter())
+        if errors:
+            print("\nFailures:")
+            for error, count in errors.most_common(10):
+                print(f"  {count:>4}x {error}")
+    finally:
+        os.chdir(REPO_ROOT)
+        workdir.cleanup()
+        fakes.terminate()
+    return 1 if any(level["failed"] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Compare the old box_size=36 + resize PNG path with the direct NumPy renderer.
+
+Run from the repository root:  python -m benchmarks.qr_render
+"""
+import time
+import qrcode
+from qrcode.image.styledpil import StyledPilImage
+import qrcode.image.styles.colormasks as masks
+from models.res.config import mods_dict
+from models.res.utils import hex_to_rgb, module_matrix, module_stamp, render_mono, render_png
+
+TEXTS = {
+    'short': 'https://vyom.ai',
+    'long': 'https://example.com/assets/' + 'a1b2c3d4' * 20,
+}
+RESOLUTIONS = [(256, 256), (512, 512), (1024, 1024)]
+COLOR = '#1f77b4'
+REPEATS = 5
+LEGACY_REPEATS = 1  # The per-pixel color mask takes seconds per render
+
+
+def legacy_png(text, color, modStyle, size):
+    # The renderer setup_qrcode used before: huge styled render with a per-pixel color mask, then resize
+    qr = qrcode.QRCode(box_size=36, error_correction=qrcode.constants.ERROR_CORRECT_L, mask_pattern=0, border=4)
+    qr.add_data(text)
+    qr.make(fit=True)
+    img = qr.make_image(
+        image_factory=StyledPilImage,
+        color_mask=masks.SolidFillColorMask(back_color=(255, 255, 255), front_color=hex_to_rgb(color)),
+        module_drawer=mods_dict['png'][modStyle],
+    )
+    return img.resize(size)
+
+
+def clear_caches():
+    for cached in (module_matrix, module_stamp, render_mono):
+        cached.cache_clear()
+
+
+def timed(fn, *args, repeats=REPEATS):
+    best = float('inf')
+    for _ in range(repeats):
+        clear_caches()
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'text':<6} {'style':<11} {'size':<10} {'legacy ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for name, text in TEXTS.items():
+        for modStyle in mods_dict['png']:
+            for size in RESOLUTIONS:
+                old = timed(legacy_png, text, COLOR, modStyle, size, repeats=LEGACY_REPEATS)
+                new = timed(render_png, text, COLOR, modStyle, size)
+                print(f"{name:<6} {modStyle:<11} {size[0]}x{size[1]:<5} {old * 1000:>10.1f} {new * 1000:>10.1f} {old / new:>7.1f}x", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Time-to-login-page of App.py with lazy page imports versus importing every page up front.
+
+Each measurement runs in a fresh interpreter so module caches don't leak between runs.
+Run from the repository root:  python -m benchmarks.startup
+"""
+import statistics
+import subprocess
+import sys
+from models.res.page_registry import PAGES
+
+RUNS = 3
+
+# Renders the login page headlessly; EAGER optionally imports every page first, as App.py used to
+SCRIPT = """
+import sys, time, importlib
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+for name in {eager!r}:
+    importlib.import_module(name)
+AppTest.from_file("App.py", default_timeout=120).run()
+print(time.perf_counter() - start, len(sys.modules))
+"""
+
+IMPORT_SCRIPT = """
+import time, importlib
+import streamlit
+start = time.perf_counter()
+importlib.import_module({name!r})
+print(time.perf_counter() - start)
+"""
+
+
+def run(code):
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    # The measurement is the last line printed; anything before it is app output
+    return [float(x) for x in out.strip().splitlines()[-1].split()]
+
+
+def time_to_login(eager_modules):
+    samples = [run(SCRIPT.format(eager=eager_modules)) for _ in range(RUNS)]
+    return statistics.median(s[0] for s in samples), int(statistics.median(s[1] for s in samples))
+
+
+def main():
+    page_modules = sorted({module for module, _ in PAGES.values()})
+
+    print("Per page import cost (fresh interpreter, streamlit already imported):")
+    for name in page_modules:
+        seconds = statistics.median(run(IMPORT_SCRIPT.format(name=name))[0] for _ in range(RUNS))
+        print(f"  {name:<26} {seconds * 1000:>8.0f} ms")
+
+    eager, eager_modules = time_to_login(page_modules)
+    lazy, lazy_modules = time_to_login([])
+    print("\nTime to login page (median of %d runs):" % RUNS)
+    print(f"  eager imports (before)    {eager * 1000:>8.0f} ms  {eager_modules} modules loaded")
+    print(f"  lazy registry (after)     {lazy * 1000:>8.0f} ms  {lazy_modules} modules loaded")
+    print(f"  speedup                   {eager / lazy:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
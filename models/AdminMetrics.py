@@ -0,0 +1,85 @@
+import streamlit as st
+import pandas as pd
+import auth
+from models.res.instrumentation import PROFILE_BUSY_MESSAGE, latency_summary, recent_spans
+from models.res.storage import reindex, run_maintenance, usage
+
+# Time windows offered on the page, in seconds
+WINDOWS = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400}
+
+
+def admin_metrics():
+    if not auth.is_admin(st.session_state.get('username')):
+        st.error("This page is only available to administrators.")
+        return
+
+    st.header("Performance Metrics ⏱️", divider="rainbow")
+
+    window = st.selectbox("Time window", list(WINDOWS.keys()), index=1)
+    spans = recent_spans(WINDOWS[window])
+
+    if not spans:
+        st.info("No reruns recorded in this window yet.")
+    else:
+        st.write(f"{len(spans)} spans recorded")
+
+        # Whole reruns: shell overhead and page time per page
+        st.subheader("Reruns per page")
+        reruns = [s for s in spans if s[3] in ("page", "shell")]
+        st.dataframe(pd.DataFrame(latency_summary(reruns, group_by=("page", "kind"))),
+                     use_container_width=True, hide_index=True)
+
+        # Calls to Groq, Gemini, Hugging Face and other remote endpoints
+        st.subheader("External calls")
+        external = [s for s in spans if s[3] == "external"]
+        if external:
+            st.dataframe(pd.DataFrame(latency_summary(external, group_by=("name",))),
+                         use_container_width=True, hide_index=True)
+        else:
+            st.write("No external calls recorded.")
+
+        # Local stages: history loading, parsing, rendering, indexing
+        st.subheader("Local stages")
+        stages = [s for s in spans if s[3] == "stage"]
+        if stages:
+            st.dataframe(pd.DataFrame(latency_summary(stages, group_by=("page", "name"))),
+                         use_container_width=True, hide_index=True)
+
+    # Disk usage per user and feature, read from the storage index
+    st.subheader("Storage")
+    storage_rows = usage()
+    if storage_rows:
+        storage_df = pd.DataFrame(storage_rows, columns=["user", "feature", "files", "bytes", "media_bytes"])
+        storage_df["MB"] = storage_df.pop("bytes") / 1e6
+        storage_df["media MB"] = storage_df.pop("media_bytes") / 1e6
+        st.dataframe(storage_df, use_container_width=True, hide_index=True)
+    else:
+        st.write("Nothing indexed yet; the first maintenance pass builds the index.")
+
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("Run storage maintenance"):
+            summary = run_maintenance(auth.storage_settings())
+            if summary is None:
+                st.info("A maintenance pass is already running.")
+            else:
+                st.success(f"Removed {summary['orphans']} orphaned, {summary['expired']} expired and "
+                           f"{summary['evicted']} over-quota files ({summary['freed_bytes'] / 1e6:.1f} MB).")
+    with c2:
+        if st.button("Rebuild storage index"):
+            st.success(f"Indexed {reindex()} files.")
+
+    # cProfile capture of a single rerun of whichever page is opened next
+    st.subheader("Profile a rerun")
+    st.markdown("Arm the profiler, then open the page to profile; its next rerun is captured.")
+    if st.button("Profile next rerun"):
+        st.session_state.profile_next_rerun = True
+        st.success("The next rerun will be profiled.")
+
+    last_profile = st.session_state.get("last_profile")
+    if last_profile and last_profile["page"] != "Metrics":
+        if last_profile["report"] == PROFILE_BUSY_MESSAGE:
+            st.warning(f"{last_profile['page']} was not profiled: {PROFILE_BUSY_MESSAGE}")
+        else:
+            st.write(f"Last capture: **{last_profile['page']}**")
+            st.code(last_profile["report"], language="text")
@@ -2,8 +2,25 @@ import streamlit as st
 import requests
 import os
 import pickle
+from collections import OrderedDict
 import pandas as pd
-from datetime import datetime
+import pyarrow.compute as pc
+from datetime import datetime, timedelta
+from models.res.audio_utils import (
+    AUDIO_FORMATS, MODEL_SAMPLE_RATE, MODEL_WINDOW_SECONDS, content_hash, encode_wav, load_samples,
+    log_mel_spectrogram, sniff_audio_format, spectrogram_image, split_windows,
+)
+from models.res.history_log import append_entry, build_index, read_entries
+from models.res.prediction_store import filter_since, load_predictions, top_labels
+from models.res.instrumentation import span, timed
+from models.res.services import classify_windows, label_timeline, post_audio
+from models.res import storage
+
+# History filter choices, in days (None means no limit)
+HISTORY_PERIODS = {"All time": None, "This week": 7, "Today": 1}
+
+# Window results kept per user for re-analysis; least recently used dropped first
+WINDOW_CACHE_SIZE = 500
 
 def audio_spectrogram():
     # Check if the user is logged in
@@ -34,8 +51,10 @@ def audio_spectrogram():
 
     # Directory and history file path setup
     audio_dir = os.path.join(user_data_dir, 'audio_files')  # Folder to save audio files
-    history_file_path = os.path.join(user_data_dir, "audio_history.json")
-    pickle_file_path = os.path.join(user_data_dir, "audio_history.pkl")
+    history_log_path = os.path.join(user_data_dir, "audio_history.jsonl")
+    predictions_table_path = os.path.join(user_data_dir, "audio_predictions.arrow")
+    pickle_file_path = os.path.join(user_data_dir, "audio_history.pkl")  # Legacy history, migrated to the log
+    window_cache_path = os.path.join(user_data_dir, "window_cache.pkl")
 
     # Ensure directories exist
     if not os.path.exists(audio_dir):
@@ -45,21 +64,26 @@ def audio_spectrogram():
             st.error(f"Error creating audio directory: {e}")
             return
 
-    # Load chat history (from pickle if available)
-    if 'session_history' not in st.session_state:
-        st.session_state.session_history = []
-        if os.path.exists(pickle_file_path):
-            with open(pickle_file_path, "rb") as f:
-                st.session_state.session_history = pickle.load(f)
+    # Move the old pickled history into the append-only log once
+    if os.path.exists(pickle_file_path) and not os.path.exists(history_log_path):
+        with open(pickle_file_path, "rb") as f:
+            for entry in pickle.load(f):
+                if "audio_filename" in entry:
+                    append_entry(history_log_path, dict(entry, key=entry["audio_filename"]))
+        storage.remove(pickle_file_path)
+        storage.track(history_log_path)
+
+    # Load chat history from the log, indexed by content hash and analysis settings
+    if 'audio_analysis_index' not in st.session_state:
+        with span("history_load"):
+            st.session_state.session_history = read_entries(history_log_path)
+        st.session_state.audio_analysis_index = build_index(st.session_state.session_history, "key")
 
     # Function to query the Hugging Face model
+    @timed("ast.classify", "external")
     def query_audio_model(audio_data):
         try:
-            API_URL = st.secrets["AST_API_KEY"]
-            headers = {"Authorization": f"Bearer {st.secrets['api_key']}"}
-            response = requests.post(API_URL, headers=headers, data=audio_data)
-            response.raise_for_status()
-            return response.json()
+            return post_audio(audio_data)
         except requests.exceptions.RequestException as err:
             st.error(f"Error querying audio model: {err}")
             return None
@@ -68,33 +92,117 @@ def audio_spectrogram():
     def clear_chat_history():
         # Clear session state history
         st.session_state.session_history = []
+        st.session_state.audio_analysis_index = {}
 
-        # Remove pickle file to clear saved history
-        if os.path.exists(pickle_file_path):
-            os.remove(pickle_file_path)
+        # Remove the log and its columnar snapshot to clear saved history
+        # The clips themselves become unreferenced and are collected by storage maintenance
+        storage.remove(history_log_path, predictions_table_path)
 
         st.success("Chat history cleared!")
 
-    # Function to save audio data and predictions to pickle
-    def save_audio_data(audio_filename, predictions, confidences):
+    # Function to store audio once under its content hash
+    def store_audio(audio_bytes, digest):
+        audio_filename = f"{digest}.{AUDIO_FORMATS[sniff_audio_format(audio_bytes)]['ext']}"
+        audio_filepath = os.path.join(audio_dir, audio_filename)
+        if not os.path.exists(audio_filepath):
+            with open(audio_filepath, "wb") as f:
+                f.write(audio_bytes)
+            storage.track(audio_filepath)
+        return audio_filename
+
+    # Function to append audio data and predictions to the history log
+    def save_audio_data(key, audio_filename, predictions, confidences):
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         audio_data = {
+            "key": key,
             "audio_filename": audio_filename,
             "predictions": predictions,
             "confidences": confidences,
             "timestamp": timestamp
         }
-        # Append to session history
+        # Append to session history and the log
         st.session_state.session_history.append(audio_data)
+        st.session_state.audio_analysis_index[key] = audio_data
+        append_entry(history_log_path, audio_data)
+        storage.track(history_log_path)
 
-        # Save session history to pickle
-        with open(pickle_file_path, "wb") as f:
-            pickle.dump(st.session_state.session_history, f)
+    # Function to classify overlapping windows concurrently and aggregate them into a timeline
+    @timed("ast.classify_segments", "external")
+    def classify_segments(samples):
+        window_cache = OrderedDict()
+        if os.path.exists(window_cache_path):
+            with open(window_cache_path, "rb") as f:
+                window_cache = OrderedDict(pickle.load(f))
+
+        windows = []
+        for start, chunk in split_windows(samples, overlap=overlap):
+            payload = encode_wav(chunk)
+            windows.append((start, len(chunk) / MODEL_SAMPLE_RATE, content_hash(payload), payload))
+
+        pending = {key: payload for _, _, key, payload in windows if key not in window_cache}
+        results = {key: window_cache[key] for _, _, key, _ in windows if key in window_cache}
+        if pending:
+            new_results, errors = classify_windows(pending)
+            results.update(new_results)
+            for err in errors:
+                st.error(f"Error querying audio model: {err}")
+
+        # This clip's windows become the most recently used; the file is rewritten whole, so it stays capped
+        for _, _, key, _ in windows:
+            if key in results:
+                window_cache.pop(key, None)
+                window_cache[key] = results[key]
+        while len(window_cache) > WINDOW_CACHE_SIZE:
+            window_cache.popitem(last=False)
+        with open(window_cache_path, "wb") as f:
+            pickle.dump(window_cache, f)
+        storage.track(window_cache_path)
+
+        st.caption(f"{len(windows)} windows, {len(windows) - len(pending)} served from cache")
+
+        timeline, predictions = label_timeline([window[:3] for window in windows], results)
+        if timeline is None:
+            return None
+
+        st.write("Label timeline:")
+        st.line_chart(timeline[[p["label"] for p in predictions[:5]]])
+        return predictions
+
+    # Function to shrink audio to the 16 kHz mono windows the model consumes, then classify it
+    def classify_audio(audio_bytes):
+        if not preprocess:
+            return query_audio_model(audio_bytes)
+
+        with span("preprocess"):
+            samples = load_samples(audio_bytes, trim=trim)
+        if samples is None:
+            st.caption("Could not decode this file locally, uploading it unchanged.")
+            return query_audio_model(audio_bytes)
+
+        if show_spectrogram and len(samples):
+            st.image(spectrogram_image(log_mel_spectrogram(samples)), caption="Log-mel spectrogram (128 bands)",
+                     use_container_width=True)
+
+        window = int(MODEL_SAMPLE_RATE * MODEL_WINDOW_SECONDS)
+        if segmented and len(samples) > window:
+            return classify_segments(samples)
+
+        payload = encode_wav(samples[:window])
+        st.caption(f"Uploading {len(payload) / 1024:.0f} KB of 16 kHz mono PCM instead of {len(audio_bytes) / 1024:.0f} KB")
+        return query_audio_model(payload)
 
     # UI setup
     st.header("Audio Spectrogram Analysis 🎶", divider="rainbow")
     st.sidebar.button("Clear Chat History", on_click=clear_chat_history)
 
+    # Local preprocessing options
+    preprocess = st.sidebar.toggle("Preprocess locally (16 kHz mono)", value=True)
+    trim = st.sidebar.checkbox("Trim silence", value=True, disabled=not preprocess)
+    show_spectrogram = st.sidebar.checkbox("Show spectrogram", value=False, disabled=not preprocess)
+    segmented = st.sidebar.checkbox("Segmented analysis for long clips", value=False, disabled=not preprocess)
+    overlap = st.sidebar.slider("Window overlap", min_value=0.0, max_value=0.75, value=0.5, step=0.25,
+                                disabled=not (preprocess and segmented))
+
     # Sidebar for file upload
     st.sidebar.header("Upload Audio")
     uploaded_audio_file = st.sidebar.file_uploader("Upload an audio file (.wav, .mp3, .flac)", type=["wav", "mp3", "flac"])
@@ -103,26 +211,28 @@ def audio_spectrogram():
     st.write("Record a voice message 🎤")
     audio_value = st.audio_input("Record a voice message")
 
-    # Handle the recorded audio input
-    if audio_value:
-        st.audio(audio_value, format="audio/wav")  # Play the recorded audio
-        st.write("Analyzing recorded audio...")
+    # Function to store, classify and display a clip, reusing earlier results for identical audio
+    def analyze_audio(audio_bytes, spinner_text):
+        digest = content_hash(audio_bytes)
+        audio_filename = store_audio(audio_bytes, digest)
 
-        # Generate unique filename for the recorded audio
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        audio_filename = f"audio_{timestamp}.wav"
-        audio_filepath = os.path.join(audio_dir, audio_filename)
+        # Results depend on the preprocessing settings as well as the audio itself
+        settings = "raw" if not preprocess else f"pre-{int(trim)}-{f'seg{overlap}' if segmented else 'win'}"
+        key = f"{digest}-{settings}"
 
-        # Save the recorded audio as a file
-        with open(audio_filepath, "wb") as f:
-            f.write(audio_value.getvalue())  # Use getvalue() to retrieve bytes
+        cached = st.session_state.audio_analysis_index.get(key)
+        if cached:
+            st.caption(f"Already analysed on {cached['timestamp']}, showing the saved result.")
+            predictions, confidences = cached["predictions"], cached["confidences"]
+        else:
+            # Analyze audio using Hugging Face model
+            with st.spinner(spinner_text):
+                result = classify_audio(audio_bytes)
 
-        # Analyze audio using Hugging Face model
-        with st.spinner("Analyzing audio..."):
-            result = query_audio_model(audio_value)
+            if not result:
+                st.write("Failed to analyze audio.")
+                return
 
-        # Handle and display results
-        if result:
             if isinstance(result, list):
                 predictions = [entry.get("label") for entry in result]
                 confidences = [entry.get("score") for entry in result]
@@ -130,73 +240,44 @@ def audio_spectrogram():
                 predictions = []
                 confidences = []
 
-            # Save audio data, predictions, and confidences as pkl
-            save_audio_data(audio_filename, predictions, confidences)
+            save_audio_data(key, audio_filename, predictions, confidences)
 
-            st.write("Audio analysis result:")
-            if predictions and confidences:
-                df = pd.DataFrame({"Label": predictions, "Confidence": confidences})
-                st.table(df)
-        else:
-            st.write("Failed to analyze audio.")
+        st.write("Audio analysis result:")
+        if predictions and confidences:
+            df = pd.DataFrame({"Label": predictions, "Confidence": confidences})
+            st.table(df)
+
+    # Handle the recorded audio input
+    if audio_value:
+        st.audio(audio_value, format="audio/wav")  # Play the recorded audio
+        st.write("Analyzing recorded audio...")
+        analyze_audio(audio_value.getvalue(), "Analyzing audio...")
 
     # If file uploaded via sidebar, handle the file upload
     if uploaded_audio_file:
-        audio_data = uploaded_audio_file.read()  # Read the uploaded file as bytes
+        audio_data = uploaded_audio_file.getvalue()  # Read the uploaded file as bytes
         st.sidebar.audio(audio_data, format=uploaded_audio_file.type)
+        analyze_audio(audio_data, "Analyzing uploaded audio...")
 
-        # Generate unique filename for the uploaded audio
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        audio_filename = f"audio_{timestamp}.mp3"
-        audio_filepath = os.path.join(audio_dir, audio_filename)
-
-        # Save the uploaded audio file
-        with open(audio_filepath, "wb") as f:
-            f.write(audio_data)  # Save the uploaded audio as bytes
-
-        # Analyze audio using Hugging Face model
-        with st.spinner("Analyzing uploaded audio..."):
-            result = query_audio_model(audio_data)
-
-        # Handle and display results
-        if result:
-            if isinstance(result, list):
-                predictions = [entry.get("label") for entry in result]
-                confidences = [entry.get("score") for entry in result]
-            else:
-                predictions = []
-                confidences = []
+    # Display chat history from the columnar store, one row per (clip, label, score)
+    st.write("### Chat History")
+    with span("predictions_load"):
+        predictions_table = load_predictions(history_log_path, predictions_table_path)
+    if predictions_table.num_rows:
+        c1, c2 = st.columns(2)
+        with c1:
+            period = st.selectbox("Period", list(HISTORY_PERIODS.keys()), index=1)
+        with c2:
+            top_only = st.checkbox("Top label per clip only", value=False)
 
-            # Save audio data, predictions, and confidences as pkl
-            save_audio_data(audio_filename, predictions, confidences)
+        days = HISTORY_PERIODS[period]
+        view = filter_since(predictions_table, datetime.now() - timedelta(days=days) if days else None)
 
-            st.write("Audio analysis result:")
-            if predictions and confidences:
-                df = pd.DataFrame({"Label": predictions, "Confidence": confidences})
-                st.table(df)
-        else:
-            st.write("Failed to analyze audio.")
+        st.write(f"Top labels ({period.lower()}):")
+        labels_df = top_labels(view).to_pandas()
+        st.bar_chart(labels_df, x="label", y="clips")
 
-    # Display chat history in tabular format (if needed)
-    st.write("### Chat History")
-    if st.session_state.session_history:
-        # Convert session history to a pandas DataFrame for tabular display
-        chat_data = []
-        for message in st.session_state.session_history:
-            if "audio_filename" in message:
-                chat_data.append({
-                    "Audio Filename": message['audio_filename'],
-                    "Timestamp": message['timestamp'],
-                    "Predictions": message['predictions'],
-                    "Confidence": message['confidences']
-                })
-            else:
-                chat_data.append({
-                    "Role": message['role'],
-                    "Content": message['content'],
-                    "Output": message.get('output', 'N/A')
-                })
-        
-        # Create a DataFrame and display it as a table
-        chat_df = pd.DataFrame(chat_data)
-        st.table(chat_df)
+        if top_only:
+            view = view.filter(pc.equal(view["rank"], 0))
+        history_df = view.select(["timestamp", "audio_filename", "label", "score"]).to_pandas()
+        st.dataframe(history_df.sort_values("timestamp", ascending=False), use_container_width=True, hide_index=True)
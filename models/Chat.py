@@ -5,11 +5,14 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 import time
 from datetime import datetime
+from models.res.instrumentation import span
+from models.res.providers import google_client_kwargs
+from models.res import chat_search
 
 
 def gemini_chat():
     load_dotenv()
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"], **google_client_kwargs())
 
     current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     MODEL_ROLE = 'ai'
@@ -25,7 +28,8 @@ def gemini_chat():
     # Load past chats (if available)
     past_chats_file = os.path.join(data_dir, 'past_chats_list')
     try:
-        past_chats = joblib.load(past_chats_file)
+        with span("history_load"):
+            past_chats = joblib.load(past_chats_file)
     except FileNotFoundError:
         past_chats = {}
 
@@ -72,6 +76,7 @@ def gemini_chat():
                 if st.session_state.current_time in past_chats:
                     del past_chats[st.session_state.current_time]
                     joblib.dump(past_chats, past_chats_file)
+                chat_search.delete_chats(st.session_state.get('username'), "GeminiChat", st.session_state.current_time)
                 st_messages_file = os.path.join(data_dir, f'{st.session_state.current_time}-st_messages')
                 gemini_messages_file = os.path.join(data_dir, f'{st.session_state.current_time}-gemini_messages')
                 if os.path.exists(st_messages_file):
@@ -94,6 +99,7 @@ def gemini_chat():
                         os.remove(gemini_messages_file)
                 past_chats.clear()
                 joblib.dump(past_chats, past_chats_file)
+                chat_search.delete_chats(st.session_state.get('username'), "GeminiChat")
                 st.session_state.messages = []
                 st.session_state.gemini_history = []
                 st.session_state.current_time = None
@@ -143,10 +149,11 @@ def gemini_chat():
         )
 
         # Send message to AI
-        response = st.session_state.chat.send_message(
-            prompt,
-            stream=True,
-        )
+        with span("gemini.send_message", "external"):
+            response = st.session_state.chat.send_message(
+                prompt,
+                stream=True,
+            )
 
         # Display assistant response in chat message container
         with st.chat_message(
@@ -186,3 +193,5 @@ def gemini_chat():
             st.session_state.gemini_history,
             os.path.join(data_dir, f'{st.session_state.current_time}-gemini_messages'),
         )
+        chat_search.index_chat(st.session_state.get('username'), "GeminiChat", st.session_state.current_time,
+                               st.session_state.messages)
@@ -1,15 +1,19 @@
 import os
 import joblib
 import streamlit as st
-from typing import Generator
-from groq import Groq
 from datetime import datetime
 from dotenv import load_dotenv
-import shutil
+from models.res.instrumentation import span, timed_stream
+from models.res.services import GROQ_MODELS, groq_client
+from models.res.groq_router import fan_out, hedged_stream, ttft_stats
+from models.res import chat_search, storage
+
+# Compare mode redraws each streaming answer at most this often, so several columns stay cheap to update
+COMPARE_REDRAW_SECONDS = 0.05
 
 def chat_groq():
     load_dotenv()
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    client = groq_client()
 
     def icon(emoji: str):
         """Shows an emoji as a Notion-style page icon."""
@@ -35,18 +39,15 @@ def chat_groq():
         st.session_state.selected_model = None
 
     # Load past chats
-    past_chats = joblib.load(history_file) if os.path.exists(history_file) else {}
+    with span("history_load"):
+        past_chats = joblib.load(history_file) if os.path.exists(history_file) else {}
 
     icon("🗪")
     st.subheader("Chat App", divider="rainbow", anchor=False)
     st.markdown("**Powered by Groq**")
 
     # Define available models
-    models = {
-        "gemma-7b-it": {"name": "Gemma-7b-it", "tokens": 8192, "developer": "Google"},
-        "Gemma2-9b-it": {"name": "Gemma2-9b-it", "tokens": 8192, "developer": "Google"},
-        "mixtral-8x7b-32768": {"name": "Mixtral-8x7b-Instruct-v0.1", "tokens": 32768, "developer": "Mistral"},
-    }
+    models = GROQ_MODELS
 
     # Sidebar options for new and previous chats
     with st.sidebar:
@@ -57,25 +58,34 @@ def chat_groq():
             st.session_state.messages = []
             past_chats[st.session_state.current_time] = st.session_state.current_time
             joblib.dump(past_chats, history_file)
+            storage.track(history_file)
+            st.session_state.groq_selected_chat = st.session_state.current_time
 
         st.write("## Previous Chats")
-        selected_chat = st.selectbox("Choose a chat", list(past_chats.keys()), format_func=lambda x: past_chats[x])
+        # A chat opened from the sidebar search is preselected
+        search_hit = chat_search.take_open_chat("Chat")
+        if search_hit in past_chats:
+            st.session_state.groq_selected_chat = st.session_state.current_time = search_hit
+        selected_chat = st.selectbox("Choose a chat", list(past_chats.keys()), format_func=lambda x: past_chats[x],
+                                     key="groq_selected_chat")
 
         # Load selected chat history only if it exists
         if selected_chat:
             chat_file = os.path.join(base_chat_dir, selected_chat, "messages.pkl")
             if os.path.exists(chat_file):
-                st.session_state.messages = joblib.load(chat_file)
+                with span("chat_load"):
+                    st.session_state.messages = joblib.load(chat_file)
             else:
                 st.session_state.messages = []
 
         if st.button('Delete All Chats'):
             for chat_id in list(past_chats.keys()):
-                chat_dir = os.path.join(base_chat_dir, chat_id)
-                if os.path.exists(chat_dir):
-                    shutil.rmtree(chat_dir)
+                storage.remove_tree(os.path.join(base_chat_dir, chat_id))
             past_chats.clear()
             joblib.dump(past_chats, history_file)
+            storage.track(history_file)
+            chat_search.delete_chats(username, "Chat")
+            st.session_state.pop("groq_selected_chat", None)
             st.session_state.messages = []
             st.session_state.current_time = None
             st.rerun()
@@ -105,36 +115,144 @@ def chat_groq():
             help=f"Adjust max tokens for response. Max: {max_tokens_range}"
         )
 
+    # Ask a faster model as well when the chosen one is slow to start answering, or failing
+    hedge = st.sidebar.toggle("Fall back to a faster model when slow", value=True, key="groq_hedging",
+                              help="Hedges with another model once the first token is later than usual")
+
+    # Compare mode sends each prompt to several models at once and measures them side by side
+    compare_models = []
+    if st.sidebar.toggle("Compare models", key="groq_compare_mode",
+                         help="Send the prompt to several models concurrently and compare speed and answers"):
+        compare_models = st.sidebar.multiselect("Models to compare", list(models.keys()), default=list(models.keys()),
+                                                format_func=lambda x: models[x]["name"], key="groq_compare_models")
+    else:
+        st.session_state.pop("groq_comparison", None)
+
+    # Save the session messages only if `current_time` is set
+    def save_messages():
+        if st.session_state.current_time:
+            chat_dir = os.path.join(base_chat_dir, st.session_state.current_time)
+            os.makedirs(chat_dir, exist_ok=True)  # Ensure chat directory exists
+            with span("history_save"):
+                joblib.dump(st.session_state.messages, os.path.join(chat_dir, "messages.pkl"))
+            storage.track(os.path.join(chat_dir, "messages.pkl"))
+            chat_search.index_chat(username, "Chat", st.session_state.current_time, st.session_state.messages)
+
+    def comparison_caption(result):
+        if result["error"]:
+            return f"Failed after {result['total']:.2f}s"
+        rate = f"{result['tokens_per_second']:.0f} tok/s" if result["tokens_per_second"] else "n/a tok/s"
+        return f"TTFT {result['ttft']:.2f}s · {rate} · {result['total']:.2f}s total · {result['tokens']} tokens"
+
+    # Stream every model's answer into its own column as tokens arrive
+    def run_comparison(prompt, names):
+        results = {name: {"text": "", "chunks": 0, "ttft": None, "total": None, "tokens": None,
+                          "tokens_per_second": None, "error": None} for name in names}
+        slots = {}
+        for column, name in zip(st.columns(len(names)), names):
+            with column:
+                st.markdown(f"**{models[name]['name']}**")
+                slots[name] = (st.empty(), st.empty())
+        redrawn = {}
+
+        messages = st.session_state.messages + [{"role": "user", "content": prompt}]
+        with span("groq.compare", "external"):
+            for name, kind, payload, at in fan_out(client, names, messages, max_tokens, models):
+                result, (text_slot, caption_slot) = results[name], slots[name]
+                if kind == "token":
+                    if result["ttft"] is None:
+                        result["ttft"] = at
+                    result["text"] += payload
+                    result["chunks"] += 1
+                    if at - redrawn.get(name, 0.0) >= COMPARE_REDRAW_SECONDS:
+                        text_slot.markdown(result["text"] + "▌")
+                        redrawn[name] = at
+                    continue
+
+                result["total"] = at
+                if kind == "end":
+                    # Groq's usage counts when it reports them, streamed chunks otherwise
+                    result["tokens"] = payload or result["chunks"]
+                    if result["ttft"] is not None and at > result["ttft"]:
+                        result["tokens_per_second"] = result["tokens"] / (at - result["ttft"])
+                    text_slot.markdown(result["text"])
+                else:
+                    result["error"] = str(payload)
+                    text_slot.error(f"Error: {payload}")
+                caption_slot.caption(comparison_caption(result))
+        return results
+
+    # Keep one model's answer in the conversation
+    def keep_answer(name):
+        comparison = st.session_state.pop("groq_comparison")
+        st.session_state.messages = st.session_state.messages + [
+            {"role": "user", "content": comparison["prompt"]},
+            {"role": "assistant", "content": comparison["results"][name]["text"]},
+        ]
+        save_messages()
+
+    def show_comparison(comparison):
+        with st.chat_message("user", avatar='👨‍💻'):
+            st.markdown(comparison["prompt"])
+        results = comparison["results"]
+        for column, (name, result) in zip(st.columns(len(results)), results.items()):
+            with column:
+                st.markdown(f"**{models[name]['name']}**")
+                if result["error"]:
+                    st.error(f"Error: {result['error']}")
+                else:
+                    st.markdown(result["text"])
+                    st.button("Use this answer", key=f"groq_keep_{name}", on_click=keep_answer, args=(name,))
+                st.caption(comparison_caption(result))
+
+        # This run's numbers next to each model's recent time to first token across all chats
+        rows = []
+        for name, result in results.items():
+            samples, p50, p95 = ttft_stats(name)
+            rows.append({
+                "Model": models[name]["name"],
+                "TTFT (s)": result["ttft"],
+                "Tokens/s": result["tokens_per_second"],
+                "Total (s)": result["total"],
+                "Tokens": result["tokens"],
+                "Recent p50 TTFT (s)": p50,
+                "Recent p95 TTFT (s)": p95,
+                "Samples": samples,
+            })
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
     # Display chat history with avatars
     for message in st.session_state.messages:
         avatar = "🤖" if message["role"] == "assistant" else "👨‍💻"
         with st.chat_message(message["role"], avatar=avatar):
             st.markdown(message["content"])
 
-    # Define response generator function
-    def generate_chat_responses(chat_completion) -> Generator[str, None, None]:
-        for chunk in chat_completion:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+    prompt = st.chat_input("Enter your prompt here...")
+    if prompt and compare_models:
+        with st.chat_message("user", avatar='👨‍💻'):
+            st.markdown(prompt)
+        st.session_state.groq_comparison = {"prompt": prompt, "results": run_comparison(prompt, compare_models)}
+        st.rerun()  # Redraw as a finished comparison, with a button per answer
+    elif "groq_comparison" in st.session_state:
+        show_comparison(st.session_state.groq_comparison)
 
     # Process user input and generate response
-    if prompt := st.chat_input("Enter your prompt here..."):
+    if prompt:
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user", avatar='👨‍💻'):
             st.markdown(prompt)
 
         try:
-            chat_completion = client.chat.completions.create(
-                model=model_option,
-                messages=[{"role": m["role"], "content": m["content"]} for m in st.session_state.messages],
-                max_tokens=max_tokens,
-                stream=True
-            )
-
             # Stream and display response
             with st.chat_message("assistant", avatar="🤖"):
-                chat_responses_generator = generate_chat_responses(chat_completion)
-                full_response = st.write_stream(chat_responses_generator)
+                route = {}
+                chat_responses_generator = hedged_stream(client, model_option, st.session_state.messages, max_tokens,
+                                                         models, route, hedge)
+                full_response = st.write_stream(timed_stream(chat_responses_generator, "groq.stream"))
+                if route.get("path", "primary") != "primary":
+                    reason = "was slow to respond" if route["path"] == "hedge" else "was unavailable"
+                    st.caption(f"Answered by {models[route['model']]['name']}: "
+                               f"{models[model_option]['name']} {reason}.")
 
         except Exception as e:
             st.error(f"Error: {e}")
@@ -146,8 +264,4 @@ def chat_groq():
             combined_response = "\n".join(str(item) for item in full_response)
             st.session_state.messages.append({"role": "assistant", "content": combined_response})
 
-        # Save the session messages only if `current_time` is set
-        if st.session_state.current_time:
-            chat_dir = os.path.join(base_chat_dir, st.session_state.current_time)
-            os.makedirs(chat_dir, exist_ok=True)  # Ensure chat directory exists
-            joblib.dump(st.session_state.messages, os.path.join(chat_dir, "messages.pkl"))
+        save_messages()
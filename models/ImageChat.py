@@ -2,23 +2,17 @@ import os
 import joblib
 import streamlit as st
 from PIL import Image
-import google.generativeai as genai
 from dotenv import load_dotenv
 from datetime import datetime
+from models.res.instrumentation import span
+from models.res.providers import configure_gemini
+from models.res.services import describe_image
+from models.res import chat_search, storage
 
 
 def gemini_image_chat():
     load_dotenv()
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-    # Function to get response from the Gemini model
-    def get_gemini_response(user_input, image):
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        if user_input:
-            response = model.generate_content([user_input, image])
-        else:
-            response = model.generate_content(image)
-        return response.text
+    configure_gemini()
 
     current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     MODEL_ROLE = 'ai'
@@ -44,7 +38,8 @@ def gemini_image_chat():
     # Load past chats (if available)
     past_chats_file = os.path.join(user_data_dir, 'past_chats_list')
     try:
-        past_chats = joblib.load(past_chats_file)
+        with span("history_load"):
+            past_chats = joblib.load(past_chats_file)
     except FileNotFoundError:
         past_chats = {}
 
@@ -57,14 +52,21 @@ def gemini_image_chat():
             st.session_state.imagechat_gemini_history = []
             past_chats[st.session_state.imagechat_current_time] = st.session_state.imagechat_chat_title
             joblib.dump(past_chats, past_chats_file)
+            storage.track(past_chats_file)
+            st.session_state.imagechat_selected_chat = st.session_state.imagechat_current_time
             st.rerun()
 
         st.write('# Previous Chats 👇')
+        # A chat opened from the sidebar search is preselected
+        search_hit = chat_search.take_open_chat("ImageChat")
+        if search_hit in past_chats:
+            st.session_state.imagechat_selected_chat = search_hit
         st.session_state.imagechat_current_time = st.selectbox(
             label='Chat History',
             options=list(past_chats.keys()),
             format_func=lambda x: past_chats.get(x, 'New Chat'),
             index=0,
+            key='imagechat_selected_chat',
         )
         st.session_state.imagechat_chat_title = past_chats.get(st.session_state.imagechat_current_time, 'New Chat')
 
@@ -73,12 +75,14 @@ def gemini_image_chat():
             if st.session_state.imagechat_current_time in past_chats:
                 del past_chats[st.session_state.imagechat_current_time]
                 joblib.dump(past_chats, past_chats_file)
-            st_messages_file = os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-st_messages')
-            gemini_messages_file = os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-gemini_messages')
-            if os.path.exists(st_messages_file):
-                os.remove(st_messages_file)
-            if os.path.exists(gemini_messages_file):
-                os.remove(gemini_messages_file)
+                storage.track(past_chats_file)
+            chat_search.delete_chats(username, "ImageChat", st.session_state.imagechat_current_time)
+            st.session_state.pop('imagechat_selected_chat', None)
+            # The chat's images are no longer referenced; storage maintenance collects them
+            storage.remove(
+                os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-st_messages'),
+                os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-gemini_messages'),
+            )
             st.session_state.imagechat_messages = []
             st.session_state.imagechat_gemini_history = []
             st.session_state.imagechat_current_time = None
@@ -89,12 +93,13 @@ def gemini_image_chat():
 
     # Load chat history if available
     try:
-        st.session_state.imagechat_messages = joblib.load(
-            os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-st_messages')
-        )
-        st.session_state.imagechat_gemini_history = joblib.load(
-            os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-gemini_messages')
-        )
+        with span("chat_load"):
+            st.session_state.imagechat_messages = joblib.load(
+                os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-st_messages')
+            )
+            st.session_state.imagechat_gemini_history = joblib.load(
+                os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-gemini_messages')
+            )
     except FileNotFoundError:
         st.session_state.imagechat_messages = []
         st.session_state.imagechat_gemini_history = []
@@ -111,12 +116,14 @@ def gemini_image_chat():
     image = None
     image_path = None
     if uploaded_file:
-        image = Image.open(uploaded_file)
-        if image.format == 'WEBP':
-            image = image.convert("RGB")
-        file_extension = image.format.lower() if image.format else 'jpg'
-        image_path = os.path.join(images_dir, f'{st.session_state.imagechat_current_time}-image.{file_extension}')
-        image.save(image_path)
+        with span("image_save"):
+            image = Image.open(uploaded_file)
+            if image.format == 'WEBP':
+                image = image.convert("RGB")
+            file_extension = image.format.lower() if image.format else 'jpg'
+            image_path = os.path.join(images_dir, f'{st.session_state.imagechat_current_time}-image.{file_extension}')
+            image.save(image_path)
+            storage.track(image_path)
 
     # Display the uploaded image
     if image:
@@ -131,8 +138,8 @@ def gemini_image_chat():
             if not input_text:
                 input_text = "No prompt provided."
             else:
-                response = get_gemini_response(input_text, image)
-            response = get_gemini_response(input_text, image)
+                response = describe_image(input_text, image)
+            response = describe_image(input_text, image)
         else:
             response = "No image provided."
 
@@ -159,11 +166,17 @@ def gemini_image_chat():
             st.session_state.imagechat_gemini_history,
             os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-gemini_messages')
         )
+        storage.track(
+            os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-st_messages'),
+            os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-gemini_messages'),
+        )
+        chat_search.index_chat(username, "ImageChat", st.session_state.imagechat_current_time,
+                               st.session_state.imagechat_messages)
 
     # Generate and display response when the button is clicked
     if input_text:
         if image:
-            response = get_gemini_response(input_text, image)
+            response = describe_image(input_text, image)
         else:
             response = "No image provided."
 
@@ -190,3 +203,9 @@ def gemini_image_chat():
             st.session_state.imagechat_gemini_history,
             os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-gemini_messages')
         )
+        storage.track(
+            os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-st_messages'),
+            os.path.join(user_data_dir, f'{st.session_state.imagechat_current_time}-gemini_messages'),
+        )
+        chat_search.index_chat(username, "ImageChat", st.session_state.imagechat_current_time,
+                               st.session_state.imagechat_messages)
@@ -1,108 +1,155 @@
 import streamlit as st
-from gtts import gTTS, langs
 from io import BytesIO
 import os
-import json
-import requests
-from groq import Groq
-from typing import Generator
-from mtranslate import translate
+import pickle
+from datetime import datetime
+from models.res.audio_utils import audio_metadata, content_hash
+from models.res.instrumentation import span, timed_stream
+from models.res.services import (
+    AUDIO_PROMPT_MODEL, audio_prompt_request, generate_audio, groq_client, groq_stream, speech_languages,
+    synthesize_speech, translate_text,
+)
+from models.res import storage
 
 def text2audio():
     def text2audio_module():
         # Initialize Groq client
-        client = Groq(api_key=st.secrets["GROQ_API_KEY"])
-        model = "mixtral-8x7b-32768"
+        client = groq_client()
+        model = AUDIO_PROMPT_MODEL
 
         # Ensure directory for user data exists
         username = st.session_state.get('username', 'default_user')  # Default to 'default_user' if not set
         user_data_dir = os.path.join("DataHistory", username, "Text2Audio")
         audio_dir = os.path.join(user_data_dir, "audio")
+        history_file_path = os.path.join(user_data_dir, "history.pkl")
+        index_file_path = os.path.join(user_data_dir, "audio_index.pkl")
         os.makedirs(audio_dir, exist_ok=True)
 
-        # Initialize history list as a local variable instead of session_state
-        history = []
+        # Load previous chat history and the prompt -> clip index if they exist
+        if os.path.exists(history_file_path):
+            with span("history_load"), open(history_file_path, "rb") as f:
+                history = pickle.load(f)
+        else:
+            history = []
+
+        if os.path.exists(index_file_path):
+            with open(index_file_path, "rb") as f:
+                audio_index = pickle.load(f)
+        else:
+            audio_index = {}
+
+        def save_history():
+            with open(history_file_path, "wb") as f:
+                pickle.dump(history, f)
+            with open(index_file_path, "wb") as f:
+                pickle.dump(audio_index, f)
+            storage.track(history_file_path, index_file_path)
+
+        # Prompts are matched case and whitespace insensitively
+        def prompt_key(input_prompt):
+            return content_hash(" ".join(input_prompt.lower().split()).encode("utf-8"))
 
         # Function to query the Hugging Face model for audio generation
-        def query_meta_audio(prompt, headers):
-            API_URL = st.secrets["META_API_KEY"]
-            response = requests.post(API_URL, headers=headers, json={"inputs": prompt})
-            if response.status_code == 200:
-                return response.content, response.status_code
-            else:
-                st.write(f"Error: Received status code {response.status_code}")
-                st.write(f"Response text: {response.text}")
-                return None, response.status_code
-
-        # Function to generate audio from a prompt
+        def query_meta_audio(prompt):
+            audio_bytes, status_code, error_text = generate_audio(prompt)
+            if audio_bytes is None:
+                st.write(f"Error: Received status code {status_code}")
+                st.write(f"Response text: {error_text}")
+            return audio_bytes, status_code
+
+        # Function to show a clip from the audio directory with its metadata
+        def display_clip(clip):
+            audio_path = os.path.join(audio_dir, clip["audio"])
+            st.audio(audio_path, format=clip["mime"])
+            storage.touch(audio_path)
+            if clip.get("duration"):
+                st.caption(f"{clip['format'].upper()} · {clip['duration']:.1f}s · {clip['size'] / 1024:.0f} KB")
+            with open(audio_path, "rb") as audio_file:
+                st.download_button(label="Download Audio", data=audio_file.read(), file_name=clip["audio"],
+                                   mime=clip["mime"], key=f"download_{clip['audio']}_{len(history)}")
+
+        # Function to generate audio from a prompt, reusing a stored clip when the prompt was seen before
         def audio_generation(input_prompt):
-            api_key = st.secrets["api_key"]
-            headers = {"Authorization": f"Bearer {api_key}"}
-            audio_bytes, status_code = query_meta_audio(input_prompt, headers)
+            key = prompt_key(input_prompt)
+            clip = audio_index.get(key)
+
+            if clip and os.path.exists(os.path.join(audio_dir, clip["audio"])):
+                history.append({"role": "assistant", "content": f"Generated audio based on prompt: {input_prompt}", "audio": clip["audio"]})
+                with st.chat_message("assistant"):
+                    st.caption("Served from your audio history")
+                    display_clip(clip)
+                return
+
+            audio_bytes, status_code = query_meta_audio(input_prompt)
 
             if audio_bytes:
-                # Save audio to a local file
-                audio_filename = f"{len(history)}_{username}_{input_prompt[:10]}.wav"
+                # Name the file after its content so identical clips are stored once
+                metadata = audio_metadata(audio_bytes)
+                audio_filename = f"{content_hash(audio_bytes)}.{metadata['ext']}"
                 audio_path = os.path.join(audio_dir, audio_filename)
-                with open(audio_path, "wb") as audio_file:
-                    audio_file.write(audio_bytes)
+                if not os.path.exists(audio_path):
+                    with open(audio_path, "wb") as audio_file:
+                        audio_file.write(audio_bytes)
+                    storage.track(audio_path)
+
+                clip = {
+                    "audio": audio_filename,
+                    "prompt": input_prompt,
+                    "format": metadata["format"],
+                    "mime": metadata["mime"],
+                    "duration": metadata["duration"],
+                    "size": metadata["size"],
+                    "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                }
+                audio_index[key] = clip
 
                 # Store audio history entry
                 history.append({"role": "assistant", "content": f"Generated audio based on prompt: {input_prompt}", "audio": audio_filename})
 
                 # Display audio and download link
-                audio_stream = BytesIO(audio_bytes)
                 with st.chat_message("assistant"):
-                    st.audio(audio_stream, format="audio/wav")
-                    st.download_button(label="Download Audio", data=audio_stream, file_name=audio_filename, mime="audio/wav")
+                    display_clip(clip)
             else:
                 error_msg = "Failed to generate audio - empty response."
                 history.append({"role": "assistant", "content": error_msg})
                 with st.chat_message("assistant"):
                     st.write(error_msg)
 
-        # Template function to format the keyword prompt for Groq
-        def template(input):
-            prompt = f"Generate a very small prompt for an audio clip based on the keyword(s): {input}"
-            return prompt
-
-        # Function to process streaming responses from Groq's completion
-        def generate_chat_responses(chat_completion) -> Generator[str, None, None]:
-            for chunk in chat_completion:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-
         # Sidebar options to enter keywords and generate a descriptive prompt
         st.sidebar.markdown("Use this option to generate descriptive prompt 👇")
         if prompt := st.sidebar.chat_input("Enter keyword for audio prompt..."):
-            descriptive_prompt = template(prompt)
+            descriptive_prompt = audio_prompt_request(prompt)
             history.append({"role": "user", "content": descriptive_prompt})
 
             # Generate a descriptive prompt using Groq
             try:
-                chat_completion = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": m["role"], "content": m["content"]} for m in history],
-                    max_tokens=100,
-                    stream=True
-                )
-                chat_responses_generator = generate_chat_responses(chat_completion)
+                chat_completion = groq_stream(client, model, [{"role": "user", "content": descriptive_prompt}], 100)
+                chat_responses_generator = timed_stream(chat_completion, "groq.stream")
                 full_response = "".join(list(chat_responses_generator))
                 st.sidebar.write("Generated Prompt:", full_response)
                 history.append({"role": "assistant", "content": full_response})
             except Exception as e:
                 st.error(f"Error generating prompt with Groq: {e}")
+            save_history()
 
-        # Option to clear chat history
+        # Option to clear chat history and stored clips
         if st.sidebar.button('Clear Chat History'):
             history.clear()
+            audio_index.clear()
+            storage.remove(*(os.path.join(audio_dir, filename) for filename in os.listdir(audio_dir)))
+            save_history()
 
         # Display existing chat history
+        clips = {clip["audio"]: clip for clip in audio_index.values()}
+        shown_clips = []
         for message in history:
             with st.chat_message(message["role"]):
                 st.write(message["content"])
-                if "audio" in message:
-                    st.audio(os.path.join(audio_dir, message["audio"]), format="audio/wav")
+                if "audio" in message and os.path.exists(os.path.join(audio_dir, message["audio"])):
+                    clip = clips.get(message["audio"])
+                    st.audio(os.path.join(audio_dir, message["audio"]), format=clip["mime"] if clip else "audio/wav")
+                    shown_clips.append(os.path.join(audio_dir, message["audio"]))
+        storage.touch(*shown_clips)
 
         # Get user input and generate audio if a prompt is provided
         prompt = st.chat_input("Describe the audio you want")
@@ -112,14 +159,11 @@ def text2audio():
                 st.write(f"You: {prompt}")
             with st.spinner('Generating audio...'):
                 audio_generation(prompt)
+            save_history()
 
     def text2speech_module():
         # Load languages dynamically from the JSON file
-        languages_path = os.path.join('models', 'res', 'languages.json')
-        with open(languages_path, 'r') as file:
-            data = json.load(file)
-
-        lang_array = {item['name']: item['iso'] for item in data['languages']}
+        lang_array = speech_languages()
 
         st.header("Language Translation", divider="rainbow")
         st.markdown("Translate text to a selected language and generate speech")
@@ -131,22 +175,20 @@ def text2audio():
         if st.button("Translate & Generate Speech"):
             if input_text:
                 # Translation
-                translation = translate(input_text, lang_array[target_language])
+                translation = translate_text(input_text, lang_array[target_language])
                 st.text_area("Translated Text", translation, height=150)
 
-                # Text-to-Speech
-                if lang_array[target_language] in langs._langs:  # Check if language is supported by gTTS
-                    audio_stream = BytesIO()
-                    tts = gTTS(text=translation, lang=lang_array[target_language])
-                    tts.write_to_fp(audio_stream)
-                    audio_stream.seek(0)
+                # Text-to-Speech, when gTTS supports the language
+                speech = synthesize_speech(translation, lang_array[target_language])
+                if speech is not None:
+                    audio_stream = BytesIO(speech)
 
-                    # Display audio player
-                    st.audio(audio_stream, format="audio/wav")
+                    # gTTS always produces MP3
+                    st.audio(audio_stream, format="audio/mpeg")
 
                     # Download option
-                    st.download_button(label="Download Audio", data=audio_stream, file_name="translated_speech.wav",
-                                       mime="audio/wav")
+                    st.download_button(label="Download Audio", data=audio_stream, file_name="translated_speech.mp3",
+                                       mime="audio/mpeg")
                 else:
                     st.warning("Text-to-Speech is not supported in the selected language.")
             else:
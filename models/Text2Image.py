@@ -2,15 +2,16 @@ def gemini_text2image():
     import streamlit as st
     from PIL import Image, UnidentifiedImageError
     import io
-    import requests
-    import google.generativeai as genai
     import os
-    import json
     from datetime import datetime
     import pickle
+    from models.res.instrumentation import span
+    from models.res.providers import configure_gemini
+    from models.res.services import IMAGE_VARIANTS, generate_image, generate_image_prompt
+    from models.res import storage
 
-    # Configure the API key directly using Streamlit secrets
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+    # Configure the API key from the environment or Streamlit secrets
+    configure_gemini()
     current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     
     # Get the username from session state
@@ -24,59 +25,18 @@ def gemini_text2image():
 
     # Load previous chat history if it exists
     if os.path.exists(history_file_path):
-        with open(history_file_path, "rb") as f:
+        with span("history_load"), open(history_file_path, "rb") as f:
             history = pickle.load(f)
     else:
         history = []
 
-    # Function to query the Stability Diffusion API
-    def query_stabilitydiff(prompt, headers):
-        API_URL = st.secrets["STABLE_DIFFUSION_API_URL"]
-        response = requests.post(API_URL, headers=headers, json={"inputs": prompt})
-        return response.content, response.status_code
-
     # Function to clear chat history and images
     def clear_chat_history():
-        if os.path.exists(history_file_path):
-            os.remove(history_file_path)
-        for filename in os.listdir(images_dir):
-            file_path = os.path.join(images_dir, filename)
-            os.remove(file_path)
-
-    # Function to generate a prompt using Google's Generative AI
-    def generate_prompt(user_input, variant):
-        generation_configure = {
-            "temperature": 0.9,
-            "top_p": 1,
-            "top_k": 1,
-            "max_output_tokens": 1000,
-        }
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
-        ]
-        model = genai.GenerativeModel(
-            model_name="gemini-pro",
-            generation_config=generation_configure,
-            safety_settings=safety_settings
-        )
-        structured_prompt = f"Create an image of a {user_input} in a {variant} style. Describe lighting, mood, and color briefly."
-        response = model.generate_content(structured_prompt)
-
-        if response and response.candidates:
-            output_text = response.candidates[0].content.parts[0].text if response.candidates[0].content.parts else "No content parts found."
-            output_text = "".join([char for char in output_text if char.isprintable()])
-        else:
-            output_text = "No response generated."
-        return output_text
+        storage.remove(history_file_path, *(os.path.join(images_dir, filename) for filename in os.listdir(images_dir)))
 
     # Function to generate an image from a prompt
     def image_generation(input_prompt):
-        api_key = st.secrets["api_key"]
-        headers = {"Authorization": f"Bearer {api_key}"}
-        image_bytes, status_code = query_stabilitydiff(input_prompt, headers)
+        image_bytes, status_code = generate_image(input_prompt)
 
         try:
             image = Image.open(io.BytesIO(image_bytes))
@@ -84,6 +44,7 @@ def gemini_text2image():
             image_filename = f"{current_time}_{len(history)}.png"
             image_path = os.path.join(images_dir, image_filename)
             image.save(image_path)
+            storage.track(image_path)
 
             # Append history with image path
             history.append(
@@ -110,21 +71,26 @@ def gemini_text2image():
 
     st.sidebar.markdown("Use this option to generate descriptive prompt 👇")
     
-    # Display existing chat history
+    # Display existing chat history; images may have been removed by storage retention
+    shown_images = []
     for message in history:
         with st.chat_message(message["role"]):
             st.write(message["content"])
-            if "image" in message:
+            if "image" in message and os.path.exists(message["image"]):
                 st.image(message["image"], caption="Generated Image", use_container_width=True)
+                shown_images.append(message["image"])
+            elif "image" in message:
+                st.caption("Image removed to free up storage.")
+    storage.touch(*shown_images)
 
     # Get user input
     use_prompt_generation = st.sidebar.chat_input("Write key words")
-    variant = st.sidebar.selectbox("Select image variant", ("Realistic", "Creative", "Minimalist", "Abstract", "Photorealistic", "Vector"))
+    variant = st.sidebar.selectbox("Select image variant", IMAGE_VARIANTS)
     prompt = st.chat_input("Write your imagination")
 
     # Generate prompt and image if use_prompt_generation is provided
     if use_prompt_generation:
-        descriptive_prompt = generate_prompt(use_prompt_generation, variant)
+        descriptive_prompt = generate_image_prompt(use_prompt_generation, variant)
         history.append({"role": "user", "content": descriptive_prompt})
         with st.chat_message("user"):
             st.write(f"Generated prompt: {descriptive_prompt}")
@@ -140,5 +106,6 @@ def gemini_text2image():
             image_generation(prompt)
 
     # Save chat history to file after each message
-    with open(history_file_path, "wb") as f:
+    with span("history_save"), open(history_file_path, "wb") as f:
         pickle.dump(history, f)
+    storage.track(history_file_path)
@@ -1,11 +1,19 @@
-from qrcode.image.styledpil import StyledPilImage
-import qrcode.image.styles.colormasks as masks
-import qrcode.image.svg
+import os
+import tempfile
+from functools import lru_cache
 import streamlit as st
-import qrcode
-from models.res.utils import hex_to_rgb
+from models.res.qr_batch import MAX_BATCH_CODES, generate_zip, read_csv_rows, safe_filename
+from models.res.utils import colorize, render_mono
 from models.res.utils import setup_qrcode
 from models.res.config import mods_dict
+from models.res.instrumentation import span
+from models.res import storage
+
+
+# Previews are memoized per process, so reruns with unchanged inputs skip rendering entirely
+@lru_cache(maxsize=64)
+def preview_image(text, color, modStyle):
+    return colorize(render_mono(text, modStyle).resize((300, 300)), color)
 
 
 def QR():
@@ -65,26 +73,74 @@ def QR():
             with st.empty():
                 if st.button("I'm ready!", type='primary'):
                     resolution = st.session_state[f'resolution_{format}']
-                    setup_qrcode(text, mods_dict[format], format, color, resolution, modStyle)
+                    with span("qr_render"):
+                        setup_qrcode(text, mods_dict[format], format, color, resolution, modStyle)
 
     with c2:
-        qr = qrcode.QRCode(
-            box_size=8,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            mask_pattern=0,
-        )
-
-        qr.add_data(text)
-        qr.make(fit=True)
-
-        img = qr.make_image(
-            image_factory=StyledPilImage,
-            color_mask=masks.SolidFillColorMask(
-                back_color=(255, 255, 255),
-                front_color=hex_to_rgb(color),
-            ),
-            module_drawer=mods_dict['png'][modStyle],
-        )
-
-        img_st = img.convert("RGB").resize((300, 300))
-        st.image(img_st)
\ No newline at end of file
+        with span("preview_render"):
+            st.image(preview_image(text, color, modStyle))
+
+    # Bulk generation: one code per CSV row, using the style selected above
+    with st.expander("Bulk generation from CSV"):
+        csv_file = st.file_uploader("Upload a CSV with one row per code", type=['csv'], key='qr_batch_csv')
+
+        if csv_file:
+            rows = read_csv_rows(csv_file)
+            columns = list(rows[0].keys()) if rows else []
+
+            if not columns:
+                st.warning("The CSV file has no rows.")
+                return
+
+            b1, b2 = st.columns(2)
+            with b1:
+                text_column = st.selectbox("Column with the QR content", columns, key='qr_batch_text')
+            with b2:
+                name_column = st.selectbox("Column used for file names", columns, key='qr_batch_name')
+
+            if len(rows) > MAX_BATCH_CODES:
+                st.warning(f"The CSV has {len(rows)} rows; only the first {MAX_BATCH_CODES} are generated. "
+                           "Split larger files into several uploads.")
+                rows = rows[:MAX_BATCH_CODES]
+
+            st.write(f"{len(rows)} codes will be generated as {format.upper()} with the style selected above.")
+
+            if st.button("Generate ZIP", type='primary'):
+                w, h = st.session_state[f'resolution_{format}'].replace(" ", "").split("x")
+                used = set()
+                jobs = [
+                    (safe_filename(row[name_column] or str(i), used), row[text_column], color, modStyle, format, (int(w), int(h)))
+                    for i, row in enumerate(rows, 1) if row.get(text_column)
+                ]
+
+                if not jobs:
+                    st.warning(f"Every row is blank in the column '{text_column}', so there is nothing to generate.")
+                else:
+                    # Replace the archive from a previous batch. Archives live with the user's other files, so
+                    # storage maintenance expires the ones left behind by closed sessions.
+                    if st.session_state.get('qr_batch_zip'):
+                        storage.remove(st.session_state.qr_batch_zip)
+                    user_data_dir = os.path.join(storage.DATA_ROOT, st.session_state['username'], "QRCode")
+                    os.makedirs(user_data_dir, exist_ok=True)
+                    fd, zip_path = tempfile.mkstemp(prefix='qrcodes_', suffix='.zip', dir=user_data_dir)
+                    os.close(fd)
+                    # Relative, like every other path in the storage index
+                    zip_path = os.path.join(user_data_dir, os.path.basename(zip_path))
+
+                    progress = st.progress(0.0, text="Starting workers...")
+                    with span("qr_batch"):
+                        for done, total, rate in generate_zip(jobs, zip_path):
+                            if done % 16 == 0 or done == total:
+                                progress.progress(done / total, text=f"{done}/{total} codes · {rate:.0f} codes/s")
+                    storage.track(zip_path)
+                    st.session_state.qr_batch_zip = zip_path
+
+            if st.session_state.get('qr_batch_zip') and os.path.exists(st.session_state.qr_batch_zip):
+                with open(st.session_state.qr_batch_zip, 'rb') as archive:
+                    st.download_button(
+                        label="Download ZIP",
+                        data=archive,
+                        file_name='qrcodes.zip',
+                        mime='application/zip',
+                        type='secondary',
+                    )
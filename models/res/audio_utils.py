@@ -0,0 +1,289 @@
+import hashlib
+import io
+import struct
+import wave
+import numpy as np
+
+try:
+    # Optional: lets FLAC/MP3/OGG be decoded locally, otherwise only WAV is
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# Container formats we can recognise from the first bytes of a clip
+AUDIO_FORMATS = {
+    'wav': {'mime': 'audio/wav', 'ext': 'wav'},
+    'flac': {'mime': 'audio/flac', 'ext': 'flac'},
+    'mp3': {'mime': 'audio/mpeg', 'ext': 'mp3'},
+    'ogg': {'mime': 'audio/ogg', 'ext': 'ogg'},
+}
+
+# MPEG audio bitrate (kbps) and sample rate tables, indexed by header fields
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+# The Audio Spectrogram Transformer works on 16 kHz mono, 1024 frames of 10 ms
+MODEL_SAMPLE_RATE = 16000
+MODEL_WINDOW_SECONDS = 10.24
+
+
+def content_hash(data):
+    # Stable short digest used to name clips so identical audio is stored once
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def sniff_audio_format(data):
+    # Detect the container from its magic bytes, falling back to wav
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        return 'wav'
+    if data[:4] == b'fLaC':
+        return 'flac'
+    if data[:4] == b'OggS':
+        return 'ogg'
+    if data[:3] == b'ID3' or (len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0):
+        return 'mp3'
+    return 'wav'
+
+
+def _wav_info(data):
+    offset = 12
+    channels = sample_rate = byte_rate = None
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack('<I', data[offset + 4:offset + 8])[0]
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            channels, sample_rate, byte_rate = struct.unpack('<HII', data[body + 2:body + 12])
+        elif chunk_id == b'data' and byte_rate:
+            # Streams written before their length is known report 0 or 0xFFFFFFFF
+            size = min(chunk_size, len(data) - body) if chunk_size else len(data) - body
+            return {'duration': size / byte_rate, 'sample_rate': sample_rate, 'channels': channels}
+        offset = body + chunk_size + (chunk_size & 1)
+    return {'duration': None, 'sample_rate': sample_rate, 'channels': channels}
+
+
+def _flac_info(data):
+    # STREAMINFO is always the first metadata block: 20 bit rate, 3 bit channels, 5 bit depth, 36 bit samples
+    if len(data) < 26:
+        return {'duration': None, 'sample_rate': None, 'channels': None}
+    packed = int.from_bytes(data[18:26], 'big')
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    duration = total_samples / sample_rate if sample_rate and total_samples else None
+    return {'duration': duration, 'sample_rate': sample_rate, 'channels': channels}
+
+
+def _mp3_info(data):
+    offset = 0
+    if data[:3] == b'ID3' and len(data) >= 10:
+        # ID3v2 size is a 28 bit syncsafe integer
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + size
+    # Only scan the start of the stream for the first frame sync
+    limit = min(len(data), offset + 65536)
+    while offset + 4 <= limit:
+        if data[offset] == 0xFF and data[offset + 1] & 0xE0 == 0xE0:
+            header = int.from_bytes(data[offset:offset + 4], 'big')
+            version_bits = (header >> 19) & 0x3
+            layer_bits = (header >> 17) & 0x3
+            bitrate_index = (header >> 12) & 0xF
+            rate_index = (header >> 10) & 0x3
+            if version_bits != 1 and layer_bits and bitrate_index not in (0, 15) and rate_index != 3:
+                version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+                layer = 4 - layer_bits
+                bitrate = MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+                sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+                channels = 1 if (header >> 6) & 0x3 == 3 else 2
+                # Constant bitrate estimate, which matches gTTS and most TTS endpoints
+                duration = (len(data) - offset) * 8 / bitrate
+                return {'duration': duration, 'sample_rate': sample_rate, 'channels': channels}
+        offset += 1
+    return {'duration': None, 'sample_rate': None, 'channels': None}
+
+
+def audio_metadata(data):
+    # Format, mime type and duration of a clip, read from its headers only
+    fmt = sniff_audio_format(data)
+    if fmt == 'wav':
+        info = _wav_info(data)
+    elif fmt == 'flac':
+        info = _flac_info(data)
+    elif fmt == 'mp3':
+        info = _mp3_info(data)
+    else:
+        info = {'duration': None, 'sample_rate': None, 'channels': None}
+
+    info.update({
+        'format': fmt,
+        'mime': AUDIO_FORMATS[fmt]['mime'],
+        'ext': AUDIO_FORMATS[fmt]['ext'],
+        'size': len(data),
+    })
+    return info
+
+
+def decode_audio(data):
+    # Decode a clip to float32 samples shaped (frames, channels); None if we can't decode it locally
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        try:
+            return _decode_wav(data)
+        except (wave.Error, EOFError, ValueError):
+            pass
+    if soundfile is not None:
+        try:
+            samples, sample_rate = soundfile.read(io.BytesIO(data), dtype='float32', always_2d=True)
+            return samples, sample_rate
+        except RuntimeError:
+            return None
+    return None
+
+
+def _decode_wav(data):
+    with wave.open(io.BytesIO(data)) as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif width == 3:
+        # Pad 24 bit samples to 32 bit little endian ints
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((packed.shape[0], 4), dtype=np.uint8)
+        padded[:, 1:] = packed
+        samples = padded.view('<i4').reshape(-1).astype(np.float32) / 2147483648
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width: {width}")
+
+    return samples.reshape(-1, channels), sample_rate
+
+
+def to_mono(samples):
+    return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+
+def resample(samples, sample_rate, target_rate=MODEL_SAMPLE_RATE):
+    # Band-limited FFT resampling: dropping the bins above the new Nyquist is the anti-alias filter
+    if sample_rate == target_rate or len(samples) == 0:
+        return samples.astype(np.float32)
+    n_out = max(1, int(round(len(samples) * target_rate / sample_rate)))
+    spectrum = np.fft.rfft(samples)
+    bins = n_out // 2 + 1
+    if bins > len(spectrum):
+        spectrum = np.pad(spectrum, (0, bins - len(spectrum)))
+    out = np.fft.irfft(spectrum[:bins], n_out) * (n_out / len(samples))
+    return out.astype(np.float32)
+
+
+def trim_silence(samples, sample_rate, threshold_db=-40.0, frame_seconds=0.025):
+    # Drop leading/trailing frames quieter than threshold_db relative to the loudest frame
+    frame = max(1, int(sample_rate * frame_seconds))
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return samples
+    rms = np.sqrt(np.mean(samples[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    peak = rms.max()
+    if peak == 0:
+        return samples[:0]
+    loud = np.nonzero(20 * np.log10(np.maximum(rms, 1e-10) / peak) > threshold_db)[0]
+    return samples[loud[0] * frame:(loud[-1] + 1) * frame]
+
+
+def encode_wav(samples, sample_rate=MODEL_SAMPLE_RATE):
+    # 16 bit PCM mono WAV, the most compact lossless payload the endpoint accepts
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+    bio = io.BytesIO()
+    with wave.open(bio, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return bio.getvalue()
+
+
+def load_samples(data, trim=True):
+    # Decode, downmix, resample to 16 kHz and optionally trim silence; None if we can't decode locally
+    decoded = decode_audio(data)
+    if decoded is None:
+        return None
+    samples, sample_rate = decoded
+    samples = resample(to_mono(samples), sample_rate)
+    if trim:
+        trimmed = trim_silence(samples, MODEL_SAMPLE_RATE)
+        samples = trimmed if len(trimmed) else samples
+    return samples
+
+
+# Audio left after the last full window is covered by one more window only when it is at least this fraction
+# of a window; shorter tails are dropped rather than classified as a near-duplicate window
+MIN_TAIL_FRACTION = 0.1
+
+
+def split_windows(samples, sample_rate=MODEL_SAMPLE_RATE, window_seconds=MODEL_WINDOW_SECONDS, overlap=0.5):
+    # Yield (start_seconds, chunk) for overlapping windows covering the clip. Windows are full length: instead of a
+    # short trailing window, the last one is moved back to end with the clip. A clip shorter than a window is one
+    # short window.
+    window = int(sample_rate * window_seconds)
+    hop = max(1, int(window * (1 - overlap)))
+    last = max(0, len(samples) - window)
+    start = 0
+    while start < last:
+        yield start / sample_rate, samples[start:start + window]
+        start += hop
+    covered = start - hop + window if start else 0
+    if not start or len(samples) - covered >= window * MIN_TAIL_FRACTION:
+        yield last / sample_rate, samples[last:last + window]
+
+
+def mel_filterbank(sample_rate, n_fft, n_mels):
+    def hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    mel_points = np.linspace(hz_to_mel(0), hz_to_mel(sample_rate / 2), n_mels + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mel_points) / sample_rate).astype(int)
+    filters = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            filters[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            filters[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+    return filters
+
+
+def log_mel_spectrogram(samples, sample_rate=MODEL_SAMPLE_RATE, n_fft=400, hop=160, n_mels=128):
+    # Same framing as the AST feature extractor: 25 ms Hann windows every 10 ms, 128 mel bands
+    if len(samples) < n_fft:
+        samples = np.pad(samples, (0, n_fft - len(samples)))
+    n_frames = 1 + (len(samples) - n_fft) // hop
+    frames = np.lib.stride_tricks.sliding_window_view(samples, n_fft)[::hop][:n_frames]
+    power = np.abs(np.fft.rfft(frames * np.hanning(n_fft), axis=1)) ** 2
+    mel = power @ mel_filterbank(sample_rate, n_fft, n_mels).T
+    return np.log10(np.maximum(mel, 1e-10)).T
+
+
+def spectrogram_image(log_mel):
+    # Scale to 0-255 grayscale with low frequencies at the bottom, ready for st.image
+    floor = log_mel.max() - 8  # 80 dB dynamic range
+    scaled = (np.maximum(log_mel, floor) - floor) / max(log_mel.max() - floor, 1e-10)
+    return (scaled[::-1] * 255).astype(np.uint8)
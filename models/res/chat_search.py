@@ -0,0 +1,211 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+import streamlit as st
+from models.res.instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+# One full-text index per user, next to the histories it covers
+SEARCH_DB_NAME = ".search.db"
+MAX_RESULTS = 10
+
+# Feature (DataHistory sub-directory) -> label shown with results, and the menu page that opens its chats
+FEATURE_LABELS = {"Chat": "Groq Chat", "ImageChat": "Image Chat", "PdfChat": "PDF Chat", "GeminiChat": "Gemini Chat"}
+FEATURE_PAGES = {"Chat": "Home", "ImageChat": "Image", "PdfChat": "Pdf"}
+
+
+def _connect(user):
+    user_dir = os.path.join("DataHistory", user)
+    os.makedirs(user_dir, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(user_dir, SEARCH_DB_NAME), timeout=5)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY, feature TEXT, chat_id TEXT, position INTEGER, role TEXT, content TEXT,
+            digest TEXT
+        );
+        CREATE INDEX IF NOT EXISTS entries_chat ON entries (feature, chat_id, position);
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            content, content='entries', content_rowid='id', tokenize='porter unicode61'
+        );
+        CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts (rowid, content) VALUES (new.id, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+            INSERT INTO entries_fts (entries_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END;
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+    # Indices created before entries had digests: their rows never match one, so each chat is re-indexed once
+    if "digest" not in {row[1] for row in connection.execute("PRAGMA table_info(entries)")}:
+        connection.execute("ALTER TABLE entries ADD COLUMN digest TEXT")
+    return connection
+
+
+def _execute(user, fn):
+    # Search is a convenience: a failed index update is logged, never shown to the user
+    try:
+        connection = _connect(user)
+        try:
+            with connection:
+                return fn(connection)
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        logger.exception("Chat search index update failed for %s", user)
+        return None
+
+
+def _add_messages(connection, feature, chat_id, messages):
+    # Usually a history only grows, but a chat can also be cleared or replaced under the same id (GroqChat's model
+    # switch), so rows are kept only up to the first message whose digest differs; the rest is re-indexed
+    rows = [
+        (message.get("role") or message.get("sender"), str(message.get("content", ""))) for message in messages
+    ]
+    digests = [hashlib.sha1(f"{role}\0{content}".encode("utf-8")).hexdigest() for role, content in rows]
+    indexed = connection.execute(
+        "SELECT digest FROM entries WHERE feature = ? AND chat_id = ? ORDER BY position", (feature, chat_id)
+    ).fetchall()
+    keep = 0
+    while keep < min(len(indexed), len(digests)) and indexed[keep][0] == digests[keep]:
+        keep += 1
+    if keep < len(indexed):
+        connection.execute(
+            "DELETE FROM entries WHERE feature = ? AND chat_id = ? AND position >= ?", (feature, chat_id, keep)
+        )
+    connection.executemany(
+        "INSERT INTO entries (feature, chat_id, position, role, content, digest) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (feature, chat_id, position, role, content, digests[position])
+            for position, (role, content) in enumerate(rows[keep:], keep)
+        ],
+    )
+
+
+def index_chat(user, feature, chat_id, messages):
+    # Called whenever a chat is saved; messages are dicts with "content" and "role" (or PdfChat's "sender")
+    if user and chat_id:
+        with span("search_index"):
+            _execute(user, lambda c: _add_messages(c, feature, str(chat_id), messages))
+
+
+def delete_chats(user, feature, *chat_ids):
+    # Drop the given chats of a feature, or all of them when no ids are given
+    def delete(connection):
+        if chat_ids:
+            connection.executemany(
+                "DELETE FROM entries WHERE feature = ? AND chat_id = ?", [(feature, str(c)) for c in chat_ids]
+            )
+        else:
+            connection.execute("DELETE FROM entries WHERE feature = ?", (feature,))
+    if user:
+        _execute(user, delete)
+
+
+def _saved_chats(user):
+    # (feature, chat id, messages) for every history saved before the index existed
+    import joblib
+    import pickle
+    user_dir = os.path.join("DataHistory", user)
+
+    groq_dir = os.path.join(user_dir, "Chat")
+    if os.path.isdir(groq_dir):
+        for chat_id in os.listdir(groq_dir):
+            path = os.path.join(groq_dir, chat_id, "messages.pkl")
+            if os.path.exists(path):
+                yield "Chat", chat_id, joblib.load(path)
+
+    image_dir = os.path.join(user_dir, "ImageChat")
+    if os.path.isdir(image_dir):
+        for name in os.listdir(image_dir):
+            if name.endswith("-st_messages"):
+                yield "ImageChat", name[:-len("-st_messages")], joblib.load(os.path.join(image_dir, name))
+
+    documents_dir = os.path.join(user_dir, "PdfChat", "document")
+    if os.path.isdir(documents_dir):
+        for document_name in os.listdir(documents_dir):
+            path = os.path.join(documents_dir, document_name, "chat_history.pkl")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    yield "PdfChat", document_name, pickle.load(f)
+
+
+def backfill(user):
+    # Index the user's existing histories once; after that every save keeps the index current
+    def run(connection):
+        if connection.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone():
+            return
+        for feature, chat_id, messages in _saved_chats(user):
+            _add_messages(connection, feature, chat_id, messages)
+        connection.execute("INSERT INTO meta VALUES ('backfilled', ?)", (str(time.time()),))
+    with span("search_backfill"):
+        _execute(user, run)
+
+
+def _match_expression(query):
+    # Every word must match; the last one as a prefix so results appear while typing
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+
+
+def search(user, query, limit=MAX_RESULTS):
+    # Best matches first, as (feature, chat id, role, snippet with the matches in bold)
+    expression = _match_expression(query)
+    if not expression:
+        return []
+    connection = _connect(user)
+    try:
+        return connection.execute(
+            "SELECT e.feature, e.chat_id, e.role, snippet(entries_fts, 0, '**', '**', '…', 16) "
+            "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid "
+            "WHERE entries_fts MATCH ? ORDER BY bm25(entries_fts) LIMIT ?",
+            (expression, limit),
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def _open_chat(feature, chat_id):
+    # on_click callback: switch the menu to the feature's page and tell the page which chat to show
+    page = FEATURE_PAGES[feature]
+    st.session_state.open_chat = {"feature": feature, "chat_id": chat_id}
+    st.session_state.menu_jump = page
+    st.session_state.main_menu = page
+
+
+def take_open_chat(feature):
+    # Chat id a search result asked this feature's page to open, consumed on first read
+    target = st.session_state.get("open_chat")
+    if target and target["feature"] == feature:
+        del st.session_state["open_chat"]
+        return target["chat_id"]
+    return None
+
+
+def search_sidebar(user):
+    query = st.sidebar.text_input("🔎 Search your chats", key="chat_search_query", placeholder="Words from any chat")
+    if not query:
+        return
+
+    backfill(user)
+    start = time.perf_counter()
+    try:
+        with span("chat_search"):
+            results = search(user, query)
+    except sqlite3.OperationalError as e:
+        st.sidebar.caption(f"Search is unavailable: {e}")
+        return
+    st.sidebar.caption(f"{len(results)} result(s) in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    for i, (feature, chat_id, role, snippet) in enumerate(results):
+        with st.sidebar.container(border=True):
+            st.markdown(f"**{FEATURE_LABELS.get(feature, feature)}** · {chat_id} · _{role}_")
+            st.markdown(snippet.replace("\n", " "))
+            if feature in FEATURE_PAGES:
+                st.button("Open chat", key=f"chat_search_open_{i}", on_click=_open_chat, args=(feature, chat_id))
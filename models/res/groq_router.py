@@ -0,0 +1,212 @@
+import queue
+import threading
+import time
+from collections import deque
+from models.res.instrumentation import current_page, percentile, recent_spans, record
+
+# Time-to-first-token samples kept per model, and how many are needed before trusting their p95
+TTFT_WINDOW = 200
+MIN_SAMPLES = 20
+
+# Hedge delay while a model has too few samples, and the bounds on its p95-based delay
+DEFAULT_HEDGE_SECONDS = 2.0
+MIN_HEDGE_SECONDS = 0.3
+MAX_HEDGE_SECONDS = 10.0
+
+# Status codes worth trying another model for right away: rate limited or Groq having trouble
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# model -> recent TTFTs in seconds; seeded once per process from the persisted spans
+_ttft = {}
+_ttft_lock = threading.Lock()
+_seeded = []
+
+
+def _seed():
+    # Pick up the last day's measurements so a restart doesn't start from the default delay
+    with _ttft_lock:
+        if _seeded:
+            return
+        _seeded.append(True)
+    try:
+        spans = recent_spans(since_seconds=86400)
+    except Exception:
+        return
+    for _, _, name, _, duration in spans:
+        if name.startswith("groq.ttft."):
+            _samples(name[len("groq.ttft."):]).append(duration)
+
+
+def _samples(model):
+    with _ttft_lock:
+        return _ttft.setdefault(model, deque(maxlen=TTFT_WINDOW))
+
+
+def record_ttft(model, seconds, page=None):
+    _samples(model).append(seconds)
+    record(f"groq.ttft.{model}", seconds, "external", page)
+
+
+def ttft_stats(model):
+    # (samples, p50, p95) in seconds; the percentiles are None without samples
+    _seed()
+    with _ttft_lock:
+        samples = sorted(_ttft.get(model, ()))
+    if not samples:
+        return 0, None, None
+    return len(samples), percentile(samples, 50), percentile(samples, 95)
+
+
+def hedge_delay(model):
+    # Wait this long for the first token before asking a fallback model as well
+    count, _, p95 = ttft_stats(model)
+    if count < MIN_SAMPLES:
+        return DEFAULT_HEDGE_SECONDS
+    return min(MAX_HEDGE_SECONDS, max(MIN_HEDGE_SECONDS, p95))
+
+
+def fallback_model(model, models):
+    # The other model with the lowest median TTFT; models without measurements count as the default delay
+    def median(candidate):
+        return ttft_stats(candidate)[1] or DEFAULT_HEDGE_SECONDS
+    candidates = [m for m in models if m != model]
+    return min(candidates, key=median) if candidates else None
+
+
+def retryable(error):
+    import groq
+    if isinstance(error, groq.APIConnectionError):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def _completion_tokens(chunk):
+    # Groq reports usage on the last chunk, under x_groq in its streaming format
+    usage = chunk.usage or (chunk.x_groq.usage if chunk.x_groq else None)
+    return usage.completion_tokens if usage else None
+
+
+def _attempt(client, model, messages, max_tokens, events, cancelled, page):
+    # Runs in its own thread, reporting (model, kind, payload, perf_counter time) through events: ("token", text),
+    # ("end", completion tokens or None) or ("error", exception)
+    start = time.perf_counter()
+    first = True
+    tokens = None
+    try:
+        stream = client.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens, stream=True)
+        try:
+            for chunk in stream:
+                tokens = _completion_tokens(chunk) or tokens
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if not text:
+                    continue
+                if first:
+                    record_ttft(model, time.perf_counter() - start, page)
+                    first = False
+                if cancelled.is_set():
+                    return
+                events.put((model, "token", text, time.perf_counter()))
+        finally:
+            stream.close()
+        events.put((model, "end", tokens, time.perf_counter()))
+    except Exception as e:
+        events.put((model, "error", e, time.perf_counter()))
+
+
+def _launch(client, model, messages, max_tokens, events, page):
+    cancelled = threading.Event()
+    threading.Thread(
+        target=_attempt, name=f"groq-{model}", daemon=True,
+        args=(client, model, messages, max_tokens, events, cancelled, page),
+    ).start()
+    return cancelled
+
+
+def hedged_stream(client, model, messages, max_tokens, models, route=None, hedge=True):
+    # Stream a chat completion from `model`. When its first token is later than the model's p95 TTFT, the
+    # best fallback model is asked too and whichever answers first is streamed; the other one is dropped.
+    # Rate limits and server errors switch to the fallback right away instead of retrying the same model.
+    # `route` is filled with the model that answered, the path that won ("primary", "hedge" or "fallback")
+    # and its TTFT in seconds.
+    route = route if route is not None else {}
+    messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+    client = client.with_options(max_retries=0)  # Falling back beats the SDK's own backoff
+    events = queue.Queue()
+    attempts = {}
+    page = current_page()
+    start = time.perf_counter()
+
+    def launch(name, path):
+        cancelled = _launch(client, name, messages, min(max_tokens, models[name]["tokens"]), events, page)
+        attempts[name] = {"path": path, "cancelled": cancelled, "done": False}
+
+    launch(model, "primary")
+    fallback = fallback_model(model, models) if hedge else None
+    deadline = start + hedge_delay(model)
+
+    winner, first = None, None
+    while winner is None:
+        waiting_for_hedge = fallback is not None and fallback not in attempts
+        timeout = max(0.0, deadline - time.perf_counter()) if waiting_for_hedge else None
+        try:
+            name, kind, payload, _ = events.get(timeout=timeout)
+        except queue.Empty:
+            launch(fallback, "hedge")
+            continue
+
+        if kind == "token" or kind == "end":
+            winner, first = name, payload if kind == "token" else None
+        elif kind == "error":
+            attempts[name]["done"] = True
+            if retryable(payload) and fallback is not None and fallback not in attempts:
+                launch(fallback, "fallback")
+            elif all(attempt["done"] for attempt in attempts.values()):
+                raise payload
+
+    for name, attempt in attempts.items():
+        if name != winner:
+            attempt["cancelled"].set()
+    ttft = time.perf_counter() - start
+    route.update(model=winner, path=attempts[winner]["path"], ttft=ttft)
+    record(f"groq.route.{route['path']}", ttft, "external")
+
+    if first is None:
+        return
+    try:
+        yield first
+        while True:
+            name, kind, payload, _ = events.get()
+            if name != winner:
+                continue
+            if kind == "token":
+                yield payload
+            elif kind == "end":
+                return
+            else:
+                raise payload
+    finally:
+        attempts[winner]["cancelled"].set()  # The reader stopped early, e.g. the session reran
+
+
+def fan_out(client, model_names, messages, max_tokens, models):
+    # Ask every model at once. Yields (model, kind, payload, seconds since the start) as events arrive, with the
+    # kinds of _attempt, until every model has ended or failed. Models still running when the caller stops are
+    # dropped.
+    messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+    client = client.with_options(max_retries=0)  # A rate-limited model shows as failed rather than as slow
+    events = queue.Queue()
+    page = current_page()
+    start = time.perf_counter()
+    running = {
+        name: _launch(client, name, messages, min(max_tokens, models[name]["tokens"]), events, page)
+        for name in model_names
+    }
+    try:
+        while running:
+            name, kind, payload, at = events.get()
+            if kind != "token":
+                running.pop(name)
+            yield name, kind, payload, at - start
+    finally:
+        for cancelled in running.values():
+            cancelled.set()
@@ -0,0 +1,38 @@
+import json
+import os
+
+
+def append_entry(log_path, entry):
+    # One JSON object per line; a single small append is atomic, so concurrent writers never clobber each other
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def read_entries(log_path):
+    # Read every entry in append order
+    return read_entries_from(log_path, 0)[0]
+
+
+def read_entries_from(log_path, offset):
+    # Read the entries appended after byte offset; returns them with the offset to resume from.
+    # A torn last line left by an interrupted write is skipped and re-read next time.
+    entries = []
+    if not os.path.exists(log_path):
+        return entries, 0
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries, offset
+
+
+def build_index(entries, key):
+    # Latest entry wins, so re-appending a key acts as an update
+    return {entry[key]: entry for entry in entries if key in entry}
@@ -0,0 +1,238 @@
+import cProfile
+import functools
+import io
+import logging
+import math
+import os
+import pstats
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_DB_PATH = os.path.join("DataHistory", ".metrics.db")
+RING_BUFFER_SIZE = 5000
+RETENTION_SECONDS = 7 * 86400
+
+# Callables receiving a dict of per-rerun timings, e.g. {"page": "Home", "shell": 0.012, "page_time": 0.4}
+_rerun_hooks = []
+
+# Most recent spans in memory, and the ones not yet written to SQLite
+_spans = deque(maxlen=RING_BUFFER_SIZE)
+_pending = []
+_spans_lock = threading.Lock()
+
+# Streamlit runs each session's script in its own thread, so the current page is per thread
+_context = threading.local()
+
+# Page recorded for threads that never set one: the login screen in the app, "API" in api.py
+_default_page = {"name": "login"}
+
+# One SQLite connection per process, shared under a lock: Streamlit starts a new script thread for most reruns,
+# so per-thread connections would still be opened (and the schema re-checked) on nearly every rerun
+_db = {"path": None, "connection": None}
+_db_lock = threading.Lock()
+
+# cProfile hooks the whole interpreter, so only one capture runs at a time across all sessions
+_profile_lock = threading.Lock()
+PROFILE_BUSY_MESSAGE = "Another profile capture is already running on this server; try again in a moment."
+
+
+def register_rerun_hook(hook):
+    if hook not in _rerun_hooks:
+        _rerun_hooks.append(hook)
+
+
+def report_rerun(timings):
+    for hook in _rerun_hooks:
+        try:
+            hook(timings)
+        except Exception:
+            logger.exception("Rerun hook %r failed", hook)
+
+
+def set_current_page(page):
+    _context.page = page
+
+
+def set_default_page(page):
+    _default_page["name"] = page
+
+
+def current_page():
+    # For work handed to other threads, which should be recorded under the page that started it
+    return getattr(_context, "page", None) or _default_page["name"]
+
+
+def record(name, duration, kind="stage", page=None):
+    # kind is "stage" for local work, "external" for API calls, "page"/"shell" for whole reruns
+    span = (time.time(), page or current_page(), name, kind, duration)
+    with _spans_lock:
+        _spans.append(span)
+        _pending.append(span)
+
+
+@contextmanager
+def span(name, kind="stage"):
+    # Time the body of a with block, even when it raises (st.rerun/st.stop included)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, kind)
+
+
+def timed(name=None, kind="stage"):
+    # Decorator form of span(); defaults to the function's name
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__name__, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_stream(stream, name, kind="external"):
+    # Wrap a streaming response: records time to first chunk and total time once the stream is consumed
+    start = time.perf_counter()
+    first = True
+    try:
+        for chunk in stream:
+            if first:
+                record(f"{name}.ttft", time.perf_counter() - start, kind)
+                first = False
+            yield chunk
+    finally:
+        record(name, time.perf_counter() - start, kind)
+
+
+def _connection():
+    # Call with _db_lock held. Opened, switched to WAL and given its schema once per process, or again when the
+    # working directory (and with it METRICS_DB_PATH) changes.
+    path = os.path.abspath(METRICS_DB_PATH)
+    if _db["path"] != path:
+        if _db["connection"] is not None:
+            _db["connection"].close()
+        _db["path"] = _db["connection"] = None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS spans (ts REAL, page TEXT, name TEXT, kind TEXT, duration REAL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS spans_ts ON spans (ts)")
+        _db["path"], _db["connection"] = path, connection
+    return _db["connection"]
+
+
+def _reset_connection():
+    # After an error the connection may be unusable (database file removed, disk full); open a fresh one next time
+    if _db["connection"] is not None:
+        _db["connection"].close()
+    _db["path"] = _db["connection"] = None
+
+
+def flush():
+    # Write pending spans to SQLite in one transaction; called once per rerun
+    with _spans_lock:
+        batch = list(_pending)
+        _pending.clear()
+    if not batch:
+        return
+    with _db_lock:
+        try:
+            with _connection() as connection:
+                connection.executemany("INSERT INTO spans VALUES (?, ?, ?, ?, ?)", batch)
+                connection.execute("DELETE FROM spans WHERE ts < ?", (time.time() - RETENTION_SECONDS,))
+        except sqlite3.Error:
+            logger.exception("Could not persist %d spans", len(batch))
+            _reset_connection()
+
+
+def recent_spans(since_seconds=None):
+    # Spans from SQLite (falling back to the in-memory ring buffer) as (ts, page, name, kind, duration)
+    since = time.time() - since_seconds if since_seconds else 0
+    with _db_lock:
+        try:
+            return _connection().execute(
+                "SELECT ts, page, name, kind, duration FROM spans WHERE ts >= ? ORDER BY ts", (since,)
+            ).fetchall()
+        except sqlite3.Error:
+            _reset_connection()
+    with _spans_lock:
+        return [span for span in _spans if span[0] >= since]
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list: the smallest value with at least q% of values at or below it
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(spans, group_by=("page", "name")):
+    # Count and p50/p95/p99 in milliseconds per group
+    columns = {"page": 1, "name": 2, "kind": 3}
+    groups = {}
+    for span_row in spans:
+        groups.setdefault(tuple(span_row[columns[c]] for c in group_by), []).append(span_row[4])
+
+    rows = []
+    for key, durations in groups.items():
+        durations.sort()
+        row = dict(zip(group_by, key))
+        row.update({
+            "count": len(durations),
+            "p50_ms": percentile(durations, 50) * 1000,
+            "p95_ms": percentile(durations, 95) * 1000,
+            "p99_ms": percentile(durations, 99) * 1000,
+        })
+        rows.append(row)
+    return sorted(rows, key=lambda r: r["p95_ms"], reverse=True)
+
+
+@contextmanager
+def profile(enabled, limit=40):
+    # Opt-in cProfile capture; the report (top functions by cumulative time) is appended to the yielded list.
+    # While another session's capture runs the body runs unprofiled and the report says so.
+    report = []
+    if not enabled:
+        yield report
+        return
+    if not _profile_lock.acquire(blocking=False):
+        report.append(PROFILE_BUSY_MESSAGE)
+        yield report
+        return
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+            report.append(out.getvalue())
+    finally:
+        _profile_lock.release()
+
+
+def _log_rerun(timings):
+    logger.debug(
+        "Rerun of %s: shell %.1f ms, page %.1f ms",
+        timings.get("page") or "login", timings["shell"] * 1000, timings.get("page_time", 0.0) * 1000,
+    )
+
+
+def _record_rerun(timings):
+    record("shell", timings["shell"], "shell", page=timings.get("page"))
+    if "page_time" in timings:
+        record("page", timings["page_time"], "page", page=timings.get("page"))
+    flush()
+
+
+register_rerun_hook(_log_rerun)
+register_rerun_hook(_record_rerun)
@@ -0,0 +1,77 @@
+import threading
+from itertools import repeat
+from langchain_core.embeddings import Embeddings
+
+# sentence-transformers on the CPU, for PDF indices embedded on this machine instead of through the Gemini API.
+# Imported only when such an index is built or searched, since it pulls in torch.
+
+# Chunks encoded per forward pass
+BATCH_SIZE = 64
+
+# With more than one process, corpora at least this large are spread over them; below it, starting the processes
+# and loading the model in each costs more than it saves
+MULTI_PROCESS_MIN_TEXTS = 2000
+
+# Pieces of the corpus handed to each encoding process, so an unlucky piece of long chunks doesn't hold up the end
+PIECES_PER_PROCESS = 4
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_model(model_name, quantize=False):
+    # One copy per process and configuration, shared by every session
+    with _models_lock:
+        key = (model_name, quantize)
+        if key not in _models:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name, device="cpu")
+            if quantize:
+                # Dynamic int8 quantization of the linear layers: faster on CPU and a quarter of their weight
+                # memory, for a small loss in accuracy
+                import torch
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            _models[key] = model
+        return _models[key]
+
+
+def _encode(model, texts):
+    return model.encode(texts, batch_size=BATCH_SIZE, normalize_embeddings=True, convert_to_numpy=True)
+
+
+def _encode_in_worker(model_name, quantize, texts):
+    # Each process loads (and quantizes) its own copy: quantized models can't be pickled over to it
+    import torch
+    torch.set_num_threads(1)  # The processes are the parallelism
+    return _encode(load_model(model_name, quantize), texts)
+
+
+class LocalEmbeddings(Embeddings):
+    # Vectors are normalised to unit length, so FAISS's L2 distance ranks chunks by cosine similarity.
+    # One process by default: inside the web server every session shares the CPU, and a pool per upload (each
+    # with its own model copy) would starve the others. Deployments with cores to spare can raise it for large
+    # ingests with config.yaml's pdf.local_embedding_processes (bounded in services.pdf_embeddings); the
+    # embedding benchmark passes its own count.
+
+    def __init__(self, model_name, quantize=False, processes=1):
+        self.model_name = model_name
+        self.quantize = quantize
+        self.processes = max(1, processes)
+
+    def embed_documents(self, texts):
+        if self.processes > 1 and len(texts) >= MULTI_PROCESS_MIN_TEXTS:
+            import multiprocessing
+            import numpy as np
+            from concurrent.futures import ProcessPoolExecutor
+            size = max(BATCH_SIZE, -(-len(texts) // (self.processes * PIECES_PER_PROCESS)))
+            pieces = [texts[i:i + size] for i in range(0, len(texts), size)]
+            with ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+                vectors = np.concatenate(list(
+                    pool.map(_encode_in_worker, repeat(self.model_name), repeat(self.quantize), pieces)
+                ))
+        else:
+            vectors = _encode(load_model(self.model_name, self.quantize), texts)
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
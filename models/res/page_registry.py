@@ -0,0 +1,42 @@
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Menu label -> (module, entry point). Page modules pull in langchain, FAISS, Gemini, pandas, gTTS...,
+# so each is imported only the first time its page is selected.
+PAGES = {
+    "Home": ("models.GroqChat", "chat_groq"),
+    "Image": ("models.ImageChat", "gemini_image_chat"),
+    "Pdf": ("models.PdfChat", "gemini_pdf_chat"),
+    "Text 👉 Image": ("models.Text2Image", "gemini_text2image"),
+    "Text 👉 Audio": ("models.Text2Audio", "text2audio"),
+    "Audio Spectrogram": ("models.AudioSpectrogram", "audio_spectrogram"),
+    "QR Generator": ("models.qr_generator", "QR"),
+}
+
+# Pages only shown to users listed in security.admin_users
+ADMIN_PAGES = {
+    "Metrics": ("models.AdminMetrics", "admin_metrics"),
+}
+
+# Module name -> seconds its first import took in this process
+_import_timings = {}
+
+
+def load_page(label):
+    # Import the page's module on demand and return its entry point
+    module_name, entry_point = PAGES.get(label) or ADMIN_PAGES[label]
+    if module_name not in _import_timings:
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        _import_timings[module_name] = time.perf_counter() - start
+        logger.info("Imported %s in %.1f ms", module_name, _import_timings[module_name] * 1000)
+    else:
+        module = importlib.import_module(module_name)
+    return getattr(module, entry_point)
+
+
+def import_timings():
+    return dict(_import_timings)
@@ -0,0 +1,181 @@
+import heapq
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Every processed PDF document keeps its own FAISS index (a shard) in its directory under
+# DataHistory/<user>/PdfChat/document/, in langchain's FAISS.save_local layout: index.faiss holds the vectors,
+# index.pkl the chunks, plus index.json saying how they were built. A question is embedded once, every shard is
+# searched in parallel and the nearest chunks are merged; a shard's chunks are only unpickled when one of them
+# is among the results.
+#
+# Each save is a new build in its own subdirectory, and the CURRENT file names the live one. Switching CURRENT is
+# a single atomic replace, so a search always reads the vectors and the chunks of the same build. Shards saved
+# before builds existed keep their files in the shard directory itself.
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+META_FILE = "index.json"
+POINTER_FILE = "CURRENT"
+
+# Builds kept per shard: the live one and the one before, which searches that started before the switch may
+# still be reading
+KEEP_BUILDS = 2
+
+# Shards searched at once; faiss releases the GIL while it searches
+MAX_SEARCH_WORKERS = 8
+
+# Open shards kept per process, least recently used dropped first, so a user with hundreds of documents
+# never has all of them in memory
+MAX_OPEN_INDICES = 64
+MAX_OPEN_DOCSTORES = 16
+
+_cache_lock = threading.Lock()
+_indices = OrderedDict()
+_docstores = OrderedDict()
+_metas = OrderedDict()
+
+
+def build_dir(index_dir):
+    # Directory holding the shard's live build
+    try:
+        with open(os.path.join(index_dir, POINTER_FILE)) as f:
+            return os.path.join(index_dir, f.read().strip())
+    except FileNotFoundError:
+        return index_dir
+
+
+def exists(index_dir):
+    return os.path.exists(os.path.join(build_dir(index_dir), INDEX_FILE))
+
+
+def save(vector_store, index_dir, meta=None):
+    # Written as a new build, then made live by replacing CURRENT. Returns the paths written.
+    build = f"build-{time.time_ns()}-{os.getpid()}-{threading.get_ident()}"
+    tmp_dir = os.path.join(index_dir, f".{build}.tmp")
+    vector_store.save_local(tmp_dir)
+    with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+        json.dump(dict(meta or {}, dimension=vector_store.index.d, chunks=vector_store.index.ntotal), f)
+    os.rename(tmp_dir, os.path.join(index_dir, build))
+
+    pointer_tmp = os.path.join(index_dir, f".{build}.{POINTER_FILE}")
+    with open(pointer_tmp, "w") as f:
+        f.write(build)
+    os.replace(pointer_tmp, os.path.join(index_dir, POINTER_FILE))
+    return [os.path.join(index_dir, build, name) for name in (INDEX_FILE, DOCSTORE_FILE, META_FILE)] + [
+        os.path.join(index_dir, POINTER_FILE)
+    ]
+
+
+def prune(index_dir):
+    # Delete all but the newest KEEP_BUILDS builds, files of the pre-build layout counting as the oldest build.
+    # Returns the paths removed.
+    builds = sorted(name for name in os.listdir(index_dir) if name.startswith("build-"))
+    if os.path.exists(os.path.join(index_dir, INDEX_FILE)):
+        builds.insert(0, "")
+    removed = []
+    for build in builds[:-KEEP_BUILDS]:
+        for name in (INDEX_FILE, DOCSTORE_FILE, META_FILE):
+            path = os.path.join(index_dir, build, name)
+            if os.path.exists(path):
+                os.remove(path)
+                removed.append(path)
+        if build:
+            shutil.rmtree(os.path.join(index_dir, build), ignore_errors=True)
+    return removed
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_meta(index_dir):
+    # What save() recorded with the shard; empty for shards saved before there was anything to record
+    path = os.path.join(build_dir(index_dir), META_FILE)
+    if not os.path.exists(path):
+        return {}
+    return _cached(_metas, MAX_OPEN_INDICES, path, _read_json)
+
+
+def _cached(cache, limit, path, load):
+    # Keyed by path and checked against the file's mtime, so a re-processed document is read again
+    mtime = os.path.getmtime(path)
+    with _cache_lock:
+        entry = cache.get(path)
+        if entry and entry[0] == mtime:
+            cache.move_to_end(path)
+            return entry[1]
+    value = load(path)
+    with _cache_lock:
+        cache[path] = (mtime, value)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+    return value
+
+
+def _read_index(path):
+    import faiss
+    # Memory-mapped where the faiss build supports it for flat indices (IO_FLAG_MMAP_IFC, faiss 1.8 and later):
+    # the OS pages vectors in as they are searched and can drop them again. Older builds read them into memory.
+    flags = faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(path, flags)
+
+
+def _read_docstore(path):
+    # (docstore, index position -> docstore id), as FAISS.save_local pickles them
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _search_shard(shard_dir, vector, k):
+    # (distance, position) of the k nearest vectors of one build; a shard that can't be read is left out
+    try:
+        index = _cached(_indices, MAX_OPEN_INDICES, os.path.join(shard_dir, INDEX_FILE), _read_index)
+        distances, positions = index.search(vector, k)
+    except FileNotFoundError:  # The build was pruned after two more saves during this search
+        return []
+    except Exception:
+        logger.exception("Searching %s failed", shard_dir)
+        return []
+    return [(float(d), int(p)) for d, p in zip(distances[0], positions[0]) if p != -1]
+
+
+def search(shards, vector, k=4):
+    # The k chunks nearest to the query vector across {document name: index dir}, as (Document, distance)
+    # pairs, nearest first. Each chunk's metadata gains the name of its document.
+    import numpy as np
+    vector = np.asarray([vector], dtype="float32")
+    names = list(shards)
+    if not names:
+        return []
+    # Resolved once, so a shard's vectors and chunks come from the same build even if it is re-saved meanwhile
+    builds = {name: build_dir(shards[name]) for name in names}
+    with ThreadPoolExecutor(max_workers=min(MAX_SEARCH_WORKERS, len(names))) as pool:
+        hits = pool.map(lambda name: _search_shard(builds[name], vector, k), names)
+        nearest = heapq.nsmallest(k, (
+            (distance, name, position) for name, shard_hits in zip(names, hits) for distance, position in shard_hits
+        ))
+
+    results = []
+    for distance, name, position in nearest:
+        try:
+            docstore, index_to_docstore_id = _cached(
+                _docstores, MAX_OPEN_DOCSTORES, os.path.join(builds[name], DOCSTORE_FILE), _read_docstore
+            )
+        except FileNotFoundError:  # The build was pruned after two more saves during this search
+            continue
+        doc = docstore.search(index_to_docstore_id.get(position))
+        if isinstance(doc, str):  # Unknown id
+            continue
+        results.append((type(doc)(page_content=doc.page_content, metadata={**doc.metadata, "document": name}),
+                        distance))
+    return results
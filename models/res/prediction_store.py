@@ -0,0 +1,88 @@
+import os
+import threading
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.compute as pc
+from models.res.history_log import read_entries_from
+from models.res.storage import track
+
+# One row per (clip, label, score); rank 0 is the clip's top label
+SCHEMA = pa.schema([
+    ("key", pa.string()),
+    ("audio_filename", pa.string()),
+    ("timestamp", pa.timestamp("s")),
+    ("rank", pa.int16()),
+    ("label", pa.string()),
+    ("score", pa.float32()),
+])
+OFFSET_KEY = b"log_offset"
+
+
+def entries_to_table(entries):
+    columns = {name: [] for name in SCHEMA.names}
+    for entry in entries:
+        timestamp = datetime.strptime(entry["timestamp"], "%Y-%m-%d %H:%M:%S")
+        for rank, (label, score) in enumerate(zip(entry.get("predictions", []), entry.get("confidences", []))):
+            columns["key"].append(entry.get("key"))
+            columns["audio_filename"].append(entry["audio_filename"])
+            columns["timestamp"].append(timestamp)
+            columns["rank"].append(rank)
+            columns["label"].append(label)
+            columns["score"].append(score)
+    return pa.table(columns, schema=SCHEMA)
+
+
+def _write_snapshot(table, table_path, log_offset):
+    # Write to a temp file and swap it in, so readers never see a half written snapshot
+    table = table.replace_schema_metadata({OFFSET_KEY: str(log_offset).encode()})
+    # Unique per thread as well as per process: sessions run in threads of the same server
+    tmp_path = f"{table_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, table_path)
+    track(table_path)
+
+
+def load_predictions(log_path, table_path):
+    # Memory-map the Arrow IPC snapshot and fold in whatever was appended to the log since it was written
+    table, offset = None, 0
+    if os.path.exists(table_path):
+        with pa.memory_map(table_path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        offset = int((table.schema.metadata or {}).get(OFFSET_KEY, b"0"))
+
+    log_size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+    if table is not None and offset == log_size:
+        return table
+    if table is None or offset > log_size:
+        # Missing snapshot, or the log was cleared since: rebuild from the start
+        table, offset = entries_to_table([]), 0
+
+    entries, offset = read_entries_from(log_path, offset)
+    table = pa.concat_tables([table.replace_schema_metadata(None), entries_to_table(entries)])
+    _write_snapshot(table, table_path, offset)
+    return table
+
+
+def filter_since(table, since):
+    if since is None:
+        return table
+    return table.filter(pc.greater_equal(table["timestamp"], pa.scalar(since, pa.timestamp("s"))))
+
+
+def top_labels(table, limit=10):
+    # Labels ranked by how many clips had them as the top prediction. Clips are counted by audio file, which is
+    # named after the content hash: analysis keys also encode the preprocessing settings, so one clip analysed
+    # two ways would count twice.
+    top = table.filter(pc.equal(table["rank"], 0))
+    stats = top.group_by("label").aggregate(
+        [("audio_filename", "count_distinct"), ("score", "mean"), ("score", "max")]
+    )
+    stats = pa.table({
+        "label": stats["label"],
+        "clips": stats["audio_filename_count_distinct"],
+        "mean_score": stats["score_mean"],
+        "max_score": stats["score_max"],
+    })
+    return stats.sort_by([("clips", "descending"), ("mean_score", "descending")]).slice(0, limit)
@@ -0,0 +1,48 @@
+import os
+
+
+class MissingSecret(KeyError):
+    pass
+
+
+# API keys and endpoints: the environment (including .env) first, then .streamlit/secrets.toml, so the pages
+# and the headless API (api.py) share one set of credentials. Raises MissingSecret when neither has it.
+def secret(name):
+    value = os.getenv(name)
+    if value:
+        return value
+    import streamlit as st
+    try:
+        value = st.secrets.get(name)
+    except FileNotFoundError:  # No secrets.toml at all
+        value = None
+    if not value:
+        raise MissingSecret(f"{name} is not configured")
+    return value
+
+
+# Optional endpoint override for the Gemini SDK and the langchain wrappers, e.g. to point the app at a
+# local stand-in (benchmarks/load_test.py). Groq reads GROQ_BASE_URL on its own.
+def google_client_kwargs():
+    endpoint = os.getenv("GOOGLE_API_ENDPOINT")
+    if not endpoint:
+        return {}
+    return {"transport": "rest", "client_options": {"api_endpoint": endpoint}}
+
+
+def configure_gemini():
+    import google.generativeai as genai
+    genai.configure(api_key=secret("GOOGLE_API_KEY"), **google_client_kwargs())
+
+
+def gemini_embeddings(model):
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    kwargs = google_client_kwargs()
+    api_key = secret("GOOGLE_API_KEY")
+    embeddings = GoogleGenerativeAIEmbeddings(model=model, google_api_key=api_key, **kwargs)
+    if kwargs:
+        # langchain-google-genai 1.x accepts `transport` for embeddings but still dials gRPC, so rebuild the client.
+        # Private module: only imported when an endpoint override is actually configured.
+        from langchain_google_genai._genai_extension import build_generative_service
+        embeddings.client = build_generative_service(api_key=api_key, **kwargs)
+    return embeddings
@@ -0,0 +1,74 @@
+import csv
+import io
+import multiprocessing
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from models.res.config import mods_dict
+from models.res.utils import build_qr, image_to_bytes, render_png, svg_factory, svg_to_bytes
+
+# Codes handed to a worker per round trip; large enough to amortise pickling, small enough for smooth progress
+BATCH_CHUNKSIZE = 32
+
+# Most codes one upload may generate in the app; larger CSVs are cut off with a warning
+MAX_BATCH_CODES = 2000
+
+
+def read_csv_rows(uploaded_file):
+    # Rows of the uploaded CSV as dicts keyed by header
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+    try:
+        return list(csv.DictReader(text))
+    finally:
+        text.detach()  # Leave the uploaded file open for Streamlit
+
+
+def safe_filename(name, used):
+    # File system friendly, unique name inside the archive
+    base = re.sub(r'[^\w.-]+', '_', name).strip('._') or 'qrcode'
+    candidate, n = base, 1
+    while candidate in used:
+        n += 1
+        candidate = f'{base}_{n}'
+    used.add(candidate)
+    return candidate
+
+
+def render_job(job):
+    # Runs in a worker process: render one code and return its archive name and bytes
+    name, text, color, modStyle, format, size = job
+    if format == 'png':
+        data = image_to_bytes(render_png(text, color, modStyle, size))
+    else:
+        img = build_qr(text).make_image(
+            image_factory=svg_factory(color),
+            module_drawer=mods_dict['svg'][modStyle],
+        )
+        data = svg_to_bytes(img)
+    return f'{name}.{format}', data
+
+
+def generate_zip(jobs, zip_path, workers=1):
+    # Render jobs and write each result into the archive as it arrives.
+    # Yields (done, total, codes_per_second) so the caller can report progress.
+    # One worker renders in the calling thread: inside the web server every session shares the CPU, and forking
+    # the multi-threaded server per click would multiply it. Batch tools pass more workers, which are spawned
+    # rather than forked.
+    total = len(jobs)
+    start = time.perf_counter()
+    # PNG is already deflate compressed; SVG text compresses well
+    compression = zipfile.ZIP_STORED if jobs and jobs[0][4] == 'png' else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(zip_path, 'w', compression=compression) as archive:
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            results = pool.map(render_job, jobs, chunksize=BATCH_CHUNKSIZE)
+        else:
+            pool, results = None, map(render_job, jobs)
+        try:
+            for done, (filename, data) in enumerate(results, 1):
+                archive.writestr(filename, data)
+                yield done, total, done / max(time.perf_counter() - start, 1e-9)
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
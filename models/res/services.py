@@ -0,0 +1,417 @@
+import asyncio
+import json
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from models.res.instrumentation import span, timed
+from models.res.providers import gemini_embeddings, google_client_kwargs, secret
+from models.res import chat_search, pdf_index, storage
+
+# Provider calls and history handling shared by the Streamlit pages and the headless API (api.py).
+# Nothing here calls st.*: the caller decides how results and errors are shown.
+# Gemini functions expect providers.configure_gemini() to have been called.
+
+
+# Groq chat
+
+GROQ_MODELS = {
+    "gemma-7b-it": {"name": "Gemma-7b-it", "tokens": 8192, "developer": "Google"},
+    "Gemma2-9b-it": {"name": "Gemma2-9b-it", "tokens": 8192, "developer": "Google"},
+    "mixtral-8x7b-32768": {"name": "Mixtral-8x7b-Instruct-v0.1", "tokens": 32768, "developer": "Mistral"},
+}
+DEFAULT_GROQ_MODEL = "mixtral-8x7b-32768"
+
+
+def groq_client():
+    from groq import Groq
+    with span("client_init"):
+        return Groq(api_key=secret("GROQ_API_KEY"))
+
+
+def groq_stream(client, model, messages, max_tokens):
+    # Text deltas of a streamed completion; messages are dicts with "role" and "content"
+    with span("groq.create", "external"):
+        chat_completion = client.chat.completions.create(
+            model=model,
+            messages=[{"role": m["role"], "content": m["content"]} for m in messages],
+            max_tokens=max_tokens,
+            stream=True,
+        )
+    for chunk in chat_completion:
+        if chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+# PDF chat
+
+# A document's index directory, next to its PDFs and chat history
+PDF_INDEX_DIR = "faiss_index"
+
+# Embedding backends a document can be processed with. Chunks and questions must be embedded by the same
+# model for their distances to mean anything, so the backend is saved with each index. The local model reads
+# 256 tokens per chunk, hence its smaller chunks.
+PDF_EMBEDDING_BACKENDS = {
+    "gemini": {"label": "Gemini text-embedding-004 (API)", "model": "models/text-embedding-004",
+               "chunk_size": 10000, "remote": True},
+    "local": {"label": "all-MiniLM-L6-v2 (local CPU)", "model": "sentence-transformers/all-MiniLM-L6-v2",
+              "chunk_size": 1000, "remote": False},
+    "local-int8": {"label": "all-MiniLM-L6-v2, int8 quantized (local CPU)",
+                   "model": "sentence-transformers/all-MiniLM-L6-v2", "chunk_size": 1000, "remote": False,
+                   "quantize": True},
+}
+DEFAULT_PDF_EMBEDDING = "gemini"
+
+# Chunks put into the prompt for each question
+PDF_SEARCH_K = 4
+
+# Most processes a local backend encodes one ingest with, whatever config.yaml's pdf.local_embedding_processes
+# asks for; each holds a copy of the model, and only documents of local_embeddings.MULTI_PROCESS_MIN_TEXTS
+# chunks or more use them
+MAX_LOCAL_EMBEDDING_PROCESSES = 4
+
+# Chat id of the history of questions asked across all documents; no document name starts with "."
+PDF_ALL_DOCUMENTS = ".all_documents"
+
+PDF_PROMPT_TEMPLATE = """
+        Answer the question as detailed as possible from the provided context, make sure to provide all the details, don't provide the wrong answer\n\n
+        Context:\n {context}?\n
+        Question: \n{question}\n
+
+        Answer:
+        """
+
+
+@timed("pdf_extract")
+def get_pdf_text(pdf_docs):
+    from PyPDF2 import PdfReader
+    text = ""
+    for pdf in pdf_docs:
+        pdf_reader = PdfReader(pdf)
+        for page in pdf_reader.pages:
+            text += page.extract_text()
+    return text
+
+
+@timed("chunking")
+def get_text_chunks(text, chunk_size=10000):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_size // 10)
+    return text_splitter.split_text(text)
+
+
+def ensure_event_loop():
+    # The langchain Gemini clients look up an asyncio loop, and Streamlit's and the API's worker threads have none
+    try:
+        return asyncio.get_event_loop()
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        return loop
+
+
+def pdf_chunks(files, backend=DEFAULT_PDF_EMBEDDING):
+    # Chunks of (file name, file object) pairs sized for the embedding backend, with metadata naming the file
+    # each chunk came from
+    text_chunks, metadatas = [], []
+    for name, pdf in files:
+        chunks = get_text_chunks(get_pdf_text([pdf]), PDF_EMBEDDING_BACKENDS[backend]["chunk_size"])
+        text_chunks += chunks
+        metadatas += [{"source": name}] * len(chunks)
+    return text_chunks, metadatas
+
+
+def pdf_embeddings(backend, processes=1):
+    # processes only applies to local backends; each process loads its own copy of the model, hence the cap
+    config = PDF_EMBEDDING_BACKENDS[backend]
+    if config["remote"]:
+        ensure_event_loop()
+        return gemini_embeddings(config["model"])
+    from models.res.local_embeddings import LocalEmbeddings
+    processes = max(1, min(processes, MAX_LOCAL_EMBEDDING_PROCESSES, os.cpu_count() or 1))
+    return LocalEmbeddings(config["model"], quantize=config.get("quantize", False), processes=processes)
+
+
+def _embedding_span(backend, name):
+    # Spans keep the names they had when Gemini was the only backend
+    if PDF_EMBEDDING_BACKENDS[backend]["remote"]:
+        return span(f"gemini.{name}", "external")
+    return span(f"{backend}.{name}")
+
+
+def build_pdf_index(text_chunks, index_dir, metadatas=None, backend=DEFAULT_PDF_EMBEDDING, processes=1):
+    from langchain_community.vectorstores import FAISS
+    with _embedding_span(backend, "embed_and_index"):
+        vector_store = FAISS.from_texts(text_chunks, embedding=pdf_embeddings(backend, processes),
+                                        metadatas=metadatas)
+    storage.track(*pdf_index.save(vector_store, index_dir, {"backend": backend}))
+    storage.forget(*pdf_index.prune(index_dir))
+
+
+def search_pdf_index(question, shards, k=PDF_SEARCH_K):
+    # The chunks most similar to the question across {document name: index dir}, nearest first, or None when
+    # none of the documents has been processed yet
+    shards = {name: index_dir for name, index_dir in shards.items() if pdf_index.exists(index_dir)}
+    if not shards:
+        return None
+
+    # The question is embedded once per backend in use; indices from before backends were saved used Gemini
+    by_backend = {}
+    for name, index_dir in shards.items():
+        backend = pdf_index.read_meta(index_dir).get("backend", DEFAULT_PDF_EMBEDDING)
+        by_backend.setdefault(backend, {})[name] = index_dir
+
+    ranked = []
+    for backend, group in by_backend.items():
+        with _embedding_span(backend, "embed_query"):
+            vector = pdf_embeddings(backend).embed_query(question)
+        with span("faiss_search"):
+            hits = pdf_index.search(group, vector, k)
+        ranked += [(rank, distance, doc) for rank, (doc, distance) in enumerate(hits)]
+    # Distances of different models can't be compared, so their results are interleaved by rank
+    ranked.sort(key=lambda hit: hit[:2])
+    return [doc for _, _, doc in ranked[:k]]
+
+
+def pdf_sources(docs, excerpt_chars=300):
+    # What to show for the retrieved chunks before the answer arrives; indices built before chunks carried
+    # their file name have no source
+    return [
+        {"document": doc.metadata.get("document"), "source": doc.metadata.get("source"),
+         "excerpt": " ".join(doc.page_content[:excerpt_chars].split())}
+        for doc in docs
+    ]
+
+
+def stream_pdf_answer(question, docs):
+    # Text chunks of the answer as Gemini produces them. The retrieved chunks are "stuffed" into the prompt
+    # the same way langchain's stuff QA chain does, which has no way to stream its output.
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    ensure_event_loop()
+    model = ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0.3, google_api_key=secret("GOOGLE_API_KEY"),
+                                   **google_client_kwargs())
+    context = "\n\n".join(doc.page_content for doc in docs)
+    for chunk in model.stream(PDF_PROMPT_TEMPLATE.format(context=context, question=question)):
+        if chunk.content:
+            yield chunk.content
+
+
+def pdf_documents_dir(username):
+    return os.path.join("DataHistory", username, "PdfChat", "document")
+
+
+def pdf_document_dir(username, document_name):
+    return os.path.join(pdf_documents_dir(username), document_name)
+
+
+def pdf_index_dir(username, document_name):
+    return os.path.join(pdf_document_dir(username, document_name), PDF_INDEX_DIR)
+
+
+def pdf_document_indices(username):
+    # {document name: index dir} for every processed document of the user
+    documents_dir = pdf_documents_dir(username)
+    if not os.path.isdir(documents_dir):
+        return {}
+    return {
+        name: pdf_index_dir(username, name) for name in sorted(os.listdir(documents_dir))
+        if not name.startswith(".") and pdf_index.exists(pdf_index_dir(username, name))
+    }
+
+
+def save_pdf_uploads(username, document_name, files):
+    # files are (file name, bytes) pairs, stored next to the document's chat history
+    document_dir = pdf_document_dir(username, document_name)
+    os.makedirs(document_dir, exist_ok=True)
+    for name, data in files:
+        file_path = os.path.join(document_dir, name)
+        with open(file_path, "wb") as f:
+            f.write(data)
+        storage.track(file_path)
+
+
+@timed("history_load")
+def load_pdf_history(username, document_name):
+    history_file = os.path.join(pdf_document_dir(username, document_name), "chat_history.pkl")
+    if os.path.exists(history_file):
+        with open(history_file, "rb") as f:
+            return pickle.load(f)
+    return []
+
+
+@timed("history_save")
+def save_pdf_history(username, document_name, chat_history):
+    document_dir = pdf_document_dir(username, document_name)
+    os.makedirs(document_dir, exist_ok=True)
+    history_file = os.path.join(document_dir, "chat_history.pkl")
+    with open(history_file, "wb") as f:
+        pickle.dump(chat_history, f)
+    storage.track(history_file)
+    chat_search.index_chat(username, "PdfChat", document_name, chat_history)
+
+
+# Image chat
+
+IMAGE_CHAT_MODEL = "gemini-1.5-flash"
+
+
+def _image_request(prompt, image):
+    return [prompt, image] if prompt else image
+
+
+@timed("gemini.generate_content", "external")
+def describe_image(prompt, image):
+    import google.generativeai as genai
+    return genai.GenerativeModel(IMAGE_CHAT_MODEL).generate_content(_image_request(prompt, image)).text
+
+
+def describe_image_stream(prompt, image):
+    # Text chunks of the description as Gemini produces them
+    import google.generativeai as genai
+    with span("gemini.generate_content", "external"):
+        response = genai.GenerativeModel(IMAGE_CHAT_MODEL).generate_content(_image_request(prompt, image), stream=True)
+    for chunk in response:
+        if chunk.parts:
+            yield chunk.text
+
+
+# Text to image
+
+IMAGE_VARIANTS = ("Realistic", "Creative", "Minimalist", "Abstract", "Photorealistic", "Vector")
+
+
+@timed("gemini.generate_prompt", "external")
+def generate_image_prompt(user_input, variant):
+    # Descriptive prompt for keywords in the given style
+    import google.generativeai as genai
+    generation_configure = {
+        "temperature": 0.9,
+        "top_p": 1,
+        "top_k": 1,
+        "max_output_tokens": 1000,
+    }
+    safety_settings = [
+        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"}
+    ]
+    model = genai.GenerativeModel(
+        model_name="gemini-pro",
+        generation_config=generation_configure,
+        safety_settings=safety_settings
+    )
+    structured_prompt = f"Create an image of a {user_input} in a {variant} style. Describe lighting, mood, and color briefly."
+    response = model.generate_content(structured_prompt)
+
+    if response and response.candidates:
+        output_text = response.candidates[0].content.parts[0].text if response.candidates[0].content.parts else "No content parts found."
+        output_text = "".join([char for char in output_text if char.isprintable()])
+    else:
+        output_text = "No response generated."
+    return output_text
+
+
+@timed("stable_diffusion.generate", "external")
+def generate_image(prompt):
+    # (response body, status code); the body is the image when the status is 200
+    import requests
+    headers = {"Authorization": f"Bearer {secret('api_key')}"}
+    response = requests.post(secret("STABLE_DIFFUSION_API_URL"), headers=headers, json={"inputs": prompt})
+    return response.content, response.status_code
+
+
+# Text to audio, translation and speech
+
+AUDIO_PROMPT_MODEL = "mixtral-8x7b-32768"
+
+
+def audio_prompt_request(keywords):
+    return f"Generate a very small prompt for an audio clip based on the keyword(s): {keywords}"
+
+
+@timed("meta_audio.generate", "external")
+def generate_audio(prompt):
+    # (audio bytes or None, status code, response text)
+    import requests
+    headers = {"Authorization": f"Bearer {secret('api_key')}"}
+    response = requests.post(secret("META_API_KEY"), headers=headers, json={"inputs": prompt})
+    if response.status_code == 200:
+        return response.content, response.status_code, ""
+    return None, response.status_code, response.text
+
+
+@lru_cache(maxsize=1)
+def speech_languages():
+    # Language name -> ISO code
+    with open(os.path.join(os.path.dirname(__file__), "languages.json")) as f:
+        data = json.load(f)
+    return {item["name"]: item["iso"] for item in data["languages"]}
+
+
+def translate_text(text, iso):
+    from mtranslate import translate
+    with span("mtranslate.translate", "external"):
+        return translate(text, iso)
+
+
+def synthesize_speech(text, iso):
+    # MP3 bytes, or None when gTTS has no voice for the language
+    from gtts import gTTS, langs
+    if iso not in langs._langs:
+        return None
+    audio_stream = BytesIO()
+    with span("gtts.synthesize", "external"):
+        gTTS(text=text, lang=iso).write_to_fp(audio_stream)
+    return audio_stream.getvalue()
+
+
+# Audio classification
+
+# Upper bound on concurrent requests to the AST endpoint per analysis
+MAX_WINDOW_WORKERS = 4
+
+
+def post_audio(payload):
+    # One request to the Audio Spectrogram Transformer endpoint; raises requests' exceptions.
+    # Safe to call from worker threads.
+    import requests
+    headers = {"Authorization": f"Bearer {secret('api_key')}"}
+    response = requests.post(secret("AST_API_KEY"), headers=headers, data=payload)
+    response.raise_for_status()
+    return response.json()
+
+
+def classify_windows(payloads):
+    # Classify {key: WAV bytes} concurrently; returns ({key: model output}, [errors])
+    import requests
+    results, errors = {}, []
+    with ThreadPoolExecutor(max_workers=MAX_WINDOW_WORKERS) as pool:
+        futures = {key: pool.submit(post_audio, payload) for key, payload in payloads.items()}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except requests.exceptions.RequestException as err:
+                errors.append(err)
+    return results, errors
+
+
+def label_timeline(windows, results):
+    # One row per window, one column per label, keyed by the window centre in seconds, plus the labels ranked
+    # by mean score. windows are (start seconds, length in seconds, key); returns (None, []) when no window
+    # was classified.
+    import pandas as pd
+    rows = {}
+    for start, seconds, key in windows:
+        result = results.get(key)
+        if isinstance(result, list):
+            centre = round(start + seconds / 2, 2)
+            rows[centre] = {entry.get("label"): entry.get("score") for entry in result}
+    if not rows:
+        return None, []
+
+    timeline = pd.DataFrame.from_dict(rows, orient="index").fillna(0.0).sort_index()
+    timeline.index.name = "Seconds"
+    summary = timeline.mean().sort_values(ascending=False)
+    return timeline, [{"label": label, "score": float(score)} for label, score in summary.items()]
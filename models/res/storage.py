@@ -0,0 +1,336 @@
+import logging
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+from models.res.history_log import read_entries
+
+try:
+    import fcntl
+except ImportError:  # Windows: maintenance is only serialised within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DATA_ROOT = "DataHistory"
+STORAGE_DB_PATH = os.path.join(DATA_ROOT, ".storage.db")
+MAINTENANCE_LOCK_PATH = os.path.join(DATA_ROOT, ".storage.lock")
+
+# Uploaded and generated files; retention and quotas only ever evict these, never chat histories
+MEDIA_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".wav", ".mp3", ".flac", ".ogg", ".pdf", ".zip"}
+
+# Opening a file refreshes its last-access time at most this often, so reruns rarely write
+TOUCH_RESOLUTION_SECONDS = 3600
+
+# Files written this recently are never treated as orphans: a page may save media before the history
+# that points at it
+ORPHAN_GRACE_SECONDS = 3600
+
+# feature directory -> callable(feature_dir, tracked paths) returning the tracked paths nothing references
+_orphan_finders = {}
+
+_maintenance_lock = threading.Lock()
+_maintenance_thread = None
+
+# One SQLite connection per process, shared under a lock, as in instrumentation.py: pages track and touch files
+# several times per rerun, and reconnecting re-ran the PRAGMA and schema statements every time
+_db = {"path": None, "connection": None}
+_db_lock = threading.Lock()
+
+
+def _connection():
+    # Call with _db_lock held. Opened with its schema once per process, or again when the working directory
+    # (and with it STORAGE_DB_PATH) changes.
+    path = os.path.abspath(STORAGE_DB_PATH)
+    if _db["path"] != path:
+        _reset_connection()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, user TEXT, feature TEXT, media INTEGER, "
+            "size INTEGER, mtime REAL, atime REAL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS files_user ON files (user, feature)")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        _db["path"], _db["connection"] = path, connection
+    return _db["connection"]
+
+
+def _reset_connection():
+    # After an error the connection may be unusable (database file removed, disk full); open a fresh one next time
+    if _db["connection"] is not None:
+        _db["connection"].close()
+    _db["path"] = _db["connection"] = None
+
+
+def _execute(fn):
+    # Accounting must never break a page: log SQLite errors and carry on
+    with _db_lock:
+        try:
+            with _connection() as connection:
+                return fn(connection)
+        except sqlite3.Error:
+            logger.exception("Storage index update failed")
+            _reset_connection()
+            return None
+
+
+def _owner(path):
+    # DataHistory/<user>/<feature>/... -> (user, feature)
+    parts = os.path.relpath(path, DATA_ROOT).split(os.sep)
+    return parts[0], parts[1] if len(parts) > 2 else ""
+
+
+def _row(path, accessed=None):
+    # accessed defaults to what the file system knows, for files found by reindex()
+    stat = os.stat(path)
+    user, feature = _owner(path)
+    media = os.path.splitext(path)[1].lower() in MEDIA_EXTENSIONS
+    accessed = accessed or max(stat.st_atime, stat.st_mtime)
+    return os.path.normpath(path), user, feature, int(media), stat.st_size, stat.st_mtime, accessed
+
+
+def _managed(path):
+    return not os.path.relpath(path, DATA_ROOT).startswith(os.pardir)
+
+
+def track(*paths):
+    # Record (or refresh) files just written under DataHistory; anything outside it is ignored
+    now = time.time()
+    rows = [_row(path, now) for path in paths if _managed(path) and os.path.isfile(path)]
+    if rows:
+        _execute(lambda c: c.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows))
+
+
+def touch(*paths):
+    # Mark files as used, for least-recently-used eviction
+    now = time.time()
+    rows = [(now, os.path.normpath(path), now - TOUCH_RESOLUTION_SECONDS) for path in paths]
+    if rows:
+        _execute(lambda c: c.executemany("UPDATE files SET atime = ? WHERE path = ? AND atime < ?", rows))
+
+
+def forget(*paths):
+    rows = [(os.path.normpath(path),) for path in paths]
+    if rows:
+        _execute(lambda c: c.executemany("DELETE FROM files WHERE path = ?", rows))
+
+
+def remove(*paths):
+    # Delete files and their index entries
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    forget(*paths)
+
+
+def _prefix_range(directory):
+    # Paths below a directory, as an index-friendly range instead of a LIKE pattern
+    prefix = os.path.normpath(directory) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def remove_tree(directory):
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    _execute(lambda c: c.execute("DELETE FROM files WHERE path >= ? AND path < ?", _prefix_range(directory)))
+
+
+def usage(user=None):
+    # (user, feature, files, bytes, media bytes) from the index, without touching the directory tree
+    query = "SELECT user, feature, COUNT(*), SUM(size), SUM(media * size) FROM files"
+    args = ()
+    if user is not None:
+        query, args = query + " WHERE user = ?", (user,)
+    return _execute(lambda c: c.execute(query + " GROUP BY user, feature ORDER BY SUM(size) DESC", args).fetchall()) or []
+
+
+def reindex():
+    # One full walk of DataHistory to rebuild the index; maintenance does this once, then writes keep it current
+    now = time.time()
+    rows = []
+    for root, dirs, files in os.walk(DATA_ROOT):
+        if root == DATA_ROOT:
+            files = []  # Index and lock files of the app itself
+        for name in files:
+            try:
+                rows.append(_row(os.path.join(root, name)))
+            except OSError:
+                continue
+
+    def replace(connection):
+        connection.execute("DELETE FROM files")
+        connection.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('indexed_at', ?)", (str(now),))
+    _execute(replace)
+    return len(rows)
+
+
+def orphan_finder(feature):
+    def register(fn):
+        _orphan_finders[feature] = fn
+        return fn
+    return register
+
+
+def _load_pickle(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+@orphan_finder("Chat")
+def _groq_chat_orphans(feature_dir, paths):
+    # GroqChat keeps one directory per chat, listed in past_chats.pkl
+    history_file = os.path.join(feature_dir, "past_chats.pkl")
+    if not os.path.exists(history_file):
+        return []
+    chats = set(_load_pickle(history_file, {}))
+    return [p for p in paths if p != history_file and os.path.relpath(p, feature_dir).split(os.sep)[0] not in chats]
+
+
+@orphan_finder("ImageChat")
+def _image_chat_orphans(feature_dir, paths):
+    # Uploaded images are named "<chat id>-image.<ext>" and belong to a chat in past_chats_list
+    chats = set(_load_pickle(os.path.join(feature_dir, "past_chats_list"), {}))
+    images_dir = os.path.join(feature_dir, "images")
+    return [
+        p for p in paths
+        if os.path.dirname(p) == images_dir and os.path.basename(p).rsplit("-image.", 1)[0] not in chats
+    ]
+
+
+@orphan_finder("Text2Image")
+def _text2image_orphans(feature_dir, paths):
+    history = _load_pickle(os.path.join(feature_dir, "history.pkl"), [])
+    referenced = {os.path.normpath(m["image"]) for m in history if "image" in m}
+    images_dir = os.path.join(feature_dir, "images")
+    return [p for p in paths if os.path.dirname(p) == images_dir and p not in referenced]
+
+
+@orphan_finder("Text2Audio")
+def _text2audio_orphans(feature_dir, paths):
+    history = _load_pickle(os.path.join(feature_dir, "history.pkl"), [])
+    audio_index = _load_pickle(os.path.join(feature_dir, "audio_index.pkl"), {})
+    referenced = {m["audio"] for m in history if "audio" in m} | {clip["audio"] for clip in audio_index.values()}
+    audio_dir = os.path.join(feature_dir, "audio")
+    return [p for p in paths if os.path.dirname(p) == audio_dir and os.path.basename(p) not in referenced]
+
+
+@orphan_finder("AudioSpectrogram")
+def _audio_spectrogram_orphans(feature_dir, paths):
+    referenced = {entry.get("audio_filename") for entry in read_entries(os.path.join(feature_dir, "audio_history.jsonl"))}
+    audio_dir = os.path.join(feature_dir, "audio_files")
+    return [p for p in paths if os.path.dirname(p) == audio_dir and os.path.basename(p) not in referenced]
+
+
+def _evict_lru(rows, limit_bytes):
+    # Oldest-accessed media first until the group fits its quota; rows are (path, media, size, atime)
+    total = sum(row[2] for row in rows)
+    evicted = []
+    for path, media, size, _ in sorted((r for r in rows if r[1]), key=lambda r: r[3]):
+        if total <= limit_bytes:
+            break
+        evicted.append(path)
+        total -= size
+    return evicted
+
+
+def run_maintenance(settings):
+    # One pass of orphan collection, retention and quota enforcement. Returns a summary, or None when
+    # another process is already running a pass.
+    os.makedirs(DATA_ROOT, exist_ok=True)
+    with open(MAINTENANCE_LOCK_PATH, "a") as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+
+        if not _execute(lambda c: c.execute("SELECT value FROM meta WHERE key = 'indexed_at'").fetchone()):
+            reindex()
+
+        rows = _execute(lambda c: c.execute("SELECT path, user, feature, media, size, atime FROM files").fetchall()) or []
+        missing = [row[0] for row in rows if not os.path.exists(row[0])]
+        forget(*missing)
+        missing = set(missing)
+
+        groups = {}
+        for path, user, feature, media, size, atime in rows:
+            if path not in missing:
+                groups.setdefault((user, feature), []).append((path, media, size, atime))
+
+        summary = {"orphans": 0, "expired": 0, "evicted": 0, "freed_bytes": 0}
+        sizes = {row[0]: row[4] for row in rows}
+
+        def delete(paths, reason):
+            paths = [p for p in paths if p in sizes]
+            remove(*paths)
+            for path in paths:
+                summary[reason] += 1
+                summary["freed_bytes"] += sizes.pop(path)
+                # Drop directories left empty below the feature directory, e.g. a GroqChat chat
+                parent = os.path.dirname(path)
+                while len(os.path.relpath(parent, DATA_ROOT).split(os.sep)) > 2 and not os.listdir(parent):
+                    os.rmdir(parent)
+                    parent = os.path.dirname(parent)
+
+        # Media and chat files nothing points at any more
+        settled = time.time() - ORPHAN_GRACE_SECONDS
+        for (user, feature), group in groups.items():
+            finder = _orphan_finders.get(feature)
+            if finder:
+                try:
+                    candidates = [row[0] for row in group if row[3] < settled]
+                    delete(finder(os.path.join(DATA_ROOT, user, feature), candidates), "orphans")
+                except Exception:
+                    logger.exception("Orphan scan of %s/%s failed", user, feature)
+
+        # Media nobody has opened within the retention period
+        retention_days = settings.get("media_retention_days") or 0
+        if retention_days > 0:
+            cutoff = time.time() - retention_days * 86400
+            delete([row[0] for group in groups.values() for row in group if row[1] and row[3] < cutoff], "expired")
+
+        # Per-feature, then per-user quotas, evicting least recently used media
+        feature_quotas = settings.get("feature_quota_mb") or {}
+        user_quota = settings.get("user_quota_mb") or 0
+        users = {}
+        for (user, feature), group in groups.items():
+            group = [row for row in group if row[0] in sizes]
+            if feature in feature_quotas:
+                delete(_evict_lru(group, feature_quotas[feature] * 1024 * 1024), "evicted")
+            users.setdefault(user, []).extend(row for row in group if row[0] in sizes)
+        if user_quota > 0:
+            for group in users.values():
+                delete(_evict_lru(group, user_quota * 1024 * 1024), "evicted")
+
+        logger.info("Storage maintenance: %s", summary)
+        return summary
+
+
+def start_maintenance(settings_fn):
+    # Background thread running run_maintenance every `maintenance_interval_seconds`; started once per process.
+    # settings_fn is read on every pass so config.yaml changes apply without a restart.
+    global _maintenance_thread
+    with _maintenance_lock:
+        if _maintenance_thread is not None:
+            return
+
+        def loop():
+            delay = min(60, settings_fn()["maintenance_interval_seconds"])
+            while True:
+                time.sleep(delay)
+                settings = settings_fn()
+                delay = settings["maintenance_interval_seconds"]
+                try:
+                    run_maintenance(settings)
+                except Exception:
+                    logger.exception("Storage maintenance failed")
+
+        _maintenance_thread = threading.Thread(target=loop, name="storage-maintenance", daemon=True)
+        _maintenance_thread.start()
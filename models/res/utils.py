@@ -1,11 +1,17 @@
 from io import BytesIO
+from functools import lru_cache
 import streamlit as st
 import qrcode
+import numpy as np
+from PIL import Image, ImageOps
 from qrcode.image.styledpil import StyledPilImage
-import qrcode.image.styles.colormasks as masks
+import qrcode.image.styles.moduledrawers.pil as mods
 import qrcode.image.svg as svg
 from models.res.config import mods_dict
 
+# Supersampling factor used to anti-alias module stamps, like qrcode's own drawers
+STAMP_SUPERSAMPLE = 4
+
 def hex_to_rgb(hex):
     hex = hex.lstrip('#')
     return tuple(int(hex[i:i + 2], 16) for i in (0, 2, 4))
@@ -16,38 +22,113 @@ def image_to_bytes(img):
     img.save(bio, format='PNG')
     return bio.getvalue()
 
-def setup_qrcode(text, dict_format, format, color, resolution, modStyle):
-    # Construct the QR Code according to the parameters selected by user
-    # Setting box size to 36 minium value defined empirically to make the qr image be slightly above the maximum resolution of 1024 x 1024
 
+@lru_cache(maxsize=32)
+def render_mono(text, modStyle, box_size=8):
+    # Black on white render: StyledPilImage skips its per-pixel color mask for these colors
+    img = build_qr(text, box_size).make_image(
+        image_factory=StyledPilImage,
+        module_drawer=mods_dict['png'][modStyle],
+    )
+    return img.convert("L")
+
+
+def colorize(gray, color):
+    # Palette swap through a 256 entry lookup table: black modules take the color, white stays white
+    return ImageOps.colorize(gray, black=hex_to_rgb(color), white=(255, 255, 255))
+
+
+def build_qr(text, box_size=36):
     qr = qrcode.QRCode(
-        box_size=36,
+        box_size=box_size,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
         mask_pattern=0,
         border=4,
     )
-
     qr.add_data(text)
     qr.make(fit=True)
+    return qr
+
+
+@lru_cache(maxsize=32)
+def module_matrix(text):
+    # Dark/light modules including the 4 module quiet zone
+    matrix = np.array(build_qr(text).get_matrix(), dtype=bool)
+    matrix.flags.writeable = False  # Shared between callers through the cache
+    return matrix
+
+
+@lru_cache(maxsize=64)
+def module_stamp(modStyle, box_size):
+    # Coverage (0..1) of a single dark module, for drawers that don't depend on neighbouring modules.
+    # Returns None for drawers that do (rounded corners, joined bars).
+    drawer = mods_dict['png'][modStyle]
+    if isinstance(drawer, mods.SquareModuleDrawer):
+        return np.ones((box_size, box_size), dtype=np.float32)
+
+    n = box_size * STAMP_SUPERSAMPLE
+    centers = (np.arange(n) + 0.5) / n
+    y, x = np.meshgrid(centers, centers, indexing='ij')
+    if isinstance(drawer, mods.GappedSquareModuleDrawer):
+        margin = (1 - drawer.size_ratio) / 2
+        fine = (x >= margin) & (x <= 1 - margin) & (y >= margin) & (y <= 1 - margin)
+    elif isinstance(drawer, mods.CircleModuleDrawer):
+        fine = (x - 0.5) ** 2 + (y - 0.5) ** 2 <= 0.25
+    else:
+        return None
+    return fine.reshape(box_size, STAMP_SUPERSAMPLE, box_size, STAMP_SUPERSAMPLE).mean(axis=(1, 3)).astype(np.float32)
+
+
+def render_png(text, color, modStyle, size):
+    # Render straight at the target resolution: the largest integer box size that fits, centred on white
+    w, h = size
+    matrix = module_matrix(text)
+    box_size = max(1, min(w, h) // matrix.shape[0])
+
+    stamp = module_stamp(modStyle, box_size)
+    if stamp is not None:
+        gray = (255 * (1 - np.kron(matrix, stamp))).astype(np.uint8)
+    else:
+        gray = np.asarray(render_mono(text, modStyle, box_size))
+
+    if gray.shape[0] > h or gray.shape[1] > w:
+        # More modules than pixels: nothing better than nearest neighbour is possible
+        return colorize(Image.fromarray(gray, 'L').resize((w, h), Image.NEAREST), color)
+
+    canvas = np.full((h, w), 255, dtype=np.uint8)
+    top, left = (h - gray.shape[0]) // 2, (w - gray.shape[1]) // 2
+    canvas[top:top + gray.shape[0], left:left + gray.shape[1]] = gray
+    return colorize(Image.fromarray(canvas, 'L'), color)
+
+
+@lru_cache(maxsize=32)
+def svg_factory(color):
+    # SvgPathFillImage with the path fill baked in, so the color is set at build time
+    return type(
+        'ColoredSvgPathFillImage',
+        (svg.SvgPathFillImage,),
+        {'QR_PATH_STYLE': {**svg.SvgPathFillImage.QR_PATH_STYLE, 'fill': color}},
+    )
 
-    if format == 'png':
 
-        img_final = qr.make_image(
-            image_factory=StyledPilImage,
-            color_mask=masks.SolidFillColorMask(
-                back_color=(255, 255, 255),
-                front_color=hex_to_rgb(color),
-            ),
-            module_drawer=mods_dict[format][modStyle],
-        )
+def svg_to_bytes(img):
+    bio = BytesIO()
+    img.save(bio)
+    return bio.getvalue()
+
+
+def setup_qrcode(text, dict_format, format, color, resolution, modStyle):
+    # Construct the QR Code according to the parameters selected by user
+
+    if format == 'png':
 
         w, h = resolution.replace(" ", "").split("x")
-        img_final = img_final.resize((int(w), int(h)))
+        img_final = render_png(text, color, modStyle, (int(w), int(h)))
 
     elif format == 'svg':
 
-        img_final = qr.make_image(
-            image_factory=svg.SvgPathFillImage,
+        img_final = build_qr(text).make_image(
+            image_factory=svg_factory(color),
             module_drawer=dict_format[modStyle],
         )
 
@@ -70,19 +151,10 @@ def download_image(img, format, color, filename):
 
     elif format == 'svg':
 
-        img.save(filename)
-
-        with open(filename, "r") as qr_img:
-            content = qr_img.read()
-
-        content = content.replace("#000000", color)
-
-        with open(filename, "w+") as qr_img:
-            qr_img.write(content)
-            st.download_button(
-                label="Download",
-                data=content,
-                file_name=filename,
-                mime='image/svg+xml',
-                type='secondary',
-            )
\ No newline at end of file
+        st.download_button(
+            label="Download",
+            data=svg_to_bytes(img),
+            file_name=filename,
+            mime='image/svg+xml',
+            type='secondary',
+        )